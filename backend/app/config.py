@@ -64,6 +64,28 @@ class Settings(BaseSettings):
     # Cache
     redis_url: str = Field(default="redis://localhost:6379")
 
+    # Background sweepers (order auto-completion, pending point release)
+    scheduler_enabled: bool = Field(default=True)
+    scheduler_poll_seconds: float = Field(default=30.0)
+    scheduler_lease_seconds: int = Field(default=60)
+    scheduler_batch_size: int = Field(default=100)
+
+    # Admin dashboard analytics cache (get_admin_platform_analytics RPC)
+    admin_analytics_cache_seconds: int = Field(default=60)
+
+    # Public homepage counters (get_public_stat_counters RPC)
+    public_stats_cache_seconds: int = Field(default=30)
+
+    # Background PDF order reports
+    report_cache_dir: str = Field(default="/tmp/loyalcup-reports")
+    report_workers: int = Field(default=2)
+    report_cache_max_files: int = Field(default=200)
+    report_job_ttl_seconds: int = Field(default=3600)
+
+    # First page of shop reviews (get_shop_reviews_page RPC)
+    reviews_cache_seconds: int = Field(default=60)
+    reviews_cache_max_entries: int = Field(default=1000)
+
     @field_validator("cors_origins", mode="before")
     @classmethod
     def parse_cors_origins(cls, v):
@@ -14,6 +14,8 @@ from app.config import settings
 from app.middleware.rate_limit import limiter, rate_limit_handler
 from app.utils.logging import setup_logging, get_logger
 from app.database import get_supabase
+from app.services.report_service import report_service
+from app.services.scheduler import get_scheduler, start_scheduler, stop_scheduler
 
 from app.routes import (
     auth,
@@ -118,6 +120,17 @@ async def log_requests(request: Request, call_next):
     return response
 
 
+@app.on_event("startup")
+async def start_background_sweepers():
+    start_scheduler(get_supabase())
+
+
+@app.on_event("shutdown")
+async def stop_background_sweepers():
+    await stop_scheduler()
+    report_service.shutdown()
+
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(shops.router)
@@ -173,6 +186,12 @@ async def health_check():
     health_status["checks"]["error_tracking"] = "enabled" if settings.sentry_dsn else "disabled"
     health_status["checks"]["stripe"] = "configured" if settings.stripe_secret_key else "not_configured"
 
+    scheduler = get_scheduler()
+    if scheduler is None:
+        health_status["checks"]["scheduler"] = "disabled"
+    else:
+        health_status["checks"]["scheduler"] = "leader" if scheduler.is_leader else "standby"
+
     status_code = 200 if health_status["status"] == "healthy" else 503
     return JSONResponse(content=health_status, status_code=status_code)
 
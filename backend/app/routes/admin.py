@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from app.database import get_supabase
+from app.services.admin_service import admin_service
+from app.services.scheduler import get_scheduler
 from app.utils.security import require_admin
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -53,4 +55,39 @@ async def get_pending_shops(
         return {"shops": response.data or []}
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail="Could not fetch pending shops")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Could not fetch pending shops")
+
+
+@router.get("/scheduler")
+async def get_scheduler_status(
+    _: dict = Depends(require_admin()),
+):
+    """Background sweeper leadership, lag and batch-size metrics for this worker. Admin only."""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return {"enabled": False}
+
+    return {"enabled": True, **scheduler.snapshot()}
+
+
+@router.get("/dashboard")
+async def get_dashboard_stats(
+    _: dict = Depends(require_admin()),
+):
+    """Platform overview statistics from daily rollups (cached). Admin only."""
+    try:
+        return {"stats": admin_service.get_dashboard_stats()}
+    except Exception:
+        raise HTTPException(status_code=500, detail="Could not load dashboard stats")
+
+
+@router.get("/analytics")
+async def get_analytics_overview(
+    days: int = Query(30, ge=1, le=365),
+    _: dict = Depends(require_admin()),
+):
+    """Revenue/order trends, growth and top shops for the last `days` days (cached). Admin only."""
+    try:
+        return {"analytics": admin_service.get_analytics_overview(days)}
+    except Exception:
+        raise HTTPException(status_code=500, detail="Could not load analytics")
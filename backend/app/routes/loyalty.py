@@ -11,8 +11,9 @@ from pydantic import BaseModel, Field
 from app.services.loyalty_service import (
     get_shop_config,
     get_balance,
+    get_customer_balances,
     compute_redemption,
-    release_available_points,
+    present_transactions,
 )
 from app.utils.security import require_auth
 from app.database import get_supabase
@@ -50,15 +51,7 @@ async def my_loyalty(user: dict = Depends(require_auth())):
     db = get_supabase()
     sc = db.get_service_client()
 
-    release_available_points(db, customer_id=customer_id)
-
-    all_shop_rows = (
-        sc.table("customer_shop_points")
-        .select("*, shops(id, name, logo_url, color)")
-        .eq("customer_id", customer_id)
-        .order("current_balance", desc=True)
-        .execute()
-    ).data or []
+    all_shop_rows = get_customer_balances(db, customer_id)
 
     shop_rows = [
         row for row in all_shop_rows
@@ -77,7 +70,7 @@ async def my_loyalty(user: dict = Depends(require_auth())):
 
     return {
         "shops": shop_rows,
-        "transactions": txns,
+        "transactions": present_transactions(txns),
     }
 
 
@@ -91,7 +84,6 @@ async def my_balance_for_shop(shop_id: str, user: dict = Depends(require_auth())
 @router.get("/transactions")
 async def my_transactions(limit: int = 50, user: dict = Depends(require_auth())):
     db = get_supabase()
-    release_available_points(db, customer_id=user.get("sub"))
 
     resp = (
         db.get_service_client()
@@ -103,7 +95,7 @@ async def my_transactions(limit: int = 50, user: dict = Depends(require_auth()))
         .execute()
     )
 
-    return {"transactions": resp.data or []}
+    return {"transactions": present_transactions(resp.data or [])}
 
 
 @router.post("/preview-redeem")
@@ -193,7 +185,6 @@ async def shop_settings_put(
 async def shop_stats(shop_id: str, user: dict = Depends(require_auth())):
     db = get_supabase()
     _require_shop_owner(db, user.get("sub"), shop_id)
-    release_available_points(db, shop_id=shop_id)
 
     sc = db.get_service_client()
 
@@ -206,12 +197,12 @@ async def shop_stats(shop_id: str, user: dict = Depends(require_auth())):
 
     txn_resp = (
         sc.table("points_transactions")
-        .select("amount, type, status")
+        .select("amount, type, status, available_at")
         .eq("shop_id", shop_id)
         .execute()
     )
 
-    txns = txn_resp.data or []
+    txns = present_transactions(txn_resp.data or [])
 
     issued = sum(t["amount"] for t in txns if t["type"] == "earned")
     pending = sum(t["amount"] for t in txns if t["type"] == "earned" and t.get("status") == "pending")
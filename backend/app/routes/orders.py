@@ -12,18 +12,23 @@ This file handles:
   POST /api/v1/orders/complete-ready
   POST /api/v1/orders/complete-ready/cron
 
+Orders are auto-completed by the background scheduler
+(app/services/scheduler.py). With SCHEDULER_ENABLED off, the customer order
+reads complete the caller's ready orders inline instead, and the
+complete-ready endpoints remain as manual/cron triggers.
+
 Manual/cash order creation is intentionally disabled for launch.
 """
 import logging
 import os
-from datetime import datetime, timezone
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Query, Depends, Header
 from pydantic import BaseModel
 
+from app.config import settings
+from app.services import order_completion_service
 from app.services.order_service import order_service
-from app.services.notification_service import send_order_ready_push
 from app.utils.security import require_auth, require_shop_worker, get_user_role
 from app.database import get_supabase
 
@@ -31,10 +36,6 @@ router = APIRouter(prefix="/api/v1", tags=["orders"])
 logger = logging.getLogger(__name__)
 
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
-
-
 class DisabledOrderRequest(BaseModel):
     shop_id: Optional[str] = None
 
@@ -88,127 +89,37 @@ async def create_order_disabled(
     )
 
 
-async def _complete_ready_orders_for_query(sc, query, now_iso: str) -> dict:
+async def _sweep_ready_orders(db, *, customer_id: Optional[str], limit: int) -> dict:
     try:
-        orders = query.execute().data or []
+        return await order_completion_service.complete_ready_orders(
+            db,
+            customer_id=customer_id,
+            limit=limit,
+        )
     except Exception as e:
-        logger.error(f"[Orders] complete-ready lookup failed: {e}")
+        logger.error(f"[Orders] complete-ready sweep failed: {e}")
         raise HTTPException(status_code=500, detail="Could not check ready orders")
 
-    completed = 0
-    notified = 0
-
-    for order in orders:
-        order_id = order["id"]
-        metadata = order.get("metadata") or {}
-
-        update_resp = (
-            sc.table("orders")
-            .update({
-                "status": "completed",
-                "completed_at": now_iso,
-                "updated_at": now_iso,
-                "metadata": {
-                    **metadata,
-                    "auto_completed": True,
-                    "auto_completed_at": now_iso,
-                },
-            })
-            .eq("id", order_id)
-            .in_("status", ["confirmed", "pending"])
-            .execute()
-        )
-
-        if not update_resp.data:
-            continue
-
-        completed += 1
-
-        try:
-            shop_name = "the shop"
-            shop_id = order.get("shop_id")
-            customer_id = order.get("customer_id")
-
-            if shop_id:
-                shop_resp = (
-                    sc.table("shops")
-                    .select("name")
-                    .eq("id", shop_id)
-                    .limit(1)
-                    .execute()
-                )
-                if shop_resp.data:
-                    shop_name = shop_resp.data[0].get("name") or shop_name
-
-            push_token = None
-            if customer_id:
-                profile_resp = (
-                    sc.table("profiles")
-                    .select("push_token")
-                    .eq("id", customer_id)
-                    .limit(1)
-                    .execute()
-                )
-                if profile_resp.data:
-                    push_token = profile_resp.data[0].get("push_token")
-
-            sent = await send_order_ready_push(
-                push_token=push_token,
-                shop_name=shop_name,
-                order_id=order_id,
-            )
-
-            if sent:
-                notified += 1
-                latest_meta = update_resp.data[0].get("metadata") or {}
-                sc.table("orders").update({
-                    "metadata": {
-                        **latest_meta,
-                        "ready_push_sent": True,
-                        "ready_push_sent_at": now_iso,
-                    }
-                }).eq("id", order_id).execute()
-
-        except Exception as e:
-            logger.warning(f"[Orders] ready push failed order={order_id}: {e}")
-
-    return {
-        "success": True,
-        "completed": completed,
-        "notified": notified,
-    }
-
 
 @router.post("/orders/complete-ready")
 async def complete_ready_orders(user: dict = Depends(require_auth())):
     db = get_supabase()
-    sc = db.get_service_client()
 
     user_id = user.get("sub")
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    now_iso = _now_iso()
-
     try:
         user_role = get_user_role(user_id)
     except Exception:
         user_role = "customer"
 
-    query = (
-        sc.table("orders")
-        .select("id, customer_id, shop_id, status, ready_at, metadata")
-        .in_("status", ["confirmed", "pending"])
-        .not_.is_("ready_at", "null")
-        .lte("ready_at", now_iso)
-        .limit(50)
+    return await _sweep_ready_orders(
+        db,
+        customer_id=None if user_role == "admin" else user_id,
+        limit=50,
     )
 
-    if user_role != "admin":
-        query = query.eq("customer_id", user_id)
-
-    return await _complete_ready_orders_for_query(sc, query, now_iso)
-
 
 @router.post("/orders/complete-ready/cron")
 async def complete_ready_orders_cron(
@@ -222,19 +133,22 @@ async def complete_ready_orders_cron(
         raise HTTPException(status_code=401, detail="Invalid completion secret")
 
     db = get_supabase()
-    sc = db.get_service_client()
-    now_iso = _now_iso()
-
-    query = (
-        sc.table("orders")
-        .select("id, customer_id, shop_id, status, ready_at, metadata")
-        .in_("status", ["confirmed", "pending"])
-        .not_.is_("ready_at", "null")
-        .lte("ready_at", now_iso)
-        .limit(100)
-    )
+    return await _sweep_ready_orders(db, customer_id=None, limit=100)
+
 
-    return await _complete_ready_orders_for_query(sc, query, now_iso)
+async def _complete_ready_without_scheduler(db, user: dict) -> None:
+    """Inline fallback for order reads when the background scheduler is off."""
+    if settings.scheduler_enabled:
+        return
+
+    user_id = user.get("sub")
+    if not user_id:
+        return
+
+    try:
+        await order_completion_service.complete_ready_orders(db, customer_id=user_id, limit=50)
+    except Exception as e:
+        logger.warning(f"[Orders] inline complete-ready failed: {e}")
 
 
 @router.get("/orders")
@@ -248,7 +162,7 @@ async def get_customer_orders(
         db = get_supabase()
         order_service.db = db
 
-        await complete_ready_orders(user)
+        await _complete_ready_without_scheduler(db, user)
 
         orders = await order_service.list_orders(
             customer_id=customer_id,
@@ -274,7 +188,7 @@ async def get_customer_order_history(
         db = get_supabase()
         order_service.db = db
 
-        await complete_ready_orders(user)
+        await _complete_ready_without_scheduler(db, user)
 
         orders = await order_service.get_order_history(
             customer_id=customer_id,
@@ -296,7 +210,7 @@ async def get_order_details(order_id: str, user: dict = Depends(require_auth()))
         sc = db.get_service_client()
         order_service.db = db
 
-        await complete_ready_orders(user)
+        await _complete_ready_without_scheduler(db, user)
 
         order = await order_service.get_order(order_id)
         if not order:
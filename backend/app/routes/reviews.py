@@ -2,12 +2,15 @@
 Reviews — customers review shops after completed orders.
 """
 import logging
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field
 
 from app.utils.security import require_auth
+from app.config import settings
 from app.database import get_supabase
 
 router = APIRouter(prefix="/api/v1", tags=["reviews"])
@@ -26,78 +29,57 @@ class UpdateReviewRequest(BaseModel):
     body: Optional[str] = None
 
 
-REVIEW_TABLES: Tuple[Tuple[str, str], ...] = (
-    ("reviews", "body"),
-    ("shop_reviews", "comment"),
-)
+# Reviews live in shop_reviews (the table get_shop_reviews_page reads); its
+# text column is `comment`, exposed to clients as `body`.
+REVIEWS_TABLE = "shop_reviews"
 
 
-def _normalize_review(row: Dict[str, Any], body_column: str, profiles: Optional[Dict[str, Dict[str, Any]]] = None):
+def _normalize_review(row: Dict[str, Any]):
     review = dict(row or {})
-    body = review.get("body")
-    if body is None:
-        body = review.get(body_column)
-    review["body"] = body
-    review.pop("comment", None)
-    if profiles is not None:
-        reviewer = profiles.get(review.get("user_id")) or {}
-        review["reviewer"] = {
-            "full_name": reviewer.get("full_name"),
-            "avatar_url": reviewer.get("avatar_url"),
-        }
+    review["body"] = review.pop("comment", None)
     return review
 
 
-def _fetch_profiles(sc, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
-    if not user_ids:
-        return {}
+# First page of reviews per shop: {(shop_id, limit): (fetched_at, payload)},
+# least recently used first. The endpoint is public and accepts any shop id,
+# so the cache is capped at settings.reviews_cache_max_entries.
+_first_page_cache: "OrderedDict[Tuple[str, int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+
+def _invalidate_shop_reviews(shop_id: Optional[str]) -> None:
+    for key in [key for key in _first_page_cache if key[0] == shop_id]:
+        _first_page_cache.pop(key, None)
+
+
+def _cache_first_page(key: Tuple[str, int], payload: Dict[str, Any]) -> None:
+    now = time.monotonic()
+    _first_page_cache[key] = (now, payload)
+    _first_page_cache.move_to_end(key)
+    if len(_first_page_cache) <= settings.reviews_cache_max_entries:
+        return
+    # Drop expired entries first, then the least recently used ones
+    expired = [
+        k for k, (fetched_at, _) in _first_page_cache.items()
+        if now - fetched_at >= settings.reviews_cache_seconds
+    ]
+    for k in expired:
+        _first_page_cache.pop(k, None)
+    while len(_first_page_cache) > settings.reviews_cache_max_entries:
+        _first_page_cache.popitem(last=False)
+
+
+def _find_review(sc, review_id: str):
     try:
         resp = (
-            sc.table("profiles")
-            .select("id, full_name, avatar_url")
-            .in_("id", list(set(user_ids)))
+            sc.table(REVIEWS_TABLE)
+            .select("id, shop_id, user_id, comment, rating")
+            .eq("id", review_id)
+            .single()
             .execute()
         )
-        return {row["id"]: row for row in (resp.data or [])}
-    except Exception as e:
-        logger.warning(f"[Reviews] Profile lookup skipped: {e}")
-        return {}
-
-
-def _fetch_shop_rating(sc, shop_id: str, reviews: List[Dict[str, Any]]) -> Dict[str, Any]:
-    for fields, avg_key in (("avg_rating, review_count", "avg_rating"), ("average_rating, review_count", "average_rating")):
-        try:
-            resp = sc.table("shops").select(fields).eq("id", shop_id).single().execute()
-            data = resp.data or {}
-            return {
-                "review_count": data.get("review_count", len(reviews)),
-                "avg_rating": data.get(avg_key),
-            }
-        except Exception:
-            continue
-
-    ratings = [float(row["rating"]) for row in reviews if row.get("rating") is not None]
-    return {
-        "review_count": len(reviews),
-        "avg_rating": round(sum(ratings) / len(ratings), 2) if ratings else None,
-    }
-
-
-def _find_review(sc, review_id: str):
-    for table_name, body_column in REVIEW_TABLES:
-        try:
-            resp = (
-                sc.table(table_name)
-                .select(f"id, user_id, {body_column}, rating")
-                .eq("id", review_id)
-                .single()
-                .execute()
-            )
-            if resp.data:
-                return table_name, body_column, resp.data
-        except Exception:
-            continue
-    return None, None, None
+        return resp.data
+    except Exception:
+        return None
 
 
 @router.post("/reviews")
@@ -138,33 +120,30 @@ async def create_review(req: CreateReviewRequest, user: dict = Depends(require_a
             detail=f"Can only review completed orders. This order is {order['status']}",
         )
 
-    last_error = None
-    for table_name, body_column in REVIEW_TABLES:
-        try:
-            insert_resp = (
-                sc.table(table_name)
-                .insert({
-                    "shop_id": req.shop_id,
-                    "user_id": user_id,
-                    "order_id": req.order_id,
-                    "rating": req.rating,
-                    body_column: req.body,
-                })
-                .execute()
-            )
-
-            review = insert_resp.data[0] if insert_resp.data else None
-            return {"review": _normalize_review(review, body_column)}
-        except Exception as e:
-            last_error = e
-            error_str = str(e).lower()
-            if "unique" in error_str or "already" in error_str:
-                raise HTTPException(status_code=409, detail="You already reviewed this order")
-            if "permission" in error_str or "policy" in error_str:
-                raise HTTPException(status_code=403, detail="Not authorized to create review")
-
-    logger.error(f"[Reviews] Insert failed: {last_error}")
-    raise HTTPException(status_code=500, detail="Could not save review")
+    try:
+        insert_resp = (
+            sc.table(REVIEWS_TABLE)
+            .insert({
+                "shop_id": req.shop_id,
+                "user_id": user_id,
+                "order_id": req.order_id,
+                "rating": req.rating,
+                "comment": req.body,
+            })
+            .execute()
+        )
+    except Exception as e:
+        error_str = str(e).lower()
+        if "unique" in error_str or "already" in error_str:
+            raise HTTPException(status_code=409, detail="You already reviewed this order")
+        if "permission" in error_str or "policy" in error_str:
+            raise HTTPException(status_code=403, detail="Not authorized to create review")
+        logger.error(f"[Reviews] Insert failed: {e}")
+        raise HTTPException(status_code=500, detail="Could not save review")
+
+    review = insert_resp.data[0] if insert_resp.data else None
+    _invalidate_shop_reviews(req.shop_id)
+    return {"review": _normalize_review(review)}
 
 
 @router.get("/shops/{shop_id}/reviews")
@@ -173,35 +152,35 @@ async def get_shop_reviews(
     limit: int = Query(20, le=100),
     offset: int = Query(0, ge=0),
 ):
+    cache_key = (shop_id, limit)
+    if offset == 0:
+        cached = _first_page_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < settings.reviews_cache_seconds:
+            _first_page_cache.move_to_end(cache_key)
+            return cached[1]
+
     db = get_supabase()
     sc = db.get_service_client()
 
-    last_error = None
-    for table_name, body_column in REVIEW_TABLES:
-        try:
-            resp = (
-                sc.table(table_name)
-                .select(f"id, rating, {body_column}, created_at, user_id")
-                .eq("shop_id", shop_id)
-                .order("created_at", desc=True)
-                .range(offset, offset + limit - 1)
-                .execute()
-            )
-            rows = resp.data or []
-            profiles = _fetch_profiles(sc, [row["user_id"] for row in rows if row.get("user_id")])
-            reviews = [_normalize_review(row, body_column, profiles) for row in rows]
-            rating_data = _fetch_shop_rating(sc, shop_id, reviews)
-            return {
-                "reviews": reviews,
-                "review_count": rating_data["review_count"],
-                "avg_rating": rating_data["avg_rating"],
-            }
-        except Exception as e:
-            last_error = e
-            logger.warning(f"[Reviews] {table_name} fetch failed: {e}")
-
-    logger.error(f"[Reviews] get_shop_reviews error: {last_error}")
-    raise HTTPException(status_code=500, detail="Could not fetch reviews")
+    try:
+        # Reviews + reviewer profiles + shops.average_rating/review_count (migration 017)
+        resp = sc.rpc(
+            "get_shop_reviews_page",
+            {"p_shop_id": shop_id, "p_limit": limit, "p_offset": offset},
+        ).execute()
+    except Exception as e:
+        logger.error(f"[Reviews] get_shop_reviews error: {e}")
+        raise HTTPException(status_code=500, detail="Could not fetch reviews")
+
+    data = resp.data or {}
+    result = {
+        "reviews": data.get("reviews") or [],
+        "review_count": data.get("review_count") or 0,
+        "avg_rating": data.get("avg_rating"),
+    }
+    if offset == 0:
+        _cache_first_page(cache_key, result)
+    return result
 
 
 @router.get("/reviews/my")
@@ -213,29 +192,20 @@ async def get_my_reviews(
     db = get_supabase()
 
     sc = db.get_service_client()
-    last_error = None
-    for table_name, body_column in REVIEW_TABLES:
-        try:
-            resp = (
-                sc.table(table_name)
-                .select(f"id, shop_id, order_id, rating, {body_column}, created_at")
-                .eq("user_id", user_id)
-                .order("created_at", desc=True)
-                .limit(limit)
-                .execute()
-            )
-            return {
-                "reviews": [
-                    _normalize_review(row, body_column)
-                    for row in (resp.data or [])
-                ]
-            }
-        except Exception as e:
-            last_error = e
-            logger.warning(f"[Reviews] {table_name} my-review fetch failed: {e}")
-
-    logger.error(f"[Reviews] get_my_reviews error: {last_error}")
-    raise HTTPException(status_code=500, detail="Could not fetch your reviews")
+    try:
+        resp = (
+            sc.table(REVIEWS_TABLE)
+            .select("id, shop_id, order_id, rating, comment, created_at")
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(limit)
+            .execute()
+        )
+    except Exception as e:
+        logger.error(f"[Reviews] get_my_reviews error: {e}")
+        raise HTTPException(status_code=500, detail="Could not fetch your reviews")
+
+    return {"reviews": [_normalize_review(row) for row in (resp.data or [])]}
 
 
 @router.put("/reviews/{review_id}")
@@ -248,7 +218,7 @@ async def update_review(
     db = get_supabase()
     sc = db.get_service_client()
 
-    table_name, body_column, review = _find_review(sc, review_id)
+    review = _find_review(sc, review_id)
 
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
@@ -256,24 +226,26 @@ async def update_review(
     if review["user_id"] != user_id:
         raise HTTPException(status_code=403, detail="Not your review")
 
+    shop_id = review.get("shop_id")
     update_data = {}
     if req.rating is not None:
         update_data["rating"] = req.rating
     if req.body is not None:
-        update_data[body_column] = req.body
+        update_data["comment"] = req.body
 
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
     try:
         resp = (
-            sc.table(table_name)
+            sc.table(REVIEWS_TABLE)
             .update(update_data)
             .eq("id", review_id)
             .execute()
         )
 
-        review = _normalize_review(resp.data[0], body_column) if resp.data else None
+        review = _normalize_review(resp.data[0]) if resp.data else None
+        _invalidate_shop_reviews(shop_id)
         logger.info(f"[Reviews] Review updated: {review_id}")
         return {"review": review}
 
@@ -288,7 +260,7 @@ async def delete_review(review_id: str, user: dict = Depends(require_auth())):
     db = get_supabase()
     sc = db.get_service_client()
 
-    table_name, _, review = _find_review(sc, review_id)
+    review = _find_review(sc, review_id)
 
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
@@ -297,7 +269,8 @@ async def delete_review(review_id: str, user: dict = Depends(require_auth())):
         raise HTTPException(status_code=403, detail="Not your review")
 
     try:
-        sc.table(table_name).delete().eq("id", review_id).execute()
+        sc.table(REVIEWS_TABLE).delete().eq("id", review_id).execute()
+        _invalidate_shop_reviews(review.get("shop_id"))
         logger.info(f"[Reviews] Review deleted: {review_id}")
         return {"deleted": True}
 
@@ -2,24 +2,33 @@
 Shop Routes - API endpoints for shop management
 Includes public, shop owner, and admin endpoints
 """
+import logging
+import os
 import secrets
+import time
+from datetime import date, timedelta
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, validator
 
-from app.services.shop_service import shop_service
+from app.services.shop_service import TOP_ITEMS_WINDOWS, shop_service
+from app.services.export_service import COLUMNAR_FORMATS, export_service
+from app.services.report_service import report_service
 from app.services.billing_service import (
     find_active_subscription_id,
     list_owner_billing_shops,
     sync_owner_subscription_location_quantity,
 )
 from app.utils.security import require_auth, require_admin
+from app.config import settings
 from app.database import get_supabase
 
 router = APIRouter(
     prefix="/api/v1/shops",
     tags=["shops"]
 )
+logger = logging.getLogger(__name__)
 
 MAX_IMAGE_UPLOAD_BYTES = 5 * 1024 * 1024
 
@@ -133,21 +142,36 @@ async def find_nearby_shops(
     return {"shops": shops}
 
 
+_public_stats_cache: Dict[str, tuple] = {}
+
+
 @router.get("/stats/public")
 async def get_public_stats():
     """Small public homepage counters via backend service role."""
+    cached = _public_stats_cache.get("stats")
+    now = time.monotonic()
+    if cached and now - cached[0] < settings.public_stats_cache_seconds:
+        return cached[1]
+
     db = get_supabase()
     sc = db.get_service_client()
 
-    shops = sc.table("shops").select("id", count="exact").eq("status", "active").execute()
-    orders = sc.table("orders").select("id", count="exact").neq("status", "cancelled").execute()
-    users = sc.table("profiles").select("id", count="exact").eq("status", "active").execute()
-
-    return {
-        "shopCount": shops.count or 0,
-        "orderCount": orders.count or 0,
-        "userCount": users.count or 0,
+    try:
+        # Trigger-maintained counters (migration 016) instead of count="exact" scans
+        counters = sc.rpc("get_public_stat_counters", {}).execute().data or {}
+    except Exception as e:
+        if cached:
+            logger.warning(f"[Shops] public stats refresh failed, serving cached: {e}")
+            return cached[1]
+        raise
+
+    stats = {
+        "shopCount": counters.get("shops") or 0,
+        "orderCount": counters.get("orders") or 0,
+        "userCount": counters.get("users") or 0,
     }
+    _public_stats_cache["stats"] = (now, stats)
+    return stats
 
 
 @router.get("/mine")
@@ -378,17 +402,186 @@ async def upload_shop_asset(shop_id: str, file: UploadFile = File(...), user: di
 
 
 @router.get("/{shop_id}/analytics")
-async def get_shop_analytics(shop_id: str, user: dict = Depends(require_auth())):
+async def get_shop_analytics(
+    shop_id: str,
+    top_items_window: str = Query("all", description="Top items window: 7d, 30d or all"),
+    user: dict = Depends(require_auth()),
+):
     """Get shop analytics"""
     user_id = user.get("sub")
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID not found in token")
+    if top_items_window not in TOP_ITEMS_WINDOWS:
+        raise HTTPException(status_code=400, detail="top_items_window must be one of 7d, 30d, all")
+    if not await shop_service.verify_shop_ownership(shop_id, user_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    analytics = await shop_service.get_shop_analytics(shop_id, top_items_window=top_items_window)
+    return {"analytics": analytics}
+
+
+MAX_ANALYTICS_RANGE_DAYS = 3660
+
+
+@router.get("/{shop_id}/analytics/daily")
+async def get_shop_daily_analytics(
+    shop_id: str,
+    start_date: date = Query(..., description="First day (UTC), inclusive"),
+    end_date: date = Query(..., description="Last day (UTC), inclusive"),
+    user: dict = Depends(require_auth()),
+):
+    """Per-day shop analytics for a date range, served from daily rollups"""
+    user_id = user.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User ID not found in token")
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must be on or after start_date")
+    if (end_date - start_date).days > MAX_ANALYTICS_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail="Date range is too large")
     if not await shop_service.verify_shop_ownership(shop_id, user_id):
         raise HTTPException(status_code=403, detail="Not authorized")
-    analytics = await shop_service.get_shop_analytics(shop_id)
+    analytics = await shop_service.get_shop_daily_stats(
+        shop_id, start_date.isoformat(), end_date.isoformat()
+    )
     return {"analytics": analytics}
 
 
+@router.get("/{shop_id}/orders/export.csv")
+async def export_shop_orders_csv(
+    shop_id: str,
+    start_date: Optional[date] = Query(None, description="First day (UTC), inclusive"),
+    end_date: Optional[date] = Query(None, description="Last day (UTC), inclusive"),
+    user: dict = Depends(require_auth()),
+):
+    """Stream the shop's orders as CSV, oldest first. Shop owner only."""
+    user_id = user.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User ID not found in token")
+    if start_date and end_date and end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must be on or after start_date")
+    if not await shop_service.verify_shop_ownership(shop_id, user_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    pages = export_service.iter_shop_order_pages(
+        get_supabase().get_service_client(),
+        shop_id,
+        start=start_date.isoformat() if start_date else None,
+        end=(end_date + timedelta(days=1)).isoformat() if end_date else None,
+    )
+    filename = f"orders-{shop_id}.csv"
+    return StreamingResponse(
+        export_service.stream_orders_csv(pages),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/{shop_id}/orders/export")
+async def export_shop_orders_columnar(
+    shop_id: str,
+    format: str = Query("parquet", description="parquet or arrow"),
+    start_date: Optional[date] = Query(None, description="First day (UTC), inclusive"),
+    end_date: Optional[date] = Query(None, description="Last day (UTC), inclusive"),
+    user: dict = Depends(require_auth()),
+):
+    """Stream the shop's orders as Parquet or an Arrow IPC stream. Shop owner only."""
+    user_id = user.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User ID not found in token")
+    if format not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be one of parquet, arrow")
+    if not export_service.columnar_available():
+        raise HTTPException(status_code=501, detail="Columnar exports are not available")
+    if start_date and end_date and end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must be on or after start_date")
+    if not await shop_service.verify_shop_ownership(shop_id, user_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    pages = export_service.iter_shop_order_pages(
+        get_supabase().get_service_client(),
+        shop_id,
+        start=start_date.isoformat() if start_date else None,
+        end=(end_date + timedelta(days=1)).isoformat() if end_date else None,
+    )
+    filename = f"orders-{shop_id}.{format}"
+    return StreamingResponse(
+        export_service.stream_orders_columnar(pages, fmt=format),
+        media_type=COLUMNAR_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/{shop_id}/orders/report.pdf", status_code=202)
+async def request_shop_orders_pdf(
+    shop_id: str,
+    start_date: Optional[date] = Query(None, description="First day (UTC), inclusive"),
+    end_date: Optional[date] = Query(None, description="Last day (UTC), inclusive"),
+    user: dict = Depends(require_auth()),
+):
+    """Start (or reuse) a background PDF orders report. Shop owner only."""
+    user_id = user.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User ID not found in token")
+    if start_date and end_date and end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must be on or after start_date")
+    if not await shop_service.verify_shop_ownership(shop_id, user_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    job = await report_service.request_orders_pdf(
+        get_supabase().get_service_client(),
+        shop_id,
+        start=start_date.isoformat() if start_date else None,
+        end=(end_date + timedelta(days=1)).isoformat() if end_date else None,
+    )
+    return {"report": job.to_dict()}
+
+
+@router.get("/{shop_id}/reports/{report_id}")
+async def get_shop_report(
+    shop_id: str,
+    report_id: str,
+    user: dict = Depends(require_auth()),
+):
+    """Report job status. Shop owner only."""
+    user_id = user.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User ID not found in token")
+    if not await shop_service.verify_shop_ownership(shop_id, user_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = report_service.get_job(shop_id, report_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return {"report": job.to_dict()}
+
+
+@router.get("/{shop_id}/reports/{report_id}/download")
+async def download_shop_report(
+    shop_id: str,
+    report_id: str,
+    user: dict = Depends(require_auth()),
+):
+    """Download a finished PDF report. Shop owner only."""
+    user_id = user.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User ID not found in token")
+    if not await shop_service.verify_shop_ownership(shop_id, user_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = report_service.get_job(shop_id, report_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Report is {job.status}")
+    path = report_service.path_for(shop_id, report_id)
+    if not os.path.exists(path):
+        # Pruned from the shared cache directory since get_job checked it
+        report_service.forget(report_id)
+        raise HTTPException(status_code=404, detail="Report expired, request it again")
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=f"orders-report-{shop_id}.pdf",
+    )
+
+
 @router.post("/{shop_id}/generate-api-key")
 async def generate_shop_api_key(shop_id: str, user: dict = Depends(require_auth())):
     """Generate a new API key for a shop. Shop owner only."""
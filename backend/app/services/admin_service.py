@@ -4,7 +4,24 @@ Handles analytics, shop/user management, audit logging
 """
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
-import json
+import time
+
+from app.config import settings
+from app.database import get_supabase
+
+# Windows used by the period-based analytics
+PERIOD_DAYS = {"day": 1, "week": 7, "month": 30, "quarter": 90, "year": 365}
+DASHBOARD_DAYS = 30
+TOP_SHOPS_LIMIT = 25
+
+# {days: (fetched_at, payload)} shared by every AdminService instance
+_ANALYTICS_CACHE: Dict[int, tuple] = {}
+
+
+def _pct_change(current: float, previous: float) -> float:
+    if not previous:
+        return 100.0 if current else 0.0
+    return round((current - previous) / previous * 100, 1)
 
 
 class AdminService:
@@ -37,8 +54,8 @@ class AdminService:
             "order_trend": self._get_order_trend(days),
             "user_growth": self._get_user_growth(days),
             "shop_growth": self._get_shop_growth(days),
-            "top_shops": self._get_top_performing_shops(10),
-            "avg_order_value": self._calculate_avg_order_value()
+            "top_shops": self._get_top_performing_shops(10, days),
+            "avg_order_value": self._calculate_avg_order_value(days)
         }
     
     def get_revenue_analytics(self, period: str = "month") -> Dict[str, Any]:
@@ -78,31 +95,34 @@ class AdminService:
                    featured: Optional[bool] = None,
                    limit: int = 50, offset: int = 0) -> List[Dict]:
         """List all shops with filters"""
-        query = "SELECT * FROM shops WHERE 1=1"
-        params = []
+        query = self._client().table("shops").select("*")
         
         if status:
-            query += " AND status = ?"
-            params.append(status)
+            query = query.eq("status", status)
         
         if featured is not None:
-            query += " AND featured = ?"
-            params.append(featured)
-        
-        query += f" ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}"
+            query = query.eq("featured", featured)
         
-        return self._execute_query(query, params)
+        response = (
+            query.order("created_at", desc=True)
+            .range(offset, offset + limit - 1)
+            .execute()
+        )
+        return response.data or []
     
     def get_shop_details(self, shop_id: str) -> Optional[Dict]:
         """Get detailed shop information"""
-        shop = self._execute_query(
-            "SELECT * FROM shops WHERE id = ?", 
-            [shop_id]
+        response = (
+            self._client().table("shops")
+            .select("*")
+            .eq("id", shop_id)
+            .limit(1)
+            .execute()
         )
-        if not shop:
+        if not response.data:
             return None
         
-        shop_data = shop[0]
+        shop_data = response.data[0]
         shop_data["owner"] = self._get_user_by_id(shop_data.get("owner_id"))
         shop_data["stats"] = {
             "total_orders": self._get_shop_order_count(shop_id),
@@ -119,10 +139,14 @@ class AdminService:
         if status not in valid_statuses:
             return False
         
-        self._execute_update(
-            "UPDATE shops SET status = ? WHERE id = ?",
-            [status, shop_id]
+        response = (
+            self._client().table("shops")
+            .update({"status": status})
+            .eq("id", shop_id)
+            .execute()
         )
+        if not response.data:
+            return False
         
         self._log_admin_action(
             admin_id=admin_id,
@@ -136,16 +160,19 @@ class AdminService:
     
     def toggle_shop_featured(self, shop_id: str, admin_id: str) -> bool:
         """Toggle shop featured status"""
-        shop = self.get_shop_details(shop_id)
-        if not shop:
+        response = (
+            self._client().table("shops")
+            .select("featured")
+            .eq("id", shop_id)
+            .limit(1)
+            .execute()
+        )
+        if not response.data:
             return False
         
-        new_featured = not shop.get("featured", False)
+        new_featured = not response.data[0].get("featured", False)
         
-        self._execute_update(
-            "UPDATE shops SET featured = ? WHERE id = ?",
-            [new_featured, shop_id]
-        )
+        self._client().table("shops").update({"featured": new_featured}).eq("id", shop_id).execute()
         
         self._log_admin_action(
             admin_id=admin_id,
@@ -159,7 +186,9 @@ class AdminService:
     
     def delete_shop(self, shop_id: str, admin_id: str) -> bool:
         """Permanently delete a shop"""
-        self._execute_update("DELETE FROM shops WHERE id = ?", [shop_id])
+        response = self._client().table("shops").delete().eq("id", shop_id).execute()
+        if not response.data:
+            return False
         
         self._log_admin_action(
             admin_id=admin_id,
@@ -177,20 +206,20 @@ class AdminService:
                    status: Optional[str] = None,
                    limit: int = 50, offset: int = 0) -> List[Dict]:
         """List all users with filters"""
-        query = "SELECT * FROM profiles WHERE 1=1"
-        params = []
+        query = self._client().table("profiles").select("*")
         
         if role:
-            query += " AND role = ?"
-            params.append(role)
+            query = query.eq("role", role)
         
         if status:
-            query += " AND status = ?"
-            params.append(status)
+            query = query.eq("status", status)
         
-        query += f" ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}"
-        
-        return self._execute_query(query, params)
+        response = (
+            query.order("created_at", desc=True)
+            .range(offset, offset + limit - 1)
+            .execute()
+        )
+        return response.data or []
     
     def get_user_details(self, user_id: str) -> Optional[Dict]:
         """Get detailed user information"""
@@ -212,10 +241,14 @@ class AdminService:
         if role not in valid_roles:
             return False
         
-        self._execute_update(
-            "UPDATE profiles SET role = ? WHERE id = ?",
-            [role, user_id]
+        response = (
+            self._client().table("profiles")
+            .update({"role": role})
+            .eq("id", user_id)
+            .execute()
         )
+        if not response.data:
+            return False
         
         self._log_admin_action(
             admin_id=admin_id,
@@ -233,10 +266,14 @@ class AdminService:
         if status not in valid_statuses:
             return False
         
-        self._execute_update(
-            "UPDATE profiles SET status = ? WHERE id = ?",
-            [status, user_id]
+        response = (
+            self._client().table("profiles")
+            .update({"status": status})
+            .eq("id", user_id)
+            .execute()
         )
+        if not response.data:
+            return False
         
         self._log_admin_action(
             admin_id=admin_id,
@@ -250,7 +287,9 @@ class AdminService:
     
     def delete_user(self, user_id: str, admin_id: str) -> bool:
         """Delete user account"""
-        self._execute_update("DELETE FROM profiles WHERE id = ?", [user_id])
+        response = self._client().table("profiles").delete().eq("id", user_id).execute()
+        if not response.data:
+            return False
         
         self._log_admin_action(
             admin_id=admin_id,
@@ -297,168 +336,256 @@ class AdminService:
                       admin_id: Optional[str] = None,
                       entity_type: Optional[str] = None) -> List[Dict]:
         """Retrieve audit log entries"""
-        query = "SELECT * FROM audit_log WHERE 1=1"
-        params = []
+        query = self._client().table("audit_log").select("*")
         
         if admin_id:
-            query += " AND admin_id = ?"
-            params.append(admin_id)
+            query = query.eq("admin_id", admin_id)
         
         if entity_type:
-            query += " AND entity_type = ?"
-            params.append(entity_type)
+            query = query.eq("entity_type", entity_type)
         
-        query += f" ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}"
-        
-        return self._execute_query(query, params)
+        response = (
+            query.order("created_at", desc=True)
+            .range(offset, offset + limit - 1)
+            .execute()
+        )
+        return response.data or []
     
     # Helper methods for database operations
     
-    def _execute_query(self, query: str, params: List = None) -> List[Dict]:
-        """Execute SELECT query and return results"""
-        # Placeholder - will be implemented with actual DB
-        return []
-    
-    def _execute_update(self, query: str, params: List = None) -> None:
-        """Execute UPDATE/DELETE query"""
-        # Placeholder - will be implemented with actual DB
-        pass
+    def _client(self):
+        """Service-role Supabase client (admin operations bypass RLS)"""
+        return self.db.get_service_client()
     
     def _log_admin_action(self, admin_id: str, action: str,
                          entity_type: str, entity_id: Optional[str],
                          details: Dict) -> None:
         """Log admin action to audit_log table"""
-        query = """
-            INSERT INTO audit_log (admin_id, action, entity_type, entity_id, details)
-            VALUES (?, ?, ?, ?, ?)
-        """
-        self._execute_update(query, [
-            admin_id, action, entity_type, entity_id, 
-            json.dumps(details)
-        ])
+        self._client().table("audit_log").insert({
+            "admin_id": admin_id,
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "details": details,
+        }).execute()
     
     # Analytics helper methods
+    #
+    # All platform analytics come from one get_admin_platform_analytics RPC
+    # per window (aggregates over shop_daily_rollups, never raw orders),
+    # cached for settings.admin_analytics_cache_seconds. A dashboard load
+    # therefore costs at most one round trip however many helpers it uses.
+    
+    def _platform_analytics(self, days: int = DASHBOARD_DAYS) -> Dict[str, Any]:
+        """Get the cached analytics document for the last `days` days"""
+        cached = _ANALYTICS_CACHE.get(days)
+        now = time.monotonic()
+        if cached and now - cached[0] < settings.admin_analytics_cache_seconds:
+            return cached[1]
+        
+        response = self._client().rpc(
+            "get_admin_platform_analytics",
+            {"p_days": days, "p_top_limit": TOP_SHOPS_LIMIT},
+        ).execute()
+        data = response.data or {}
+        
+        _ANALYTICS_CACHE[days] = (now, data)
+        return data
+    
+    def _period_analytics(self, period: str) -> Dict[str, Any]:
+        return self._platform_analytics(PERIOD_DAYS.get(period, DASHBOARD_DAYS))
+    
+    def _daily_series(self, days: int, field: str) -> List[Dict]:
+        return [
+            {"date": row["date"], "value": row.get(field, 0)}
+            for row in self._platform_analytics(days).get("daily", [])
+        ]
+    
+    def _monthly_series(self, months: int, field: str) -> List[Dict]:
+        totals: Dict[str, int] = {}
+        for row in self._platform_analytics(PERIOD_DAYS["year"]).get("daily", []):
+            month = row["date"][:7]
+            totals[month] = totals.get(month, 0) + (row.get(field) or 0)
+        return [{"month": m, "value": v} for m, v in sorted(totals.items())][-months:]
     
     def _calculate_total_revenue(self) -> float:
         """Calculate total platform revenue"""
-        return 0.0
+        return float(self._platform_analytics().get("all_time", {}).get("revenue") or 0)
     
     def _get_total_orders(self) -> int:
         """Get total order count"""
-        return 0
+        return int(self._platform_analytics().get("all_time", {}).get("orders") or 0)
     
     def _get_total_users(self) -> int:
         """Get total user count"""
-        return 0
+        return int(self._platform_analytics().get("users", {}).get("total") or 0)
     
     def _get_total_shops(self) -> int:
         """Get total shop count"""
-        return 0
+        return int(self._platform_analytics().get("shops", {}).get("total") or 0)
     
     def _get_shops_by_status(self, status: str) -> int:
-        """Count shops by status"""
-        return 0
+        """Count shops by status (active or pending)"""
+        return int(self._platform_analytics().get("shops", {}).get(status) or 0)
     
     def _calculate_revenue_change(self) -> float:
         """Calculate revenue change percentage"""
-        return 0.0
+        window = self._platform_analytics().get("window", {})
+        return _pct_change(float(window.get("revenue") or 0), float(window.get("previous_revenue") or 0))
     
     def _calculate_orders_change(self) -> float:
         """Calculate orders change percentage"""
-        return 0.0
+        window = self._platform_analytics().get("window", {})
+        return _pct_change(float(window.get("orders") or 0), float(window.get("previous_orders") or 0))
     
     def _calculate_users_change(self) -> float:
         """Calculate users change percentage"""
-        return 0.0
+        users = self._platform_analytics().get("users", {})
+        return _pct_change(float(users.get("current") or 0), float(users.get("previous") or 0))
     
     def _get_revenue_trend(self, days: int) -> List[Dict]:
         """Get revenue trend data"""
-        return []
+        return self._daily_series(days, "revenue")
     
     def _get_order_trend(self, days: int) -> List[Dict]:
         """Get order trend data"""
-        return []
+        return self._daily_series(days, "orders")
     
     def _get_user_growth(self, days: int) -> List[Dict]:
         """Get user growth data"""
-        return []
+        return self._daily_series(days, "new_users")
     
     def _get_shop_growth(self, days: int) -> List[Dict]:
         """Get shop growth data"""
-        return []
+        return self._daily_series(days, "new_shops")
     
-    def _get_top_performing_shops(self, limit: int) -> List[Dict]:
+    def _get_top_performing_shops(self, limit: int, days: int = DASHBOARD_DAYS) -> List[Dict]:
         """Get top performing shops by revenue"""
-        return []
+        return self._platform_analytics(days).get("top_shops", [])[:limit]
     
-    def _calculate_avg_order_value(self) -> float:
-        """Calculate average order value"""
-        return 0.0
+    def _calculate_avg_order_value(self, days: int = DASHBOARD_DAYS) -> float:
+        """Calculate average order value over the last `days` days"""
+        window = self._platform_analytics(days).get("window", {})
+        orders = float(window.get("orders") or 0)
+        return round(float(window.get("revenue") or 0) / orders, 2) if orders else 0.0
     
     def _get_revenue_by_period(self, period: str) -> float:
         """Get revenue for a specific period"""
-        return 0.0
+        return float(self._period_analytics(period).get("window", {}).get("revenue") or 0)
     
     def _get_revenue_by_shop(self, period: str) -> List[Dict]:
         """Get revenue breakdown by shop"""
-        return []
+        return self._period_analytics(period).get("top_shops", [])
     
     def _get_revenue_trend_by_period(self, period: str) -> List[Dict]:
         """Get revenue trend for period"""
-        return []
+        return self._daily_series(PERIOD_DAYS.get(period, DASHBOARD_DAYS), "revenue")
     
     def _get_orders_by_period(self, period: str) -> int:
         """Get order count for period"""
-        return 0
+        return int(self._period_analytics(period).get("window", {}).get("orders") or 0)
     
     def _get_orders_by_status(self, period: str) -> Dict[str, int]:
-        """Get orders grouped by status"""
-        return {}
+        """Get orders grouped by status (rollups track completed vs still open)"""
+        daily = self._period_analytics(period).get("daily", [])
+        orders = sum(int(row.get("orders") or 0) for row in daily)
+        completed = sum(int(row.get("completed_orders") or 0) for row in daily)
+        return {"completed": completed, "open": orders - completed}
     
     def _get_orders_by_shop(self, period: str) -> List[Dict]:
         """Get orders breakdown by shop"""
-        return []
+        return [
+            {"shop_id": shop.get("shop_id"), "name": shop.get("name"), "orders": shop.get("orders", 0)}
+            for shop in self._period_analytics(period).get("top_shops", [])
+        ]
     
     def _get_daily_signups(self, days: int) -> List[Dict]:
         """Get daily user signups"""
-        return []
+        return self._daily_series(days, "new_users")
     
     def _get_monthly_signups(self, months: int) -> List[Dict]:
         """Get monthly user signups"""
-        return []
+        return self._monthly_series(months, "new_users")
     
     def _get_daily_shops(self, days: int) -> List[Dict]:
         """Get daily shop registrations"""
-        return []
+        return self._daily_series(days, "new_shops")
     
     def _get_monthly_shops(self, months: int) -> List[Dict]:
         """Get monthly shop registrations"""
-        return []
+        return self._monthly_series(months, "new_shops")
     
     def _get_user_by_id(self, user_id: str) -> Optional[Dict]:
         """Get user by ID"""
-        return None
+        if not user_id:
+            return None
+        response = (
+            self._client().table("profiles")
+            .select("*")
+            .eq("id", user_id)
+            .limit(1)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+    
+    def _shop_summary(self, shop_id: str) -> Dict[str, Any]:
+        """Completed order totals for a shop from its daily rollups (migration 013)"""
+        response = self._client().rpc(
+            "get_shop_analytics_summary", {"p_shop_id": shop_id}
+        ).execute()
+        return response.data[0] if response.data else {}
     
     def _get_shop_order_count(self, shop_id: str) -> int:
         """Get total orders for shop"""
-        return 0
+        return int(self._shop_summary(shop_id).get("total_orders") or 0)
     
     def _get_shop_revenue(self, shop_id: str) -> float:
         """Get total revenue for shop"""
-        return 0.0
+        return float(self._shop_summary(shop_id).get("total_revenue") or 0)
     
     def _get_shop_menu_count(self, shop_id: str) -> int:
         """Get menu item count for shop"""
-        return 0
+        response = (
+            self._client().table("menu_items")
+            .select("id", count="exact")
+            .eq("shop_id", shop_id)
+            .limit(1)
+            .execute()
+        )
+        return response.count or 0
     
     def _get_user_order_count(self, user_id: str) -> int:
         """Get total orders for user"""
-        return 0
+        response = (
+            self._client().table("orders")
+            .select("id", count="exact")
+            .eq("customer_id", user_id)
+            .limit(1)
+            .execute()
+        )
+        return response.count or 0
     
     def _get_user_total_spent(self, user_id: str) -> float:
-        """Get total amount spent by user"""
-        return 0.0
+        """Get total amount spent by user (completed orders)"""
+        response = (
+            self._client().table("orders")
+            .select("total")
+            .eq("customer_id", user_id)
+            .eq("status", "completed")
+            .execute()
+        )
+        return round(sum(float(row.get("total") or 0) for row in response.data or []), 2)
     
     def _get_user_loyalty_points(self, user_id: str) -> int:
-        """Get user's loyalty points"""
-        return 0
+        """Get user's loyalty points (current balance across shops)"""
+        response = (
+            self._client().table("customer_shop_points")
+            .select("current_balance")
+            .eq("customer_id", user_id)
+            .execute()
+        )
+        return sum(int(row.get("current_balance") or 0) for row in response.data or [])
+
+
+# Global service instance
+admin_service = AdminService(get_supabase())
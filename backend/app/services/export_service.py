@@ -2,16 +2,71 @@
 Export service for generating CSV and PDF reports.
 """
 import io
+import os
 import csv
-from typing import List, Dict, Any
+from decimal import Decimal
+from typing import List, Dict, Any, Iterator, Optional
 from datetime import datetime
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
 from reportlab.pdfgen import canvas
 
+# Optional: columnar (Parquet / Arrow IPC) exports
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Orders fetched per round trip by the streaming exports
+ORDER_EXPORT_PAGE_SIZE = 500
+
+# Orders per Parquet row group / Arrow record batch
+COLUMNAR_ROW_GROUP_ROWS = 10_000
+
+COLUMNAR_FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Rows per PDF table flowable. reportlab lays out and splits each table as a
+# whole, so one table per export gets slower the longer it is; bounded chunks
+# keep layout linear in the number of orders. Even, so row shading lines up.
+PDF_TABLE_CHUNK_ROWS = 500
+
+PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6B46C1')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F7FAFC')])
+])
+
+ORDER_CSV_FIELDNAMES = [
+    "order_id",
+    "order_number",
+    "customer_name",
+    "customer_email",
+    "shop_name",
+    "status",
+    "total_amount",
+    "points_earned",
+    "created_at",
+    "updated_at",
+    "items"
+]
+
 
 class ExportService:
     """Service for exporting data to CSV and PDF formats."""
@@ -32,47 +87,155 @@ class ExportService:
         if not orders:
             return ""
         
-        # Define CSV columns
-        fieldnames = [
-            "order_id",
-            "order_number",
-            "customer_name",
-            "customer_email",
-            "shop_name",
-            "status",
-            "total_amount",
-            "points_earned",
-            "created_at",
-            "updated_at",
-            "items"
-        ]
-        
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer = csv.DictWriter(output, fieldnames=ORDER_CSV_FIELDNAMES)
         writer.writeheader()
         
         for order in orders:
-            # Format items as a string
-            items_str = "; ".join([
-                f"{item.get('name', 'Unknown')} x {item.get('quantity', 1)}"
-                for item in order.get("items", [])
-            ])
-            
-            writer.writerow({
-                "order_id": order.get("id", ""),
-                "order_number": order.get("order_number", ""),
-                "customer_name": order.get("customer_name", ""),
-                "customer_email": order.get("customer_email", ""),
-                "shop_name": order.get("shop_name", ""),
-                "status": order.get("status", ""),
-                "total_amount": order.get("total_amount", 0),
-                "points_earned": order.get("points_earned", 0),
-                "created_at": order.get("created_at", ""),
-                "updated_at": order.get("updated_at", ""),
-                "items": items_str
-            })
+            writer.writerow(ExportService._order_csv_row(order))
         
         return output.getvalue()
     
+    @staticmethod
+    def _order_csv_row(order: Dict[str, Any]) -> Dict[str, Any]:
+        """Flatten one export-shaped order into a CSV row."""
+        # Format items as a string
+        items_str = "; ".join([
+            f"{item.get('name', 'Unknown')} x {item.get('quantity', 1)}"
+            for item in order.get("items", [])
+        ])
+        
+        return {
+            "order_id": order.get("id", ""),
+            "order_number": order.get("order_number", ""),
+            "customer_name": order.get("customer_name", ""),
+            "customer_email": order.get("customer_email", ""),
+            "shop_name": order.get("shop_name", ""),
+            "status": order.get("status", ""),
+            "total_amount": order.get("total_amount", 0),
+            "points_earned": order.get("points_earned", 0),
+            "created_at": order.get("created_at", ""),
+            "updated_at": order.get("updated_at", ""),
+            "items": items_str
+        }
+    
+    @staticmethod
+    def iter_shop_order_pages(
+        client,
+        shop_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        page_size: int = ORDER_EXPORT_PAGE_SIZE,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Page through a shop's orders oldest first, in export shape.
+        
+        Uses keyset pagination on (created_at, id), so every page is an index
+        range scan regardless of how deep into the export it is, and fetches
+        each page's items with one order_items query. Only one page is held
+        in memory at a time.
+        
+        Args:
+            client: Supabase service client
+            shop_id: Shop to export
+            start: Inclusive lower bound on created_at (ISO timestamp)
+            end: Exclusive upper bound on created_at (ISO timestamp)
+            page_size: Orders per round trip
+            
+        Yields:
+            Lists of order dictionaries with items, customer and shop names
+        """
+        shop = client.table("shops").select("name").eq("id", shop_id).limit(1).execute()
+        shop_name = shop.data[0].get("name", "") if shop.data else ""
+        
+        cursor = None
+        while True:
+            query = (
+                client.table("orders")
+                .select(
+                    "id, status, total, loyalty_points_earned, metadata, created_at, updated_at, "
+                    "customer:profiles(full_name, email)"
+                )
+                .eq("shop_id", shop_id)
+            )
+            if start:
+                query = query.gte("created_at", start)
+            if end:
+                query = query.lt("created_at", end)
+            if cursor:
+                created_at, order_id = cursor
+                query = query.or_(
+                    f'created_at.gt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.gt.{order_id})'
+                )
+            
+            orders = (
+                query.order("created_at").order("id").limit(page_size).execute().data or []
+            )
+            if not orders:
+                return
+            
+            items_response = (
+                client.table("order_items")
+                .select("order_id, quantity, unit_price, total_price, menu_items(name)")
+                .in_("order_id", [order["id"] for order in orders])
+                .execute()
+            )
+            items_by_order: Dict[str, List[Dict[str, Any]]] = {}
+            for item in items_response.data or []:
+                menu_item = item.get("menu_items") or {}
+                items_by_order.setdefault(item["order_id"], []).append({
+                    "name": menu_item.get("name", "Unknown"),
+                    "quantity": item.get("quantity", 1),
+                    "unit_price": item.get("unit_price"),
+                    "total_price": item.get("total_price"),
+                })
+            
+            page = []
+            for order in orders:
+                customer = order.get("customer") or {}
+                metadata = order.get("metadata") or {}
+                page.append({
+                    "id": order["id"],
+                    "order_number": metadata.get("order_number", ""),
+                    "customer_name": customer.get("full_name") or "",
+                    "customer_email": customer.get("email") or "",
+                    "shop_name": shop_name,
+                    "status": order.get("status", ""),
+                    "total_amount": float(order.get("total") or 0),
+                    "points_earned": order.get("loyalty_points_earned") or 0,
+                    "created_at": order.get("created_at", ""),
+                    "updated_at": order.get("updated_at", ""),
+                    "items": items_by_order.get(order["id"], []),
+                })
+            yield page
+            
+            if len(orders) < page_size:
+                return
+            cursor = (orders[-1]["created_at"], orders[-1]["id"])
+    
+    @staticmethod
+    def stream_orders_csv(pages: Iterator[List[Dict[str, Any]]]) -> Iterator[str]:
+        """
+        Encode order pages as CSV, one chunk per page.
+        
+        Args:
+            pages: Iterator of export-shaped order lists (see iter_shop_order_pages)
+            
+        Yields:
+            CSV text chunks, header first
+        """
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=ORDER_CSV_FIELDNAMES)
+        writer.writeheader()
+        yield output.getvalue()
+        
+        for page in pages:
+            output.seek(0)
+            output.truncate()
+            for order in page:
+                writer.writerow(ExportService._order_csv_row(order))
+            yield output.getvalue()
+    
     @staticmethod
     def export_orders_to_pdf(
         orders: List[Dict[str, Any]],
@@ -114,10 +277,8 @@ class ExportService:
             no_data = Paragraph("No orders to display.", styles['Normal'])
             elements.append(no_data)
         else:
-            # Create table data
-            table_data = [
-                ["Order #", "Customer", "Status", "Total", "Date"]
-            ]
+            header = ["Order #", "Customer", "Status", "Total", "Date"]
+            rows = []
             
             for order in orders:
                 created_at = order.get("created_at", "")
@@ -130,7 +291,7 @@ class ExportService:
                 else:
                     date_str = ""
                 
-                table_data.append([
+                rows.append([
                     order.get("order_number", ""),
                     order.get("customer_name", "Unknown"),
                     order.get("status", "").title(),
@@ -138,24 +299,15 @@ class ExportService:
                     date_str
                 ])
             
-            # Create table
-            table = Table(table_data, colWidths=[1.2*inch, 2*inch, 1.2*inch, 1*inch, 1.2*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6B46C1')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F7FAFC')])
-            ]))
-            
-            elements.append(table)
+            # Chunked tables; the header row repeats on every page
+            for i in range(0, len(rows), PDF_TABLE_CHUNK_ROWS):
+                table = LongTable(
+                    [header] + rows[i:i + PDF_TABLE_CHUNK_ROWS],
+                    colWidths=[1.2*inch, 2*inch, 1.2*inch, 1*inch, 1.2*inch],
+                    repeatRows=1,
+                )
+                table.setStyle(PDF_TABLE_STYLE)
+                elements.append(table)
         
         # Build PDF
         doc.build(elements)
@@ -163,6 +315,173 @@ class ExportService:
         buffer.close()
         
         return pdf_content
+    
+    @staticmethod
+    def columnar_available() -> bool:
+        return pa is not None
+    
+    @staticmethod
+    def order_arrow_schema():
+        """Typed Arrow schema for export-shaped orders."""
+        item_type = pa.struct([
+            ("name", pa.string()),
+            ("quantity", pa.int32()),
+            ("unit_price", pa.decimal128(9, 2)),
+            ("total_price", pa.decimal128(9, 2)),
+        ])
+        return pa.schema([
+            ("order_id", pa.string()),
+            ("order_number", pa.string()),
+            ("customer_name", pa.string()),
+            ("customer_email", pa.string()),
+            ("shop_name", pa.string()),
+            ("status", pa.string()),
+            ("total_amount", pa.decimal128(10, 2)),
+            ("points_earned", pa.int32()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("updated_at", pa.timestamp("us", tz="UTC")),
+            ("items", pa.list_(item_type)),
+        ])
+    
+    @staticmethod
+    def _orders_to_arrow(orders: List[Dict[str, Any]], schema):
+        def money(value):
+            return None if value is None else Decimal(str(value)).quantize(Decimal("0.01"))
+        
+        def timestamp(value):
+            if not value:
+                return None
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        
+        columns = {
+            "order_id": [o.get("id") for o in orders],
+            "order_number": [o.get("order_number") or None for o in orders],
+            "customer_name": [o.get("customer_name") or None for o in orders],
+            "customer_email": [o.get("customer_email") or None for o in orders],
+            "shop_name": [o.get("shop_name") or None for o in orders],
+            "status": [o.get("status") for o in orders],
+            "total_amount": [money(o.get("total_amount")) for o in orders],
+            "points_earned": [o.get("points_earned") or 0 for o in orders],
+            "created_at": [timestamp(o.get("created_at")) for o in orders],
+            "updated_at": [timestamp(o.get("updated_at")) for o in orders],
+            "items": [
+                [
+                    {
+                        "name": item.get("name"),
+                        "quantity": item.get("quantity", 1),
+                        "unit_price": money(item.get("unit_price")),
+                        "total_price": money(item.get("total_price")),
+                    }
+                    for item in o.get("items", [])
+                ]
+                for o in orders
+            ],
+        }
+        return pa.Table.from_pydict(columns, schema=schema)
+    
+    @staticmethod
+    def stream_orders_columnar(
+        pages: Iterator[List[Dict[str, Any]]],
+        fmt: str = "parquet",
+        row_group_rows: int = COLUMNAR_ROW_GROUP_ROWS,
+    ) -> Iterator[bytes]:
+        """
+        Encode order pages as Parquet or an Arrow IPC stream.
+        
+        Pages are buffered into row groups (Parquet) / record batches (Arrow)
+        of about row_group_rows orders; each is encoded and yielded as soon
+        as it is full, so memory is bounded by one row group.
+        
+        Args:
+            pages: Iterator of export-shaped order lists (see iter_shop_order_pages)
+            fmt: "parquet" or "arrow"
+            row_group_rows: Orders per row group / record batch
+            
+        Yields:
+            Encoded file bytes, in order
+        """
+        if pa is None:
+            raise RuntimeError("pyarrow is not installed")
+        if fmt not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported columnar format: {fmt}")
+        
+        schema = ExportService.order_arrow_schema()
+        sink = _ChunkSink()
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+        
+        buffered: List[Dict[str, Any]] = []
+        
+        def flush():
+            table = ExportService._orders_to_arrow(buffered, schema)
+            if fmt == "parquet":
+                writer.write_table(table, row_group_size=len(buffered))
+            else:
+                writer.write_table(table, max_chunksize=len(buffered))
+            buffered.clear()
+        
+        for page in pages:
+            buffered.extend(page)
+            if len(buffered) >= row_group_rows:
+                flush()
+                yield sink.drain()
+        
+        if buffered:
+            flush()
+        writer.close()
+        yield sink.drain()
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back in chunks."""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+    
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def writable(self) -> bool:
+        return True
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def render_orders_pdf_file(orders: List[Dict[str, Any]], shop_name: str, path: str) -> int:
+    """
+    Render an orders report to a file (process-pool entry point).
+    
+    Writes to a temporary file and renames it into place, so readers never
+    see a partial PDF.
+    
+    Returns:
+        Size of the written PDF in bytes
+    """
+    pdf_content = ExportService.export_orders_to_pdf(orders, shop_name=shop_name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_content)
+    os.replace(tmp_path, path)
+    return len(pdf_content)
 
 
 # Global export service instance
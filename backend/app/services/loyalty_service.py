@@ -9,7 +9,10 @@ Pending points model:
   - pending_balance = earned points waiting to become redeemable
   - earned transactions are inserted with status='pending'
   - available_at controls when pending points release
-  - release_available_points() lazily moves eligible pending points into current_balance
+  - release_available_points() moves eligible pending points into current_balance
+    (swept in the background by app/services/scheduler.py)
+  - reads never release; they use customer_shop_points_effective, which reports
+    due-but-unswept points (due_points) so they count as available immediately
 
 Tables:
   - shop_loyalty_settings
@@ -17,9 +20,8 @@ Tables:
   - points_transactions
 """
 import logging
-import time
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -28,13 +30,17 @@ DEFAULT_MIN_PTS = 200
 DEFAULT_POINT_VALUE = 0.005
 
 PENDING_REDEEM_DELAY_MINUTES = 15
-_MAX_RETRIES = 5
+RELEASE_BATCH_LIMIT = 1000
 
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def _parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
 def _available_at_iso() -> str:
     return (datetime.now(timezone.utc) + timedelta(minutes=PENDING_REDEEM_DELAY_MINUTES)).isoformat()
 
@@ -154,169 +160,138 @@ def _balance_row(db, customer_id: str, shop_id: str) -> Tuple[str, Optional[Dict
     return table, (resp.data[0] if resp.data else None)
 
 
-def _balance_ints(row: Optional[Dict[str, Any]]) -> Dict[str, int]:
-    row = row or {}
-    return {
-        "current_balance": int(row.get("current_balance") or 0),
-        "pending_balance": int(row.get("pending_balance") or 0),
-        "total_earned": int(row.get("total_earned") or 0),
-        "total_spent": int(row.get("total_spent") or 0),
-    }
+def _apply_due_points(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fold due_points (pending points already past available_at) from
+    customer_shop_points_effective into current/pending balances.
+    """
+    due = int(row.pop("due_points", 0) or 0)
+    if due > 0:
+        row["current_balance"] = int(row.get("current_balance") or 0) + due
+        row["pending_balance"] = max(0, int(row.get("pending_balance") or 0) - due)
+    return row
 
 
-def _cas_update_balance(
-    db,
-    table: str,
-    customer_id: str,
-    shop_id: str,
-    previous: Dict[str, int],
-    updates: Dict[str, Any],
-):
-    query = (
+def _effective_balance_row(db, customer_id: str, shop_id: str) -> Optional[Dict[str, Any]]:
+    resp = (
         db.get_service_client()
-        .table(table)
-        .update(updates)
+        .table("customer_shop_points_effective")
+        .select("*")
         .eq("customer_id", customer_id)
         .eq("shop_id", shop_id)
+        .limit(1)
+        .execute()
     )
-    for field, value in previous.items():
-        query = query.eq(field, value)
-    return query.execute()
+    return _apply_due_points(resp.data[0]) if resp.data else None
 
 
-def release_available_points(
-    db,
-    customer_id: Optional[str] = None,
-    shop_id: Optional[str] = None,
-) -> Dict[str, Any]:
+def get_customer_balances(db, customer_id: str) -> List[Dict[str, Any]]:
     """
-    Lazy release pending points whose available_at has passed.
-    This avoids needing cron right now.
+    All per-shop balances for a customer with shop details embedded,
+    highest available balance first. One query.
     """
-    sc = db.get_service_client()
-    now = _now_iso()
-
-    query = (
-        sc.table("points_transactions")
-        .select("*")
-        .eq("type", "earned")
-        .eq("points_type", "shop")
-        .eq("status", "pending")
-        .lte("available_at", now)
-        .order("created_at", desc=False)
-        .limit(100)
-    )
-
-    if customer_id:
-        query = query.eq("customer_id", customer_id)
-    if shop_id:
-        query = query.eq("shop_id", shop_id)
+    rows = (
+        db.get_service_client()
+        .table("customer_shop_points_effective")
+        .select("*, shops(id, name, logo_url, color)")
+        .eq("customer_id", customer_id)
+        .execute()
+    ).data or []
 
-    txns = query.execute().data or []
+    rows = [_apply_due_points(row) for row in rows]
+    rows.sort(key=lambda row: int(row.get("current_balance") or 0), reverse=True)
+    return rows
 
-    released_transactions = 0
-    released_points = 0
 
+def present_transactions(txns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Show pending earned rows whose available_at has passed as 'available'
+    even if the background sweeper has not released them yet.
+    """
+    now = datetime.now(timezone.utc)
     for txn in txns:
-        txn_id = txn["id"]
-        amount = int(txn.get("amount") or 0)
+        if (
+            txn.get("status") == "pending"
+            and txn.get("type") == "earned"
+            and txn.get("available_at")
+            and _parse_iso(txn["available_at"]) <= now
+        ):
+            txn["status"] = "available"
+    return txns
 
-        if amount <= 0:
-            continue
 
-        claimed = (
-            sc.table("points_transactions")
-            .update({"status": "releasing"})
-            .eq("id", txn_id)
-            .eq("status", "pending")
-            .execute()
+def _increment_balance(
+    db,
+    customer_id: str,
+    shop_id: str,
+    *,
+    current: int = 0,
+    pending: int = 0,
+    earned: int = 0,
+    spent: int = 0,
+) -> Dict[str, Any]:
+    """
+    Atomic balance = balance + delta (increment_points_balance RPC).
+    Creates the row if missing; no read-modify-write, so no retries.
+    """
+    resp = db.get_service_client().rpc(
+        "increment_points_balance",
+        {
+            "p_customer_id": customer_id,
+            "p_shop_id": shop_id,
+            "p_current_delta": current,
+            "p_pending_delta": pending,
+            "p_earned_delta": earned,
+            "p_spent_delta": spent,
+        },
+    ).execute()
+
+    if not resp.data:
+        raise RuntimeError(
+            f"Balance update returned no row customer={customer_id} shop={shop_id}"
         )
+    return resp.data[0]
 
-        if not claimed.data:
-            continue
-
-        cid = txn["customer_id"]
-        sid = txn["shop_id"]
-        new_balance = amount
-
-        for attempt in range(_MAX_RETRIES):
-            table, row = _balance_row(db, cid, sid)
-
-            if not row:
-                try:
-                    ins = (
-                        sc.table(table)
-                        .insert({
-                            "customer_id": cid,
-                            "shop_id": sid,
-                            "total_earned": amount,
-                            "total_spent": 0,
-                            "current_balance": amount,
-                            "pending_balance": 0,
-                        })
-                        .execute()
-                    )
-                    new_balance = int((ins.data or [{}])[0].get("current_balance") or amount)
-                    break
-                except Exception:
-                    time.sleep(0.05 * (attempt + 1))
-                    continue
-
-            previous = _balance_ints(row)
-            new_balance = previous["current_balance"] + amount
-            new_pending = max(0, previous["pending_balance"] - amount)
-            result = _cas_update_balance(
-                db,
-                table,
-                cid,
-                sid,
-                previous,
-                {
-                    "current_balance": new_balance,
-                    "pending_balance": new_pending,
-                    "updated_at": now,
-                },
-            )
-            if result.data:
-                break
-            time.sleep(0.05 * (attempt + 1))
-        else:
-            sc.table("points_transactions").update({
-                "status": "pending",
-                "metadata": {
-                    **(txn.get("metadata") or {}),
-                    "release_conflict_at": now,
-                },
-            }).eq("id", txn_id).execute()
-            continue
-
-        sc.table("points_transactions").update({
-            "status": "available",
-            "balance_after": new_balance,
-            "metadata": {
-                **(txn.get("metadata") or {}),
-                "released_at": now,
-            },
-        }).eq("id", txn_id).execute()
 
-        released_transactions += 1
-        released_points += amount
+def release_available_points(
+    db,
+    customer_id: Optional[str] = None,
+    shop_id: Optional[str] = None,
+    limit: int = RELEASE_BATCH_LIMIT,
+) -> Dict[str, Any]:
+    """
+    Release pending points whose available_at has passed.
+    Runs on the background scheduler (app/services/scheduler.py) and is still
+    safe to call inline for a single customer/shop.
 
+    One release_due_points RPC claims the due rows, applies per-shop balance
+    deltas and marks them available in a single transaction.
+    """
+    resp = db.get_service_client().rpc(
+        "release_due_points",
+        {
+            "p_now": _now_iso(),
+            "p_customer_id": customer_id,
+            "p_shop_id": shop_id,
+            "p_limit": limit,
+        },
+    ).execute()
+
+    row = (resp.data or [{}])[0]
     return {
-        "released_transactions": released_transactions,
-        "released_points": released_points,
+        "released_transactions": int(row.get("released_transactions") or 0),
+        "released_points": int(row.get("released_points") or 0),
     }
 
 
 def get_balance(db, customer_id: str, shop_id: str) -> Dict[str, Any]:
     """
     Returns this customer's available + pending point balance at this shop.
-    current_balance remains redeemable only.
+    current_balance remains redeemable only; points past available_at count
+    as available even before the background release has run.
     """
-    release_available_points(db, customer_id=customer_id, shop_id=shop_id)
-
     cfg = get_shop_config(db, shop_id)
-    _, row = _balance_row(db, customer_id, shop_id)
+    row = _effective_balance_row(db, customer_id, shop_id)
 
     current = int(row.get("current_balance") or 0) if row else 0
     pending = int(row.get("pending_balance") or 0) if row else 0
@@ -384,53 +359,14 @@ async def award_points_for_order(
                 "already_awarded": True,
             }
 
-        balance_after = 0
-        for attempt in range(_MAX_RETRIES):
-            table, existing = _balance_row(db, customer_id, shop_id)
-
-            if existing:
-                previous = _balance_ints(existing)
-                balance_after = previous["current_balance"]
-                result = _cas_update_balance(
-                    db,
-                    table,
-                    customer_id,
-                    shop_id,
-                    previous,
-                    {
-                        "pending_balance": previous["pending_balance"] + points,
-                        "total_earned": previous["total_earned"] + points,
-                        "updated_at": now,
-                    },
-                )
-                if result.data:
-                    break
-            else:
-                try:
-                    ins = (
-                        sc.table(table)
-                        .insert({
-                            "customer_id": customer_id,
-                            "shop_id": shop_id,
-                            "total_earned": points,
-                            "total_spent": 0,
-                            "current_balance": 0,
-                            "pending_balance": points,
-                        })
-                        .execute()
-                    )
-                    if ins.data:
-                        break
-                except Exception:
-                    pass
-
-            if attempt < _MAX_RETRIES - 1:
-                time.sleep(0.05 * (attempt + 1))
-        else:
-            raise RuntimeError(
-                f"Could not award loyalty points after {_MAX_RETRIES} attempts "
-                f"(concurrent conflict) customer={customer_id} shop={shop_id}"
-            )
+        row = _increment_balance(
+            db,
+            customer_id,
+            shop_id,
+            pending=points,
+            earned=points,
+        )
+        balance_after = int(row.get("current_balance") or 0)
 
         sc.table("points_transactions").insert({
             "customer_id": customer_id,
@@ -494,45 +430,22 @@ async def redeem_points_for_order(
         raise ValueError(f"Must redeem in multiples of {step} points.")
 
     discount_cents = int(round(points_to_redeem * float(cfg["points_to_dollar_value"]) * 100))
-    new_balance = 0
-
-    for attempt in range(_MAX_RETRIES):
-        table, row = _balance_row(db, customer_id, shop_id)
-        current = int(row.get("current_balance") or 0) if row else 0
-
-        if points_to_redeem > current:
-            raise ValueError(f"Insufficient points. You have {current}.")
-
-        new_balance = current - points_to_redeem
-        new_spent = int(row.get("total_spent") or 0) + points_to_redeem
-
-        result = (
-            db.get_service_client()
-            .table(table)
-            .update({
-                "current_balance": new_balance,
-                "total_spent": new_spent,
-                "updated_at": _now_iso(),
-            })
-            .eq("customer_id", customer_id)
-            .eq("shop_id", shop_id)
-            .eq("current_balance", current)
-            .gte("current_balance", points_to_redeem)
-            .execute()
-        )
 
-        if result.data:
-            break
+    result = db.get_service_client().rpc(
+        "redeem_points_balance",
+        {
+            "p_customer_id": customer_id,
+            "p_shop_id": shop_id,
+            "p_points": points_to_redeem,
+        },
+    ).execute()
 
-    else:
+    if not result.data:
         _, row = _balance_row(db, customer_id, shop_id)
         current = int(row.get("current_balance") or 0) if row else 0
-        if points_to_redeem > current:
-            raise ValueError(f"Insufficient points. You have {current}.")
-        raise RuntimeError(
-            f"Could not apply redemption after {_MAX_RETRIES} attempts "
-            f"(concurrent conflict) customer={customer_id} shop={shop_id}"
-        )
+        raise ValueError(f"Insufficient points. You have {current}.")
+
+    new_balance = int(result.data[0].get("current_balance") or 0)
 
     db.get_service_client().table("points_transactions").insert({
         "customer_id": customer_id,
@@ -598,55 +511,14 @@ async def refund_redeemed_points_for_order(
         return {"success": True, "points": 0, "already_refunded": False}
 
     now = _now_iso()
-    new_balance = points
-
-    for attempt in range(_MAX_RETRIES):
-        table, row = _balance_row(db, customer_id, shop_id)
-
-        if row:
-            previous = _balance_ints(row)
-            new_balance = previous["current_balance"] + points
-            new_spent = max(0, previous["total_spent"] - points)
-            result = _cas_update_balance(
-                db,
-                table,
-                customer_id,
-                shop_id,
-                previous,
-                {
-                    "current_balance": new_balance,
-                    "total_spent": new_spent,
-                    "updated_at": now,
-                },
-            )
-            if result.data:
-                break
-        else:
-            try:
-                ins = (
-                    sc.table(table)
-                    .insert({
-                        "customer_id": customer_id,
-                        "shop_id": shop_id,
-                        "total_earned": 0,
-                        "total_spent": 0,
-                        "current_balance": points,
-                        "pending_balance": 0,
-                    })
-                    .execute()
-                )
-                if ins.data:
-                    break
-            except Exception:
-                pass
-
-        if attempt < _MAX_RETRIES - 1:
-            time.sleep(0.05 * (attempt + 1))
-    else:
-        raise RuntimeError(
-            f"Could not refund loyalty points after {_MAX_RETRIES} attempts "
-            f"(concurrent conflict) customer={customer_id} shop={shop_id}"
-        )
+    row = _increment_balance(
+        db,
+        customer_id,
+        shop_id,
+        current=points,
+        spent=-points,
+    )
+    new_balance = int(row.get("current_balance") or 0)
 
     sc.table("points_transactions").update({
         "metadata": {
@@ -7,13 +7,18 @@ Launch flow:
   3. At ready_at, backend marks order completed and sends "ready for pickup" push.
 """
 import logging
-from typing import Optional
+from typing import Dict, List, Optional, Set
 
 import httpx
 
 logger = logging.getLogger(__name__)
 
 EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_PUSH_BATCH_SIZE = 100
+
+
+def _is_expo_token(push_token: Optional[str]) -> bool:
+    return bool(push_token) and push_token.startswith("ExponentPushToken")
 
 
 async def _send_expo_push(
@@ -23,7 +28,7 @@ async def _send_expo_push(
     body: str,
     data: dict,
 ) -> bool:
-    if not push_token or not push_token.startswith("ExponentPushToken"):
+    if not _is_expo_token(push_token):
         return False
 
     payload = {
@@ -54,6 +59,41 @@ async def _send_expo_push(
         return False
 
 
+async def _send_expo_push_batch(messages: List[dict]) -> List[bool]:
+    """
+    Send messages through Expo's batch endpoint, up to EXPO_PUSH_BATCH_SIZE
+    per request. Returns one delivery flag per message, in input order.
+    """
+    results = [False] * len(messages)
+    if not messages:
+        return results
+
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            for start in range(0, len(messages), EXPO_PUSH_BATCH_SIZE):
+                chunk = messages[start:start + EXPO_PUSH_BATCH_SIZE]
+
+                try:
+                    resp = await client.post(EXPO_PUSH_URL, json=chunk)
+                except Exception as e:
+                    logger.warning(f"[Push] batch exception: {e}")
+                    continue
+
+                if resp.status_code != 200:
+                    logger.warning(f"[Push] batch failed {resp.status_code}: {resp.text[:200]}")
+                    continue
+
+                tickets = (resp.json() or {}).get("data") or []
+                for offset, ticket in enumerate(tickets[:len(chunk)]):
+                    results[start + offset] = ticket.get("status") == "ok"
+
+    except Exception as e:
+        logger.warning(f"[Push] batch exception: {e}")
+
+    logger.info(f"[Push] batch sent={sum(results)}/{len(messages)}")
+    return results
+
+
 async def send_order_placed_push(
     push_token: Optional[str],
     shop_name: str,
@@ -93,4 +133,35 @@ async def send_order_ready_push(
             "order_id": order_id,
             "type": "order_ready",
         },
-    )
\ No newline at end of file
+    )
+
+
+async def send_order_ready_pushes(orders: List[Dict[str, Optional[str]]]) -> Set[str]:
+    """
+    Batched 'ready for pickup' pushes for the completion sweeper.
+    Each entry carries order_id, push_token and shop_name.
+    Returns the order ids whose push Expo accepted. Never raises.
+    """
+    deliverable = [o for o in orders if _is_expo_token(o.get("push_token"))]
+
+    messages = [
+        {
+            "to": o["push_token"],
+            "title": "Order ready for pickup! 🎉",
+            "body": f"Your order from {o.get('shop_name') or 'the shop'} should be ready now. Head over and pick it up!",
+            "sound": "default",
+            "data": {
+                "order_id": o.get("order_id") or "",
+                "type": "order_ready",
+            },
+            "badge": 1,
+        }
+        for o in deliverable
+    ]
+
+    results = await _send_expo_push_batch(messages)
+    return {
+        o["order_id"]
+        for o, sent in zip(deliverable, results)
+        if sent and o.get("order_id")
+    }
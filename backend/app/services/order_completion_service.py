@@ -0,0 +1,112 @@
+"""
+Order completion sweeper.
+
+Orders auto-complete once ready_at passes. One sweep is a fixed number of
+round trips regardless of how many orders are due:
+  1. complete_ready_orders RPC claims + completes all due orders in one UPDATE
+  2. one shops.in_() lookup for shop names
+  3. one profiles.in_() lookup for push tokens
+  4. Expo batch pushes (up to 100 messages per request)
+  5. mark_ready_push_sent RPC records delivery in one bulk write
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.services.notification_service import send_order_ready_pushes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWEEP_LIMIT = 100
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _lookup(sc, table: str, column: str, ids: List[str]) -> Dict[str, Optional[str]]:
+    if not ids:
+        return {}
+
+    resp = (
+        sc.table(table)
+        .select(f"id, {column}")
+        .in_("id", ids)
+        .execute()
+    )
+    return {row["id"]: row.get(column) for row in (resp.data or [])}
+
+
+async def complete_ready_orders(
+    db,
+    *,
+    customer_id: Optional[str] = None,
+    limit: int = DEFAULT_SWEEP_LIMIT,
+    now_iso: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Complete every order whose ready_at has passed and send 'ready' pushes.
+    Scoped to one customer when customer_id is given.
+    """
+    sc = db.get_service_client()
+    now_iso = now_iso or _now_iso()
+    # supabase-py is blocking; keep its round trips off the event loop
+    loop = asyncio.get_running_loop()
+
+    completed_rows = (
+        await loop.run_in_executor(
+            None,
+            lambda: sc.rpc(
+                "complete_ready_orders",
+                {
+                    "p_now": now_iso,
+                    "p_customer_id": customer_id,
+                    "p_limit": limit,
+                },
+            ).execute(),
+        )
+    ).data or []
+
+    if not completed_rows:
+        return {"success": True, "completed": 0, "notified": 0}
+
+    notified = 0
+
+    try:
+        shop_ids = sorted({r["shop_id"] for r in completed_rows if r.get("shop_id")})
+        customer_ids = sorted({r["customer_id"] for r in completed_rows if r.get("customer_id")})
+
+        shop_names = await loop.run_in_executor(None, _lookup, sc, "shops", "name", shop_ids)
+        push_tokens = await loop.run_in_executor(None, _lookup, sc, "profiles", "push_token", customer_ids)
+
+        sent_ids = await send_order_ready_pushes([
+            {
+                "order_id": row["id"],
+                "push_token": push_tokens.get(row.get("customer_id")),
+                "shop_name": shop_names.get(row.get("shop_id")) or "the shop",
+            }
+            for row in completed_rows
+        ])
+
+        if sent_ids:
+            await loop.run_in_executor(
+                None,
+                lambda: sc.rpc(
+                    "mark_ready_push_sent",
+                    {
+                        "p_order_ids": sorted(sent_ids),
+                        "p_sent_at": now_iso,
+                    },
+                ).execute(),
+            )
+            notified = len(sent_ids)
+
+    except Exception as e:
+        logger.warning(f"[Orders] ready push batch failed completed={len(completed_rows)}: {e}")
+
+    return {
+        "success": True,
+        "completed": len(completed_rows),
+        "notified": notified,
+    }
@@ -148,7 +148,11 @@ class OrderService:
             order_response = (
                 self.db.get_service_client()
                 .table("orders")
-                .select("*, shops(name, logo_url, address, avg_prep_time_minutes), customer:profiles(full_name, email, avatar_url)")
+                .select(
+                    "*, shops(name, logo_url, address, avg_prep_time_minutes), "
+                    "customer:profiles(full_name, email, avatar_url), "
+                    "order_items(*, menu_items(name, description, base_price, image_url))"
+                )
                 .eq("id", order_id)
                 .single()
                 .execute()
@@ -158,16 +162,7 @@ class OrderService:
                 return None
 
             order = order_response.data
-
-            items_response = (
-                self.db.get_service_client()
-                .table("order_items")
-                .select("*, menu_items(name, description, base_price, image_url)")
-                .eq("order_id", order_id)
-                .execute()
-            )
-
-            order["items"] = items_response.data or []
+            order["items"] = order.pop("order_items", None) or []
             return order
 
         except Exception as e:
@@ -297,10 +292,14 @@ class OrderService:
             return []
 
         try:
+            # Items are embedded, so the whole history is one round trip
             orders_response = (
                 self.db.get_service_client()
                 .table("orders")
-                .select("*, shops(name, logo_url, avg_prep_time_minutes)")
+                .select(
+                    "*, shops(name, logo_url, avg_prep_time_minutes), "
+                    "order_items(*, menu_items(name, description, image_url))"
+                )
                 .eq("customer_id", customer_id)
                 .order("created_at", desc=True)
                 .limit(limit)
@@ -310,14 +309,7 @@ class OrderService:
             orders = orders_response.data or []
 
             for order in orders:
-                items_response = (
-                    self.db.get_service_client()
-                    .table("order_items")
-                    .select("*, menu_items(name, description, image_url)")
-                    .eq("order_id", order["id"])
-                    .execute()
-                )
-                order["items"] = items_response.data or []
+                order["items"] = order.pop("order_items", None) or []
 
             return orders
 
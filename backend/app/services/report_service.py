@@ -0,0 +1,224 @@
+"""
+Background PDF order reports.
+
+Rendering a report is CPU-bound reportlab work, so it never runs on the
+event loop:
+  - orders are fetched page by page in a worker thread (ExportService)
+  - the PDF is rendered in a process pool (render_orders_pdf_file)
+  - callers get a job id right away and poll it until the file is ready
+
+Caching:
+  The job id is a hash of (shop, date range, data version), where the data
+  version is the count and latest updated_at of the shop's orders in the
+  range. Finished PDFs are kept in settings.report_cache_dir as
+  <shop_id>-<job_id>.pdf, so repeat downloads of an unchanged range reuse
+  the file, including across restarts and workers on the same host. Any
+  order change in the range produces a new id and a fresh render.
+
+  Job entries are kept in memory for settings.report_job_ttl_seconds. The
+  cache directory is shared by the workers on a host, so another worker's
+  prune can remove a file this worker still lists as done; such a job is
+  dropped (and reported missing) as soon as its file is found gone.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.export_service import export_service, render_orders_pdf_file
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReportJob:
+    id: str
+    shop_id: str
+    start: Optional[str]
+    end: Optional[str]
+    status: str = "queued"  # queued, running, done, failed
+    orders: Optional[int] = None
+    size_bytes: Optional[int] = None
+    error: Optional[str] = None
+    created_at: str = ""
+    finished_at: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ReportService:
+    """Process-pool PDF rendering with an on-disk cache keyed by data version."""
+
+    def __init__(self, cache_dir: str, workers: int, max_files: int, job_ttl_seconds: int):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_files = max_files
+        self.job_ttl_seconds = job_ttl_seconds
+        self.jobs: Dict[str, ReportJob] = {}
+        self._job_started: Dict[str, float] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def path_for(self, shop_id: str, job_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{shop_id}-{job_id}.pdf")
+
+    @staticmethod
+    def _data_version(client, shop_id: str, start: Optional[str], end: Optional[str]) -> str:
+        """Count and newest updated_at of the range's orders, in one round trip."""
+        query = client.table("orders").select("updated_at", count="exact").eq("shop_id", shop_id)
+        if start:
+            query = query.gte("created_at", start)
+        if end:
+            query = query.lt("created_at", end)
+        response = query.order("updated_at", desc=True).limit(1).execute()
+        latest = response.data[0].get("updated_at") if response.data else ""
+        return f"{response.count or 0}:{latest}"
+
+    @staticmethod
+    def _job_id(shop_id: str, start: Optional[str], end: Optional[str], version: str) -> str:
+        key = f"{shop_id}|{start or ''}|{end or ''}|{version}"
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    async def request_orders_pdf(
+        self,
+        client,
+        shop_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> ReportJob:
+        """Return the cached or in-flight report for this range, or start one."""
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(
+            None, lambda: self._data_version(client, shop_id, start, end)
+        )
+        job_id = self._job_id(shop_id, start, end, version)
+
+        job = self.get_job(shop_id, job_id)
+        if job and job.status != "failed":
+            return job
+
+        job = ReportJob(id=job_id, shop_id=shop_id, start=start, end=end, created_at=_now_iso())
+        self.jobs[job_id] = job
+        self._job_started[job_id] = time.monotonic()
+        self._tasks[job_id] = asyncio.create_task(self._run(job, client), name=f"report-{job_id}")
+        return job
+
+    def get_job(self, shop_id: str, job_id: str) -> Optional[ReportJob]:
+        self._expire_jobs()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            if job.shop_id != shop_id:
+                return None
+            if job.status == "done" and not os.path.exists(self.path_for(shop_id, job_id)):
+                # Pruned by another worker sharing the cache directory
+                self.forget(job_id)
+                return None
+            return job
+
+        # Rendered before a restart or by another worker on this host
+        path = self.path_for(shop_id, job_id)
+        if os.path.exists(path):
+            return ReportJob(
+                id=job_id,
+                shop_id=shop_id,
+                start=None,
+                end=None,
+                status="done",
+                size_bytes=os.path.getsize(path),
+            )
+        return None
+
+    async def _run(self, job: ReportJob, client) -> None:
+        loop = asyncio.get_running_loop()
+        job.status = "running"
+        try:
+            orders = await loop.run_in_executor(None, lambda: self._fetch_orders(client, job))
+            shop_name = orders[0]["shop_name"] if orders else "LoyalCup"
+            job.orders = len(orders)
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            job.size_bytes = await loop.run_in_executor(
+                self._pool(),
+                render_orders_pdf_file,
+                orders,
+                shop_name,
+                self.path_for(job.shop_id, job.id),
+            )
+            job.status = "done"
+            self._prune()
+        except Exception as e:
+            logger.error(f"[Reports] job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = _now_iso()
+            self._tasks.pop(job.id, None)
+
+    def forget(self, job_id: str) -> None:
+        """Drop a job entry (its task, if any, keeps running)"""
+        self.jobs.pop(job_id, None)
+        self._job_started.pop(job_id, None)
+
+    def _expire_jobs(self) -> None:
+        """Drop finished or failed job entries older than job_ttl_seconds"""
+        cutoff = time.monotonic() - self.job_ttl_seconds
+        for job_id in [j for j, started in self._job_started.items() if started < cutoff]:
+            if job_id not in self._tasks:
+                self.forget(job_id)
+
+    @staticmethod
+    def _fetch_orders(client, job: ReportJob):
+        orders = []
+        for page in export_service.iter_shop_order_pages(client, job.shop_id, start=job.start, end=job.end):
+            orders.extend(page)
+        return orders
+
+    def _prune(self) -> None:
+        """Keep at most max_files cached PDFs, dropping the least recently written."""
+        try:
+            files = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if name.endswith(".pdf")
+            ]
+            files.sort(key=os.path.getmtime)
+            for path in files[:-self.max_files] if self.max_files > 0 else files:
+                job_id = os.path.basename(path)[:-len(".pdf")].rsplit("-", 1)[-1]
+                if job_id in self._tasks:
+                    continue
+                os.remove(path)
+                self.forget(job_id)
+        except OSError as e:
+            logger.warning(f"[Reports] cache prune failed: {e}")
+
+    def shutdown(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+report_service = ReportService(
+    cache_dir=settings.report_cache_dir,
+    workers=settings.report_workers,
+    max_files=settings.report_cache_max_files,
+    job_ttl_seconds=settings.report_job_ttl_seconds,
+)
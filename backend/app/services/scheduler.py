@@ -0,0 +1,285 @@
+"""
+Background sweepers — order auto-completion and pending point release.
+
+Runs inside the API process, replacing client/cron-triggered sweeps:
+  - order_completion: completes confirmed/pending orders once ready_at passes
+  - points_release:   moves pending points into current_balance once available_at passes
+
+Leader election:
+  Every worker starts a scheduler, but only the holder of the
+  'sweepers' lease (try_acquire_scheduler_lease RPC) runs jobs. The leader
+  renews the lease each loop; followers retry until it expires.
+
+Timing:
+  Each job keeps its next due timestamp (next_sweep_deadlines RPC). The loop
+  sleeps until the earliest deadline, so sweeps fire when an order becomes
+  ready rather than on the next poll. Deadlines are re-read at least every
+  scheduler_poll_seconds to pick up newly placed orders and awards.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.services import order_completion_service
+from app.services.loyalty_service import release_available_points
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "sweepers"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _parse_ts(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
+@dataclass
+class JobMetrics:
+    runs: int = 0
+    errors: int = 0
+    total_processed: int = 0
+    last_batch_size: int = 0
+    max_batch_size: int = 0
+    last_lag_seconds: Optional[float] = None
+    max_lag_seconds: float = 0.0
+    last_run_at: Optional[str] = None
+    last_error: Optional[str] = None
+
+    def record(self, processed: int, lag_seconds: Optional[float]) -> None:
+        self.runs += 1
+        self.total_processed += processed
+        self.last_batch_size = processed
+        self.max_batch_size = max(self.max_batch_size, processed)
+        self.last_run_at = _now().isoformat()
+        if lag_seconds is not None:
+            self.last_lag_seconds = round(lag_seconds, 3)
+            self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+
+
+@dataclass
+class SweepJob:
+    name: str
+    deadline_column: str
+    run: Callable[[Any, int], Awaitable[int]]
+    next_due: Optional[datetime] = None
+    # Set when a run found due rows but processed none (locked, zero-amount,
+    # ...). Deadlines at or before it are deferred by one poll interval so a
+    # stuck row cannot spin the loop.
+    stalled_at: Optional[datetime] = None
+    metrics: JobMetrics = field(default_factory=JobMetrics)
+
+
+async def _run_order_completion(db, limit: int) -> int:
+    result = await order_completion_service.complete_ready_orders(db, limit=limit)
+    return int(result.get("completed") or 0)
+
+
+async def _run_points_release(db, limit: int) -> int:
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, lambda: release_available_points(db, limit=limit))
+    return int(result.get("released_transactions") or 0)
+
+
+class SweepScheduler:
+    """Lease-guarded, deadline-driven runner for the background sweep jobs."""
+
+    def __init__(self, db, *, poll_seconds: float, lease_seconds: int, batch_size: int):
+        self.db = db
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.jobs: Dict[str, SweepJob] = {
+            "order_completion": SweepJob("order_completion", "next_ready_at", _run_order_completion),
+            "points_release": SweepJob("points_release", "next_available_at", _run_points_release),
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._deadlines_read_at: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="sweep-scheduler")
+            logger.info(f"[Scheduler] started holder={self.holder}")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self.is_leader:
+            try:
+                self.db.get_service_client().rpc(
+                    "release_scheduler_lease",
+                    {"p_name": LEASE_NAME, "p_holder": self.holder},
+                ).execute()
+            except Exception as e:
+                logger.warning(f"[Scheduler] lease release failed: {e}")
+            self.is_leader = False
+
+        logger.info("[Scheduler] stopped")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "jobs": {
+                name: {
+                    "next_due": job.next_due.isoformat() if job.next_due else None,
+                    **job.metrics.__dict__,
+                }
+                for name, job in self.jobs.items()
+            },
+        }
+
+    def _acquire_lease(self) -> bool:
+        try:
+            resp = self.db.get_service_client().rpc(
+                "try_acquire_scheduler_lease",
+                {
+                    "p_name": LEASE_NAME,
+                    "p_holder": self.holder,
+                    "p_ttl_seconds": self.lease_seconds,
+                },
+            ).execute()
+            acquired = resp.data is True
+        except Exception as e:
+            logger.warning(f"[Scheduler] lease check failed: {e}")
+            acquired = False
+
+        if acquired != self.is_leader:
+            logger.info(f"[Scheduler] {'acquired' if acquired else 'lost'} leadership holder={self.holder}")
+        self.is_leader = acquired
+        return acquired
+
+    def _read_deadlines(self) -> None:
+        resp = self.db.get_service_client().rpc("next_sweep_deadlines", {}).execute()
+        row = (resp.data or [{}])[0]
+        for job in self.jobs.values():
+            due = _parse_ts(row.get(job.deadline_column))
+            if due is not None and job.stalled_at is not None and due <= job.stalled_at:
+                due = job.stalled_at + timedelta(seconds=self.poll_seconds)
+            job.next_due = due
+        self._deadlines_read_at = _now()
+
+    async def _run_job(self, job: SweepJob, now: datetime) -> None:
+        lag = (now - job.next_due).total_seconds() if job.next_due else None
+        try:
+            processed = await job.run(self.db, self.batch_size)
+        except Exception as e:
+            job.metrics.errors += 1
+            job.metrics.last_error = str(e)[:200]
+            logger.warning(f"[Scheduler] {job.name} failed: {e}")
+            job.stalled_at = now
+            job.next_due = now + timedelta(seconds=self.poll_seconds)
+            return
+
+        job.metrics.record(processed, lag)
+        job.stalled_at = None if processed else now
+        if processed:
+            logger.info(f"[Scheduler] {job.name} processed={processed} lag={lag if lag is None else round(lag, 3)}s")
+
+        # A full batch means more rows are already due; run again immediately.
+        job.next_due = now if processed >= self.batch_size else None
+        if job.next_due is None:
+            self._deadlines_read_at = None
+
+    def _sleep_seconds(self, now: datetime) -> float:
+        wait = self.poll_seconds
+        if self._deadlines_read_at is not None:
+            since_read = (now - self._deadlines_read_at).total_seconds()
+            wait = max(0.0, self.poll_seconds - since_read)
+
+        for job in self.jobs.values():
+            if job.next_due is not None:
+                wait = min(wait, max(0.0, (job.next_due - now).total_seconds()))
+
+        # Renew the lease well before it can expire.
+        return min(wait, self.lease_seconds / 3)
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Lease and deadline RPCs are blocking supabase-py calls
+                if await loop.run_in_executor(None, self._acquire_lease):
+                    now = _now()
+                    stale = (
+                        self._deadlines_read_at is None
+                        or (now - self._deadlines_read_at).total_seconds() >= self.poll_seconds
+                    )
+                    if stale:
+                        await loop.run_in_executor(None, self._read_deadlines)
+
+                    for job in self.jobs.values():
+                        if job.next_due is not None and job.next_due <= now:
+                            await self._run_job(job, now)
+
+                    if self._deadlines_read_at is None:
+                        await loop.run_in_executor(None, self._read_deadlines)
+
+                    sleep_for = self._sleep_seconds(_now())
+                else:
+                    sleep_for = self.lease_seconds / 3
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[Scheduler] loop error: {e}")
+                self._deadlines_read_at = None
+                sleep_for = self.poll_seconds
+
+            await asyncio.sleep(sleep_for)
+
+
+_scheduler: Optional[SweepScheduler] = None
+
+
+def get_scheduler() -> Optional[SweepScheduler]:
+    return _scheduler
+
+
+def start_scheduler(db) -> Optional[SweepScheduler]:
+    global _scheduler
+
+    if not settings.scheduler_enabled:
+        logger.info("[Scheduler] disabled by SCHEDULER_ENABLED")
+        return None
+
+    if _scheduler is None:
+        _scheduler = SweepScheduler(
+            db,
+            poll_seconds=settings.scheduler_poll_seconds,
+            lease_seconds=settings.scheduler_lease_seconds,
+            batch_size=settings.scheduler_batch_size,
+        )
+    _scheduler.start()
+    return _scheduler
+
+
+async def stop_scheduler() -> None:
+    global _scheduler
+
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
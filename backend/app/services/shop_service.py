@@ -13,6 +13,9 @@ from datetime import datetime
 import math
 
 
+TOP_ITEMS_WINDOWS = ("7d", "30d", "all")
+TOP_ITEMS_MAX_AGE_SECONDS = 300
+
 PUBLIC_SHOP_FIELDS = (
     "id, name, description, logo_url, banner_url, address, city, state, "
     "lat, lng, phone, hours, color, status, featured, website, zip, "
@@ -768,7 +771,7 @@ class ShopService:
         )
         return storage.from_(bucket).get_public_url(path)
     
-    async def get_shop_analytics(self, shop_id: str) -> Dict[str, Any]:
+    async def get_shop_analytics(self, shop_id: str, top_items_window: str = "all") -> Dict[str, Any]:
         """Get shop analytics (orders, revenue, etc.)"""
         if not self.db:
             return {
@@ -781,41 +784,26 @@ class ShopService:
             }
         
         try:
-            orders_response = (
-                self._client()
-                .table("orders")
-                .select("total")
-                .eq("shop_id", shop_id)
-                .eq("status", "completed")
-                .execute()
-            )
-            
-            orders = orders_response.data or []
-            total_orders = len(orders)
-            total_revenue = sum(float(order.get("total", 0)) for order in orders)
-            avg_order_value = total_revenue / total_orders if total_orders > 0 else 0.0
-            
+            # Aggregated in Postgres (get_shop_analytics_summary); one row comes back
             today = datetime.now().date().isoformat()
-            today_response = (
+            summary_response = (
                 self._client()
-                .table("orders")
-                .select("total")
-                .eq("shop_id", shop_id)
-                .gte("created_at", today)
+                .rpc(
+                    "get_shop_analytics_summary",
+                    {"p_shop_id": shop_id, "p_day_start": today},
+                )
                 .execute()
             )
             
-            today_orders = today_response.data or []
-            orders_today = len(today_orders)
-            revenue_today = sum(float(order.get("total", 0)) for order in today_orders)
+            summary = (summary_response.data or [{}])[0]
             
             return {
-                "total_orders": total_orders,
-                "total_revenue": total_revenue,
-                "orders_today": orders_today,
-                "revenue_today": revenue_today,
-                "avg_order_value": avg_order_value,
-                "top_items": await self._get_top_items(shop_id)
+                "total_orders": int(summary.get("total_orders") or 0),
+                "total_revenue": float(summary.get("total_revenue") or 0),
+                "orders_today": int(summary.get("orders_today") or 0),
+                "revenue_today": float(summary.get("revenue_today") or 0),
+                "avg_order_value": float(summary.get("avg_order_value") or 0),
+                "top_items": await self._get_top_items(shop_id, window=top_items_window)
             }
         except Exception as e:
             print(f"Error getting analytics for shop {shop_id}: {e}")
@@ -828,6 +816,79 @@ class ShopService:
                 "top_items": []
             }
     
+    async def get_shop_daily_stats(self, shop_id: str, start_date: str, end_date: str) -> Dict[str, Any]:
+        """
+        Per-day analytics for a date range (inclusive, UTC days) from the
+        trigger-maintained shop_daily_rollups table, plus range totals.
+        Never scans orders; cost is one row per day in the range.
+        """
+        empty_totals = {
+            "orders": 0,
+            "revenue": 0.0,
+            "completed_orders": 0,
+            "completed_revenue": 0.0,
+            "customer_days": 0,
+            "items_sold": 0,
+            "avg_order_value": 0.0,
+            "avg_prep_time_minutes": None,
+        }
+        if not self.db:
+            return {"start_date": start_date, "end_date": end_date, "days": [], "totals": empty_totals}
+        
+        response = (
+            self._client()
+            .table("shop_daily_rollups")
+            .select(
+                "day, orders, revenue, completed_orders, completed_revenue, "
+                "customers, items_sold, prep_seconds_total, prep_samples"
+            )
+            .eq("shop_id", shop_id)
+            .gte("day", start_date)
+            .lte("day", end_date)
+            .order("day")
+            .execute()
+        )
+        
+        days = []
+        totals = dict(empty_totals)
+        prep_seconds = 0.0
+        prep_samples = 0
+        
+        for row in response.data or []:
+            orders = int(row.get("orders") or 0)
+            revenue = float(row.get("revenue") or 0)
+            samples = int(row.get("prep_samples") or 0)
+            seconds = float(row.get("prep_seconds_total") or 0)
+            
+            days.append({
+                "day": row.get("day"),
+                "orders": orders,
+                "revenue": revenue,
+                "completed_orders": int(row.get("completed_orders") or 0),
+                "completed_revenue": float(row.get("completed_revenue") or 0),
+                "customers": int(row.get("customers") or 0),
+                "items_sold": int(row.get("items_sold") or 0),
+                "avg_order_value": round(revenue / orders, 2) if orders else 0.0,
+                "avg_prep_time_minutes": round(seconds / samples / 60, 1) if samples else None,
+            })
+            
+            totals["orders"] += orders
+            totals["revenue"] += revenue
+            totals["completed_orders"] += days[-1]["completed_orders"]
+            totals["completed_revenue"] += days[-1]["completed_revenue"]
+            # Distinct per day; a customer returning on two days counts twice
+            totals["customer_days"] += days[-1]["customers"]
+            totals["items_sold"] += days[-1]["items_sold"]
+            prep_seconds += seconds
+            prep_samples += samples
+        
+        if totals["orders"]:
+            totals["avg_order_value"] = round(totals["revenue"] / totals["orders"], 2)
+        if prep_samples:
+            totals["avg_prep_time_minutes"] = round(prep_seconds / prep_samples / 60, 1)
+        
+        return {"start_date": start_date, "end_date": end_date, "days": days, "totals": totals}
+    
     # ============================================================================
     # MENU CATEGORY OPERATIONS
     # ============================================================================
@@ -1613,19 +1674,28 @@ class ShopService:
     # HELPER METHODS
     # ============================================================================
     
-    async def _get_top_items(self, shop_id: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Get top selling items for a shop using the popular_menu_items view"""
+    async def _get_top_items(self, shop_id: str, limit: int = 5, window: str = "all") -> List[Dict[str, Any]]:
+        """
+        Get top selling items for a shop from the precomputed shop_top_items
+        rankings (window: 7d, 30d or all). The RPC recomputes a shop's
+        rankings from its item sales rollups when they are older than
+        TOP_ITEMS_MAX_AGE_SECONDS.
+        """
         if not self.db:
             return []
         
         try:
             response = (
                 self._client()
-                .table("popular_menu_items")
-                .select("*")
-                .eq("shop_id", shop_id)
-                .order("order_count", desc=True)
-                .limit(limit)
+                .rpc(
+                    "get_shop_top_items",
+                    {
+                        "p_shop_id": shop_id,
+                        "p_window": window,
+                        "p_limit": limit,
+                        "p_max_age_seconds": TOP_ITEMS_MAX_AGE_SECONDS,
+                    },
+                )
                 .execute()
             )
             return response.data or []
@@ -0,0 +1,94 @@
+# backend/benchmarks/bench_order_history.py
+"""
+Order history: per-order item queries (N+1) vs embedded order_items select.
+
+For each history size in SIZES, fetches a customer's latest orders the old
+way (orders query, then one order_items query per order) and the way
+OrderService.get_order_history does now (orders with embedded
+order_items(*, menu_items(...)) in one request), REPEATS times each, and
+prints p50/p95 latency and round trips.
+
+The customer should have at least max(SIZES) orders for the larger sizes
+to be meaningful.
+
+Usage (from backend/, with the usual .env):
+    python benchmarks/bench_order_history.py <customer_id>
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.database import get_supabase
+
+SIZES = (20, 50, 100)
+REPEATS = int(os.getenv("BENCH_REPEATS", "10"))
+
+def n_plus_one(sc, customer_id: str, limit: int) -> int:
+    orders = (
+        sc.table("orders")
+        .select("*, shops(name, logo_url, avg_prep_time_minutes)")
+        .eq("customer_id", customer_id)
+        .order("created_at", desc=True)
+        .limit(limit)
+        .execute()
+        .data
+        or []
+    )
+    for order in orders:
+        order["items"] = (
+            sc.table("order_items")
+            .select("*, menu_items(name, description, image_url)")
+            .eq("order_id", order["id"])
+            .execute()
+            .data
+            or []
+        )
+    return 1 + len(orders)
+
+def embedded(sc, customer_id: str, limit: int) -> int:
+    orders = (
+        sc.table("orders")
+        .select(
+            "*, shops(name, logo_url, avg_prep_time_minutes), "
+            "order_items(*, menu_items(name, description, image_url))"
+        )
+        .eq("customer_id", customer_id)
+        .order("created_at", desc=True)
+        .limit(limit)
+        .execute()
+        .data
+        or []
+    )
+    for order in orders:
+        order["items"] = order.pop("order_items", None) or []
+    return 1
+
+def run(label: str, fn, sc, customer_id: str, limit: int):
+    fn(sc, customer_id, limit)  # warm up
+    latencies = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        round_trips = fn(sc, customer_id, limit)
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000
+    print(f"  {label:<10} round_trips={round_trips:4d}   p50={p50:8.1f}ms   p95={p95:8.1f}ms")
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    customer_id = sys.argv[1]
+    sc = get_supabase().get_service_client()
+
+    for limit in SIZES:
+        print(f"orders={limit}")
+        run("n+1", n_plus_one, sc, customer_id, limit)
+        run("embedded", embedded, sc, customer_id, limit)
+
+if __name__ == "__main__":
+    main()
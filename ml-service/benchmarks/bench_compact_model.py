@@ -0,0 +1,91 @@
+# ml-service/benchmarks/bench_compact_model.py
+"""
+joblib RandomForestRegressor vs compact .npz forest.
+
+Fits a forest like training.fit_shop_model on synthetic features, saves it
+both ways, then compares file size, cold load time, RSS growth per load and
+predict latency (single order and a 50-order batch). Also checks the
+compact predictor matches sklearn.
+
+Usage:
+    python benchmarks/bench_compact_model.py [rows]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compact_model import CompactForest  # noqa: E402
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def measure_load(load, repeat: int = 5):
+    """Best load time and RSS growth of keeping one loaded copy"""
+    t, _ = timed(load, repeat)
+    gc.collect()
+    before = rss_bytes()
+    model = load()
+    grown = rss_bytes() - before
+    return t, grown, model
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = np.random.default_rng(7)
+    X = rng.uniform(0, 10, (n, 16))
+    y = 60 + 45 * X[:, 0] * X[:, 1] / 5 + 30 * X[:, 3] + rng.normal(0, 30, n)
+
+    model = RandomForestRegressor(n_estimators=100, max_depth=10, min_samples_split=5, random_state=42)
+    model.fit(X, y)
+    compact = CompactForest.from_sklearn(model)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        joblib_path = os.path.join(tmp, "model.joblib")
+        npz_path = os.path.join(tmp, "model.npz")
+        joblib.dump(model, joblib_path)
+        compact.save(npz_path)
+
+        t_joblib, rss_joblib, loaded_joblib = measure_load(lambda: joblib.load(joblib_path))
+        t_npz, rss_npz, loaded_npz = measure_load(lambda: CompactForest.load(npz_path))
+
+        size_joblib = os.path.getsize(joblib_path)
+        size_npz = os.path.getsize(npz_path)
+
+    X_check = rng.uniform(0, 10, (2000, 16))
+    diff = np.max(np.abs(loaded_npz.predict(X_check) - loaded_joblib.predict(X_check)))
+    assert diff < 1e-6, f"compact predictions differ by {diff}"
+
+    one = X_check[:1]
+    batch = X_check[:50]
+    t1_joblib, _ = timed(lambda: loaded_joblib.predict(one), 200)
+    t1_npz, _ = timed(lambda: loaded_npz.predict(one), 200)
+    t50_joblib, _ = timed(lambda: loaded_joblib.predict(batch), 50)
+    t50_npz, _ = timed(lambda: loaded_npz.predict(batch), 50)
+
+    mb = 1024 * 1024
+    print(f"rows={n} trees=100 max_abs_diff={diff:.2e}")
+    print(f"{'':14}{'file MB':>10}{'load ms':>10}{'RSS MB':>10}{'1 pred ms':>12}{'50 pred ms':>12}")
+    print(f"{'joblib':14}{size_joblib / mb:10.2f}{t_joblib * 1000:10.1f}{rss_joblib / mb:10.2f}"
+          f"{t1_joblib * 1000:12.3f}{t50_joblib * 1000:12.3f}")
+    print(f"{'compact npz':14}{size_npz / mb:10.2f}{t_npz * 1000:10.1f}{rss_npz / mb:10.2f}"
+          f"{t1_npz * 1000:12.3f}{t50_npz * 1000:12.3f}")
+
+if __name__ == "__main__":
+    main()
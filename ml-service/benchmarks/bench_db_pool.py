@@ -0,0 +1,77 @@
+# ml-service/benchmarks/bench_db_pool.py
+"""
+Connection-per-request vs application pool throughput.
+
+Runs the same per-request query the service issues (order_timing_data count
+for a shop) REQUESTS times with CONCURRENCY in flight, first opening a fresh
+asyncpg connection per request (old get_db_connection), then acquiring from
+a pool configured like the service (DB_POOL_* env vars).
+
+Usage:
+    DATABASE_URL=postgres://... python benchmarks/bench_db_pool.py [shop_id]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import asyncpg
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "500"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "20"))
+POOL_MIN = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+
+QUERY = """
+    SELECT COUNT(*)
+    FROM order_timing_data
+    WHERE shop_id = $1
+      AND total_duration IS NOT NULL
+      AND time_placed > NOW() - INTERVAL '90 days'
+"""
+
+async def run(label: str, handler, shop_id: str):
+    sem = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+    
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            await handler(shop_id)
+            latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<24} {REQUESTS / elapsed:8.1f} req/s   p50={p50:6.1f}ms   p99={p99:6.1f}ms")
+
+async def main():
+    shop_id = sys.argv[1] if len(sys.argv) > 1 else "00000000-0000-0000-0000-000000000000"
+    
+    async def connect_per_request(sid):
+        conn = await asyncpg.connect(DATABASE_URL)
+        try:
+            await conn.fetchval(QUERY, sid)
+        finally:
+            await conn.close()
+    
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=POOL_MIN, max_size=POOL_MAX)
+    
+    async def pooled(sid):
+        async with pool.acquire(timeout=5) as conn:
+            await conn.fetchval(QUERY, sid)
+    
+    print(f"requests={REQUESTS} concurrency={CONCURRENCY} pool={POOL_MIN}..{POOL_MAX}")
+    try:
+        await run("connect per request", connect_per_request, shop_id)
+        await run("pooled", pooled, shop_id)
+    finally:
+        await pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
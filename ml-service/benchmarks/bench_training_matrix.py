@@ -0,0 +1,89 @@
+# ml-service/benchmarks/bench_training_matrix.py
+"""
+Row-by-row vs vectorized training-matrix construction.
+
+Generates ROWS synthetic order_timing_data rows (default 100k, one shop)
+and times the previous per-row builder (feature dict + features_to_array
+per row) against main.build_training_set. Also checks both produce the
+same matrix.
+
+Usage:
+    python benchmarks/bench_training_matrix.py [rows]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import build_training_set, features_to_array  # noqa: E402
+
+def synthetic_rows(n: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    items = rng.integers(1, 8, n)
+    score = rng.uniform(0.3, 2.5, n)
+    hour = rng.integers(5, 21, n)
+    day = rng.integers(0, 7, n)
+    rush = ((hour >= 7) & (hour <= 9)) | ((hour >= 11) & (hour <= 13))
+    queue = rng.integers(0, 12, n)
+    staff = rng.integers(1, 5, n)
+    duration = rng.integers(90, 1500, n)
+    # Same column order / types fetch_training_rows returns
+    return [
+        (float(a), float(b), float(c), float(d), float(e), float(f), float(g), float(h))
+        for a, b, c, d, e, f, g, h in zip(items, score, hour, day, rush, queue, staff, duration)
+    ]
+
+def build_training_set_rowwise(rows):
+    """The pre-vectorization builder, kept here only for comparison"""
+    X = []
+    y = []
+    for total_items, score, hour, day, rush, queue, staff, duration in rows:
+        features = {
+            'total_items': total_items,
+            'avg_complexity': score or 1.0,
+            'total_complexity': score * total_items or total_items,
+            'queue_length': queue or 0,
+            'staff_count': staff or 2,
+            'items_per_staff': total_items / max(staff or 2, 1),
+            'hour_of_day': hour,
+            'day_of_week': day,
+            'is_morning_rush': 1 if 7 <= hour <= 9 else 0,
+            'is_lunch_rush': 1 if 11 <= hour <= 13 else 0,
+            'is_afternoon_rush': 1 if 15 <= hour <= 17 else 0,
+            'is_rush_hour': 1 if rush else 0,
+            'has_espresso': 0,
+            'has_blended': 0,
+            'espresso_count': 0,
+            'blended_count': 0,
+        }
+        X.append(features_to_array(features)[0])
+        y.append(duration)
+    return np.array(X), np.array(y)
+
+def timed(fn, rows, repeat: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = synthetic_rows(n)
+    
+    t_old, (X_old, y_old) = timed(build_training_set_rowwise, rows)
+    t_new, (X_new, y_new) = timed(build_training_set, rows)
+    
+    assert np.allclose(X_old, X_new) and np.allclose(y_old, y_new), "builders disagree"
+    
+    print(f"rows={n}")
+    print(f"row-by-row   {t_old * 1000:9.1f} ms")
+    print(f"vectorized   {t_new * 1000:9.1f} ms   ({t_old / t_new:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# ml-service/compact_model.py
+"""
+Compact forest format: a trained RandomForestRegressor flattened into a few
+NumPy arrays and saved as an uncompressed .npz.
+
+All trees share one set of node arrays (feature, threshold, left, right,
+value); children are global node indices and -1 marks a leaf. `roots` holds
+each tree's first node. Prediction walks every (sample, tree) pair one level
+per step with fancy indexing, so the Python loop runs max_depth times
+regardless of batch size or tree count.
+
+The .npz is written uncompressed (ZIP_STORED), so load(mmap_mode='r') can
+map each member's bytes straight out of the archive and worker processes
+share the pages, like joblib's mmap_mode for the sklearn models.
+"""
+import os
+import struct
+import zipfile
+from typing import Callable, Optional
+
+import numpy as np
+
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+
+class CompactForest:
+    """Array-only forest regressor with the same predict() as sklearn"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth: int):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompactForest":
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, -1, tree.children_left + offset))
+            rights.append(np.where(is_leaf, -1, tree.children_right + offset))
+            values.append(tree.value[:, 0, 0])
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+        )
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = None) -> "CompactForest":
+        if mmap_mode is not None:
+            arrays = _memmap_npz(path, ARRAY_NAMES, mmap_mode)
+            with np.load(path) as data:
+                max_depth = int(data["max_depth"])
+            return cls(max_depth=max_depth, **arrays)
+
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in ARRAY_NAMES}
+            max_depth = int(data["max_depth"])
+        return cls(max_depth=max_depth, **arrays)
+
+    def save(self, path: str):
+        # np.savez appends .npz to bare names; write through a file object
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                max_depth=np.int32(self.max_depth),
+                **{name: getattr(self, name) for name in ARRAY_NAMES},
+            )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES)
+
+    def predict(self, X) -> np.ndarray:
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_samples = X.shape[0]
+        rows = np.arange(n_samples)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_samples, len(self.roots))).copy()
+
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            internal = left != -1
+            if not internal.any():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(internal, np.where(go_left, left, self.right[nodes]), nodes)
+
+        return self.value[nodes].mean(axis=1)
+
+def _memmap_npz(path: str, names, mmap_mode: str) -> dict:
+    """
+    Memory-map members of an uncompressed .npz (np.load ignores mmap_mode
+    for archives). Each member is a stored .npy file: skip its zip local
+    header and .npy header, then map the raw array data in place.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for name in names:
+            info = archive.getinfo(f"{name}.npy")
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {name} is compressed and cannot be memory-mapped")
+
+            # Local file header: 30 fixed bytes, then file name and extra field
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_len, extra_len = struct.unpack("<HH", local_header[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            arrays[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode=mmap_mode,
+                offset=f.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+def export_compact(model, path: str, X_check: np.ndarray, atomic_write: Callable) -> dict:
+    """
+    Flatten a fitted forest to `path` after checking it reproduces the
+    sklearn predictions on X_check. Returns metadata fields; on a mismatch
+    nothing is written and the joblib model stays authoritative.
+    """
+    compact = CompactForest.from_sklearn(model)
+    max_abs_diff = float(np.max(np.abs(compact.predict(X_check) - model.predict(X_check)))) if len(X_check) else 0.0
+
+    if max_abs_diff > 1e-6:
+        if os.path.exists(path):
+            os.remove(path)
+        return {"compact_format": False, "compact_max_abs_diff": max_abs_diff}
+
+    atomic_write(path, compact.save)
+    return {
+        "compact_format": True,
+        "compact_bytes": compact.nbytes,
+        "compact_max_abs_diff": max_abs_diff,
+    }
@@ -0,0 +1,88 @@
+# ml-service/complexity_cache.py
+"""
+In-memory copy of the item_complexity table.
+
+All shops' rows are loaded with one query into {shop_id: {normalized name:
+(complexity_score, base_prep_time_seconds)}} and swapped in atomically, so
+feature computation never queries the database. A background task reloads
+the table every refresh_seconds; refresh() can also be triggered directly
+after menu changes.
+"""
+import asyncio
+from typing import Callable, Dict, Optional, Tuple
+
+ItemComplexity = Tuple[float, int]
+
+def normalize_item_name(name: str) -> str:
+    return " ".join(name.lower().split())
+
+class ComplexityCache:
+    """Per-shop item complexity lookups refreshed in bulk"""
+
+    def __init__(self, acquire: Callable, refresh_seconds: float):
+        self.acquire = acquire
+        self.refresh_seconds = refresh_seconds
+        self.tables: Dict[str, Dict[str, ItemComplexity]] = {}
+        self.loaded_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def lookup(self, shop_id: str, item_name: str) -> Optional[ItemComplexity]:
+        table = self.tables.get(shop_id)
+        if not table:
+            return None
+        return table.get(normalize_item_name(item_name))
+
+    async def refresh(self) -> int:
+        async with self.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT shop_id::text, item_name, complexity_score, base_prep_time_seconds
+                FROM item_complexity
+                """
+            )
+
+        tables: Dict[str, Dict[str, ItemComplexity]] = {}
+        for r in rows:
+            if not r['item_name']:
+                continue
+            tables.setdefault(r['shop_id'], {})[normalize_item_name(r['item_name'])] = (
+                float(r['complexity_score'] if r['complexity_score'] is not None else 1.0),
+                int(r['base_prep_time_seconds'] if r['base_prep_time_seconds'] is not None else 60),
+            )
+
+        self.tables = tables
+        self.loaded_at = asyncio.get_running_loop().time()
+        self.last_error = None
+        return len(rows)
+
+    def start(self):
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the previous tables until the next attempt
+                self.last_error = str(e)
+                print(f"⚠️ Item complexity refresh failed: {e}")
+
+    def stats(self) -> dict:
+        age = None
+        if self.loaded_at is not None:
+            age = round(asyncio.get_running_loop().time() - self.loaded_at, 1)
+        return {
+            "shops": len(self.tables),
+            "items": sum(len(table) for table in self.tables.values()),
+            "age_seconds": age,
+            "refresh_seconds": self.refresh_seconds,
+            "last_error": self.last_error,
+        }
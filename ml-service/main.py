@@ -1,17 +1,18 @@
 # ml-service/main.py
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
-import joblib
 import numpy as np
+import asyncio
 from datetime import datetime, timedelta
 import asyncpg
 import os
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error, mean_squared_error
-import json
+
+from complexity_cache import ComplexityCache
+from model_cache import ModelCache
+from online import ResidualCorrector
+from training import GLOBAL_MODEL_KEY, ModelRegistry, TrainingService, feature_schema_hash
 
 app = FastAPI(title="LoyalCup ML Service", version="1.0.0")
 
@@ -24,11 +25,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database connection
+# Database connection pool (created on startup, shared for the app lifetime)
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+DB_POOL: Optional[asyncpg.Pool] = None
+
+# Loaded models: LRU bounded by estimated bytes, evicted models reload lazily from disk
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Set MODEL_MMAP=true to memory-map model arrays so workers share their pages
+MODEL_MMAP_MODE = "r" if os.getenv("MODEL_MMAP", "false").lower() == "true" else None
+MODEL_CACHE = ModelCache(MODEL_CACHE_MAX_BYTES)
+
+# Training (see training.py): process-pool fits, job queue, model registry
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", "2"))
+# Split cores between pool workers so concurrent fits don't oversubscribe
+TRAINING_N_JOBS = int(os.getenv("TRAINING_N_JOBS", str(max(1, (os.cpu_count() or 1) // TRAINING_WORKERS))))
+INSUFFICIENT_DATA_TTL_SECONDS = int(os.getenv("INSUFFICIENT_DATA_TTL_SECONDS", "3600"))
+# Back-off after a failed fit before prediction misses queue another one
+TRAINING_FAILURE_TTL_SECONDS = int(os.getenv("TRAINING_FAILURE_TTL_SECONDS", "300"))
+MIN_TRAINING_ROWS = 50
+TRAINING_ROW_LIMIT = int(os.getenv("TRAINING_ROW_LIMIT", "1000"))
+
+FEATURE_ORDER = [
+    'total_items', 'avg_complexity', 'total_complexity',
+    'queue_length', 'staff_count', 'items_per_staff',
+    'hour_of_day', 'day_of_week',
+    'is_morning_rush', 'is_lunch_rush', 'is_afternoon_rush', 'is_rush_hour',
+    'has_espresso', 'has_blended', 'espresso_count', 'blended_count'
+]
+
+# Global multi-shop model: per-order features plus the shop's aggregate profile
+SHOP_PROFILE_ORDER = ['shop_mean_duration', 'shop_order_count', 'shop_menu_complexity']
+GLOBAL_FEATURE_ORDER = FEATURE_ORDER + SHOP_PROFILE_ORDER
+GLOBAL_TRAINING_ROW_LIMIT = int(os.getenv("GLOBAL_TRAINING_ROW_LIMIT", "200000"))
+# Weight of the global model when a shop also has its own model (0 = shop model only)
+GLOBAL_BLEND_WEIGHT = min(max(float(os.getenv("GLOBAL_BLEND_WEIGHT", "0")), 0.0), 1.0)
 
-# Global model cache
-MODEL_CACHE = {}
+# Online updates: completed orders nudge predictions between full retrains (see online.py)
+ONLINE_HALF_LIFE_SECONDS = float(os.getenv("ONLINE_HALF_LIFE_SECONDS", "900"))
+ONLINE_PRIOR_WEIGHT = float(os.getenv("ONLINE_PRIOR_WEIGHT", "5"))
+ONLINE_MAX_CORRECTION_SECONDS = float(os.getenv("ONLINE_MAX_CORRECTION_SECONDS", "600"))
+# Queue a full retrain after this many completed orders since the last fit
+ONLINE_RETRAIN_EVERY = int(os.getenv("ONLINE_RETRAIN_EVERY", "200"))
+ONLINE = ResidualCorrector(ONLINE_HALF_LIFE_SECONDS, ONLINE_PRIOR_WEIGHT, ONLINE_MAX_CORRECTION_SECONDS)
+COMPLETIONS_SINCE_FIT = {}
+# Prediction method each shop's online correction was measured against
+ONLINE_METHODS = {}
+
+# item_complexity table held in memory (see complexity_cache.py)
+COMPLEXITY_REFRESH_SECONDS = float(os.getenv("COMPLEXITY_REFRESH_SECONDS", "300"))
+COMPLEXITY: Optional[ComplexityCache] = None
+
+# Fallback complexity by category for items missing from item_complexity
+CATEGORY_COMPLEXITY = {
+    'espresso': 1.5,
+    'coffee': 0.8,
+    'cold_brew': 1.0,
+    'blended': 2.5,
+    'pastry': 0.3,
+    'food': 2.0
+}
+
+MAX_BATCH_PREDICTIONS = int(os.getenv("MAX_BATCH_PREDICTIONS", "500"))
+
+REGISTRY = ModelRegistry(
+    MODEL_DIR,
+    feature_schema_hash(FEATURE_ORDER),
+    feature_schema_hash(GLOBAL_FEATURE_ORDER),
+)
+TRAINING: Optional[TrainingService] = None
 
 # ==================== MODELS ====================
 
@@ -50,14 +120,40 @@ class PredictionResponse(BaseModel):
     confidence_score: float
     breakdown: dict
 
+class BatchPredictionRequest(BaseModel):
+    orders: List[PredictionRequest] = Field(..., max_length=MAX_BATCH_PREDICTIONS)
+
+class BatchPredictionResponse(BaseModel):
+    predictions: List[PredictionResponse]
+
 class TrainingRequest(BaseModel):
     shop_id: str
     force_retrain: bool = False
+    wait: bool = False
+
+class BatchTrainingRequest(BaseModel):
+    shop_ids: List[str]
+    include_global: bool = False
+
+class GlobalTrainingRequest(BaseModel):
+    force_retrain: bool = False
+    wait: bool = False
 
 # ==================== HELPER FUNCTIONS ====================
 
-async def get_db_connection():
-    return await asyncpg.connect(DATABASE_URL)
+async def create_db_pool() -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+    )
+
+def db_connection():
+    """Acquire a pooled connection; released back to the pool on exit, even on errors"""
+    if DB_POOL is None:
+        raise RuntimeError("Database pool not initialized")
+    return DB_POOL.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT)
 
 def get_hour_features(hour: int):
     """Convert hour to rush hour indicators"""
@@ -67,25 +163,16 @@ def get_hour_features(hour: int):
     is_rush_hour = 1 if is_morning_rush or is_lunch_rush or is_afternoon_rush else 0
     return is_morning_rush, is_lunch_rush, is_afternoon_rush, is_rush_hour
 
-async def get_item_complexity(shop_id: str, item_name: str, conn):
-    """Get complexity score for an item"""
-    result = await conn.fetchrow(
-        """
-        SELECT complexity_score, base_prep_time_seconds
-        FROM item_complexity
-        WHERE shop_id = $1 AND LOWER(item_name) = LOWER($2)
-        LIMIT 1
-        """,
-        shop_id, item_name
-    )
-    
-    if result:
-        return result['complexity_score'], result['base_prep_time_seconds']
+def get_item_complexity(shop_id: str, item: OrderItem) -> float:
+    """Complexity score for an item: the shop's item_complexity row, else its category default"""
+    if COMPLEXITY is not None:
+        result = COMPLEXITY.lookup(shop_id, item.name)
+        if result is not None:
+            return result[0]
     
-    # Default if not found
-    return 1.0, 60
+    return CATEGORY_COMPLEXITY.get(item.category or 'coffee', 1.0)
 
-def calculate_features(items: List[OrderItem], queue_length: int, staff_count: int, shop_id: str, conn) -> dict:
+def calculate_features(items: List[OrderItem], queue_length: int, staff_count: int, shop_id: str) -> dict:
     """Calculate feature vector for prediction"""
     now = datetime.now()
     hour = now.hour
@@ -97,22 +184,13 @@ def calculate_features(items: List[OrderItem], queue_length: int, staff_count: i
     # Calculate item features
     total_items = sum(item.quantity for item in items)
     
-    # Get complexity scores (simplified for now - in production, query DB)
-    complexity_map = {
-        'espresso': 1.5,
-        'coffee': 0.8,
-        'cold_brew': 1.0,
-        'blended': 2.5,
-        'pastry': 0.3,
-        'food': 2.0
-    }
-    
+    # Complexity scores come from the in-memory item_complexity cache (no queries)
     total_complexity = 0
     category_counts = {}
     
     for item in items:
         category = item.category or 'coffee'
-        complexity = complexity_map.get(category, 1.0)
+        complexity = get_item_complexity(shop_id, item)
         total_complexity += complexity * item.quantity
         category_counts[category] = category_counts.get(category, 0) + item.quantity
     
@@ -144,15 +222,7 @@ def calculate_features(items: List[OrderItem], queue_length: int, staff_count: i
 
 def features_to_array(features: dict) -> np.ndarray:
     """Convert feature dict to numpy array for model"""
-    feature_order = [
-        'total_items', 'avg_complexity', 'total_complexity',
-        'queue_length', 'staff_count', 'items_per_staff',
-        'hour_of_day', 'day_of_week',
-        'is_morning_rush', 'is_lunch_rush', 'is_afternoon_rush', 'is_rush_hour',
-        'has_espresso', 'has_blended', 'espresso_count', 'blended_count'
-    ]
-    
-    return np.array([[features.get(f, 0) for f in feature_order]])
+    return np.array([[features.get(f, 0) for f in FEATURE_ORDER]])
 
 # ==================== RULE-BASED FALLBACK ====================
 
@@ -203,164 +273,376 @@ def rule_based_prediction(features: dict) -> dict:
 
 # ==================== ML MODEL ====================
 
-async def load_or_train_model(shop_id: str, force_retrain: bool = False):
-    """Load existing model or train new one"""
-    
-    # Check cache
-    if shop_id in MODEL_CACHE and not force_retrain:
-        return MODEL_CACHE[shop_id]
-    
-    # Try to load from disk
-    model_path = f"models/shop_{shop_id}_model.joblib"
-    
-    if os.path.exists(model_path) and not force_retrain:
-        model = joblib.load(model_path)
-        MODEL_CACHE[shop_id] = model
-        return model
-    
-    # Train new model
-    conn = await get_db_connection()
-    
-    try:
-        # Fetch training data
-        rows = await conn.fetch(
+# Column order of fetch_training_rows; NULL defaults are applied in SQL so
+# build_training_set can treat the result as one float matrix.
+TRAINING_COLUMNS = [
+    'total_items', 'total_complexity_score', 'hour_of_day', 'day_of_week',
+    'is_rush_hour', 'queue_length', 'staff_count', 'total_duration'
+]
+
+async def fetch_training_rows(shop_id: str):
+    """Recent completed order timings for a shop (newest TRAINING_ROW_LIMIT, last 90 days)"""
+    async with db_connection() as conn:
+        return await conn.fetch(
             """
             SELECT 
-                total_items,
-                total_complexity_score,
-                hour_of_day,
-                day_of_week,
-                is_rush_hour,
-                queue_length,
-                staff_count,
-                total_duration
+                total_items::float8,
+                COALESCE(total_complexity_score, 0)::float8,
+                hour_of_day::float8,
+                day_of_week::float8,
+                COALESCE(is_rush_hour, false)::int::float8,
+                COALESCE(queue_length, 0)::float8,
+                COALESCE(NULLIF(staff_count, 0), 2)::float8,
+                total_duration::float8
             FROM order_timing_data
             WHERE shop_id = $1
               AND total_duration IS NOT NULL
               AND total_duration > 0
               AND time_placed > NOW() - INTERVAL '90 days'
             ORDER BY time_placed DESC
-            LIMIT 1000
+            LIMIT $2
             """,
-            shop_id
+            shop_id, TRAINING_ROW_LIMIT
         )
-        
-        if len(rows) < 50:
-            # Not enough data, return None to use rule-based
-            return None
-        
-        # Prepare training data
-        X = []
-        y = []
-        
-        for row in rows:
-            features = {
-                'total_items': row['total_items'],
-                'avg_complexity': row['total_complexity_score'] or 1.0,
-                'total_complexity': row['total_complexity_score'] * row['total_items'] or row['total_items'],
-                'queue_length': row['queue_length'] or 0,
-                'staff_count': row['staff_count'] or 2,
-                'items_per_staff': row['total_items'] / max(row['staff_count'] or 2, 1),
-                'hour_of_day': row['hour_of_day'],
-                'day_of_week': row['day_of_week'],
-                'is_morning_rush': 1 if 7 <= row['hour_of_day'] <= 9 else 0,
-                'is_lunch_rush': 1 if 11 <= row['hour_of_day'] <= 13 else 0,
-                'is_afternoon_rush': 1 if 15 <= row['hour_of_day'] <= 17 else 0,
-                'is_rush_hour': 1 if row['is_rush_hour'] else 0,
-                'has_espresso': 0,
-                'has_blended': 0,
-                'espresso_count': 0,
-                'blended_count': 0,
-            }
-            
-            X.append(features_to_array(features)[0])
-            y.append(row['total_duration'])
-        
-        X = np.array(X)
-        y = np.array(y)
-        
-        # Train model
-        model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            min_samples_split=5,
-            random_state=42
+
+def rush_hour_flags(hours: np.ndarray):
+    """Vectorized get_hour_features rush indicators (morning, lunch, afternoon)"""
+    return (
+        ((hours >= 7) & (hours <= 9)).astype(np.float64),
+        ((hours >= 11) & (hours <= 13)).astype(np.float64),
+        ((hours >= 15) & (hours <= 17)).astype(np.float64),
+    )
+
+def build_training_set(rows):
+    """Turn order_timing_data rows into (X, y) with column-wise array operations"""
+    data = np.array([tuple(r) for r in rows], dtype=np.float64).reshape(-1, len(TRAINING_COLUMNS))
+    return training_matrix(data)
+
+def training_matrix(data: np.ndarray):
+    """(X, y) from a float matrix laid out as TRAINING_COLUMNS"""
+    col = {name: data[:, i] for i, name in enumerate(TRAINING_COLUMNS)}
+    
+    total_items = col['total_items']
+    score = col['total_complexity_score']
+    total_complexity = score * total_items
+    is_morning_rush, is_lunch_rush, is_afternoon_rush = rush_hour_flags(col['hour_of_day'])
+    zeros = np.zeros(len(data))
+    
+    features = {
+        'total_items': total_items,
+        'avg_complexity': np.where(score != 0, score, 1.0),
+        'total_complexity': np.where(total_complexity != 0, total_complexity, total_items),
+        'queue_length': col['queue_length'],
+        'staff_count': col['staff_count'],
+        'items_per_staff': total_items / np.maximum(col['staff_count'], 1),
+        'hour_of_day': col['hour_of_day'],
+        'day_of_week': col['day_of_week'],
+        'is_morning_rush': is_morning_rush,
+        'is_lunch_rush': is_lunch_rush,
+        'is_afternoon_rush': is_afternoon_rush,
+        'is_rush_hour': col['is_rush_hour'],
+    }
+    
+    X = np.column_stack([features.get(name, zeros) for name in FEATURE_ORDER])
+    return X, col['total_duration'].copy()
+
+# Per-shop aggregates (90-day timing stats, menu complexity) shared by the global-model queries
+SHOP_PROFILE_CTES = """
+            WITH shop_stats AS (
+                SELECT shop_id,
+                       AVG(total_duration)::float8 AS shop_mean_duration,
+                       SUM(total_duration)::float8 AS shop_total_duration,
+                       COUNT(*)::float8 AS shop_order_count
+                FROM order_timing_data
+                WHERE total_duration IS NOT NULL
+                  AND total_duration > 0
+                  AND time_placed > NOW() - INTERVAL '90 days'
+                GROUP BY shop_id
+            ),
+            menu AS (
+                SELECT shop_id, AVG(complexity_score)::float8 AS shop_menu_complexity
+                FROM item_complexity
+                GROUP BY shop_id
+            )
+"""
+
+async def fetch_global_training_data():
+    """
+    Recent completed timings across all shops (with each row's shop profile
+    appended) and the profile of every shop, including shops that have a
+    menu but no orders yet.
+    
+    Training rows get a leave-one-out profile: the shop's mean duration and
+    order count over its *other* orders, so the feature never contains the
+    row's own label. A shop's only order gets NULL (the population mean).
+    """
+    async with db_connection() as conn:
+        rows = await conn.fetch(
+            SHOP_PROFILE_CTES + """
+            SELECT 
+                o.total_items::float8,
+                COALESCE(o.total_complexity_score, 0)::float8,
+                o.hour_of_day::float8,
+                o.day_of_week::float8,
+                COALESCE(o.is_rush_hour, false)::int::float8,
+                COALESCE(o.queue_length, 0)::float8,
+                COALESCE(NULLIF(o.staff_count, 0), 2)::float8,
+                o.total_duration::float8,
+                CASE WHEN s.shop_order_count > 1
+                     THEN (s.shop_total_duration - o.total_duration) / (s.shop_order_count - 1)
+                END,
+                s.shop_order_count - 1,
+                COALESCE(m.shop_menu_complexity, 1.0)
+            FROM order_timing_data o
+            JOIN shop_stats s ON s.shop_id = o.shop_id
+            LEFT JOIN menu m ON m.shop_id = o.shop_id
+            WHERE o.total_duration IS NOT NULL
+              AND o.total_duration > 0
+              AND o.time_placed > NOW() - INTERVAL '90 days'
+            ORDER BY o.time_placed DESC
+            LIMIT $1
+            """,
+            GLOBAL_TRAINING_ROW_LIMIT
         )
         
-        model.fit(X, y)
-        
-        # Save model
-        os.makedirs("models", exist_ok=True)
-        joblib.dump(model, model_path)
-        
-        # Cache model
-        MODEL_CACHE[shop_id] = model
-        
-        return model
-        
-    finally:
-        await conn.close()
+        profile_rows = await conn.fetch(
+            SHOP_PROFILE_CTES + """
+            SELECT COALESCE(s.shop_id, m.shop_id)::text AS shop_id,
+                   s.shop_mean_duration,
+                   COALESCE(s.shop_order_count, 0)::float8 AS shop_order_count,
+                   m.shop_menu_complexity
+            FROM shop_stats s
+            FULL OUTER JOIN menu m ON m.shop_id = s.shop_id
+            """
+        )
+    
+    return rows, profile_rows
+
+def build_global_training_set(rows, profile_rows):
+    """(X, y, shop_profiles, default_profile) for training.fit_global_model"""
+    width = len(TRAINING_COLUMNS) + len(SHOP_PROFILE_ORDER)
+    data = np.array([tuple(r) for r in rows], dtype=np.float64).reshape(-1, width)
+    X, y = training_matrix(data[:, :len(TRAINING_COLUMNS)])
+    profiles = data[:, len(TRAINING_COLUMNS):]
+    
+    # Population defaults for shops (or profile fields) with no history
+    default_profile = [
+        float(np.mean(y)) if len(y) else 300.0,
+        0.0,
+        1.0,
+    ]
+    
+    # Leave-one-out mean is NULL (NaN) for a shop's only order
+    mean_col = SHOP_PROFILE_ORDER.index('shop_mean_duration')
+    profiles[np.isnan(profiles[:, mean_col]), mean_col] = default_profile[mean_col]
+    X = np.hstack([X, profiles])
+    
+    shop_profiles = {}
+    for r in profile_rows:
+        shop_profiles[r['shop_id']] = [
+            r['shop_mean_duration'] if r['shop_mean_duration'] is not None else default_profile[0],
+            r['shop_order_count'],
+            r['shop_menu_complexity'] if r['shop_menu_complexity'] is not None else default_profile[2],
+        ]
+    
+    return X, y, shop_profiles, default_profile
+
+def invalidate_model(shop_id: str):
+    """Drop the in-memory copy so the next prediction loads the newly written model"""
+    MODEL_CACHE.pop(shop_id, None)
+
+def on_model_trained(shop_id: str):
+    invalidate_model(shop_id)
+    # The new fit has learned from the orders behind the online correction
+    ONLINE.reset(shop_id)
+    COMPLETIONS_SINCE_FIT.pop(shop_id, None)
+    
+    # Corrections measured against the old global model (cold-start and
+    # blended shops) no longer apply to the new one
+    if shop_id == GLOBAL_MODEL_KEY:
+        for other_id, method in list(ONLINE_METHODS.items()):
+            if method in ('global_model', 'blended'):
+                ONLINE.reset(other_id)
+                ONLINE_METHODS.pop(other_id, None)
+    else:
+        ONLINE_METHODS.pop(shop_id, None)
+
+async def get_model_for_prediction(shop_id: str):
+    """
+    Return an already-trained model (memory, then disk) or None.
+    Never trains inline: a miss queues background training and the
+    caller falls back to rule_based_prediction.
+    """
+    # is_current reads the metadata file; keep that off the event loop
+    if shop_id in MODEL_CACHE or await asyncio.get_running_loop().run_in_executor(
+        None, REGISTRY.is_current, shop_id
+    ):
+        return await MODEL_CACHE.get_or_load(
+            shop_id, lambda: REGISTRY.load(shop_id, mmap_mode=MODEL_MMAP_MODE)
+        )
+    
+    if TRAINING is not None and not TRAINING.is_backing_off(shop_id):
+        TRAINING.enqueue(shop_id)
+    return None
+
+async def predict_for_shop(shop_id: str, X: np.ndarray, correct: bool = True):
+    """
+    Model predictions for a shop's feature rows as (seconds, method), or
+    (None, 'rule_based') when no model is available. Uses the shop's own
+    model (blended with the global model when GLOBAL_BLEND_WEIGHT > 0),
+    falling back to the global model for cold-start shops. With correct=True
+    the shop's online residual correction is added.
+    """
+    predictions, method = await predict_raw_for_shop(shop_id, X)
+    if correct and predictions is not None:
+        predictions = predictions + ONLINE.correction(shop_id)
+    return predictions, method
+
+async def predict_raw_for_shop(shop_id: str, X: np.ndarray):
+    shop_model = await get_model_for_prediction(shop_id)
+    
+    global_model = None
+    if shop_model is None or GLOBAL_BLEND_WEIGHT > 0:
+        global_model = await get_model_for_prediction(GLOBAL_MODEL_KEY)
+    
+    shop_ids = [shop_id] * len(X)
+    
+    if shop_model is not None and global_model is not None:
+        blended = (
+            (1 - GLOBAL_BLEND_WEIGHT) * shop_model.predict(X)
+            + GLOBAL_BLEND_WEIGHT * global_model.predict(X, shop_ids)
+        )
+        return blended, 'blended'
+    if shop_model is not None:
+        return shop_model.predict(X), 'ml_model'
+    if global_model is not None:
+        return global_model.predict(X, shop_ids), 'global_model'
+    return None, 'rule_based'
+
+async def record_online_update(row):
+    """
+    Fold a completed order into its shop's online correction and queue a
+    full retrain every ONLINE_RETRAIN_EVERY completions.
+    """
+    shop_id = row['shop_id']
+    data = np.array([tuple(row)[1:]], dtype=np.float64)
+    X, y = training_matrix(data)
+    
+    predictions, method = await predict_for_shop(shop_id, X, correct=False)
+    if predictions is not None:
+        ONLINE.update(shop_id, float(y[0] - predictions[0]))
+        ONLINE_METHODS[shop_id] = method
+    
+    COMPLETIONS_SINCE_FIT[shop_id] = COMPLETIONS_SINCE_FIT.get(shop_id, 0) + 1
+    if COMPLETIONS_SINCE_FIT[shop_id] >= ONLINE_RETRAIN_EVERY and TRAINING is not None:
+        if not TRAINING.is_backing_off(shop_id):
+            TRAINING.enqueue(shop_id)
+        COMPLETIONS_SINCE_FIT[shop_id] = 0
 
 # ==================== API ENDPOINTS ====================
 
+def request_features(request: PredictionRequest) -> dict:
+    # Calculate features (no DB access needed)
+    return calculate_features(
+        request.items,
+        request.current_queue_length,
+        request.staff_count,
+        request.shop_id
+    )
+
+# method -> (breakdown label, confidence); could calculate confidence from training data
+MODEL_METHODS = {
+    'ml_model': ('Machine Learning Model', 0.85),
+    'blended': ('Shop + Global Model Blend', 0.85),
+    'global_model': ('Global Multi-Shop Model', 0.78),
+}
+
+def build_prediction_response(features: dict, model_seconds: Optional[float], method: str = 'ml_model') -> PredictionResponse:
+    """Shape a model output (or None for the rule-based fallback) into a PredictionResponse"""
+    if model_seconds is not None:
+        # Use ML model
+        predicted_seconds = int(model_seconds)
+        label, confidence = MODEL_METHODS[method]
+        breakdown = {'method': label, 'features_used': len(features)}
+    else:
+        # Use rule-based fallback
+        result = rule_based_prediction(features)
+        predicted_seconds = result['estimated_seconds']
+        confidence = 0.70
+        method = 'rule_based'
+        breakdown = result['breakdown']
+    
+    # Ensure reasonable bounds
+    predicted_seconds = max(120, min(predicted_seconds, 1800))
+    predicted_minutes = round(predicted_seconds / 60)
+    
+    # Calculate ready time
+    now = datetime.now()
+    ready_time = now + timedelta(seconds=predicted_seconds)
+    ready_time_str = ready_time.strftime("%I:%M %p")
+    
+    return PredictionResponse(
+        estimated_seconds=predicted_seconds,
+        estimated_minutes=predicted_minutes,
+        estimated_ready_time=ready_time_str,
+        confidence_score=confidence,
+        breakdown={
+            **breakdown,
+            'method': method,
+            'total_items': features['total_items'],
+            'queue_length': features['queue_length'],
+            'is_rush_hour': bool(features['is_rush_hour'])
+        }
+    )
+
 @app.post("/api/predict-prep-time", response_model=PredictionResponse)
 async def predict_prep_time(request: PredictionRequest):
     """Predict preparation time for an order"""
     
     try:
-        conn = await get_db_connection()
+        features = request_features(request)
         
-        # Calculate features
-        features = calculate_features(
-            request.items,
-            request.current_queue_length,
-            request.staff_count,
-            request.shop_id,
-            conn
-        )
+        # Use already-trained models only; a miss trains in the background
+        predictions, method = await predict_for_shop(request.shop_id, features_to_array(features))
         
-        await conn.close()
+        model_seconds = predictions[0] if predictions is not None else None
         
-        # Try to load ML model
-        model = await load_or_train_model(request.shop_id)
+        return build_prediction_response(features, model_seconds, method)
         
-        if model is not None:
-            # Use ML model
-            X = features_to_array(features)
-            predicted_seconds = int(model.predict(X)[0])
-            confidence = 0.85  # Could calculate based on training data
-            method = 'ml_model'
-            breakdown = {'method': 'Machine Learning Model', 'features_used': len(features)}
-        else:
-            # Use rule-based fallback
-            result = rule_based_prediction(features)
-            predicted_seconds = result['estimated_seconds']
-            confidence = 0.70
-            method = 'rule_based'
-            breakdown = result['breakdown']
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/predict-prep-time/batch", response_model=BatchPredictionResponse)
+async def predict_prep_time_batch(request: BatchPredictionRequest):
+    """
+    Predict many orders (e.g. a whole queue, each with its own
+    current_queue_length) in one call. Orders are grouped per shop and each
+    shop model runs once on the stacked feature matrix. Results keep input order.
+    """
+    
+    try:
+        features = [request_features(order) for order in request.orders]
+        model_seconds: List[Optional[float]] = [None] * len(features)
+        methods = ['rule_based'] * len(features)
         
-        # Ensure reasonable bounds
-        predicted_seconds = max(120, min(predicted_seconds, 1800))
-        predicted_minutes = round(predicted_seconds / 60)
+        indices_by_shop = {}
+        for i, order in enumerate(request.orders):
+            indices_by_shop.setdefault(order.shop_id, []).append(i)
         
-        # Calculate ready time
-        now = datetime.now()
-        ready_time = now + timedelta(seconds=predicted_seconds)
-        ready_time_str = ready_time.strftime("%I:%M %p")
+        for shop_id, indices in indices_by_shop.items():
+            X = np.vstack([features_to_array(features[i]) for i in indices])
+            predictions, method = await predict_for_shop(shop_id, X)
+            if predictions is None:
+                continue
+            
+            for i, seconds in zip(indices, predictions):
+                model_seconds[i] = seconds
+                methods[i] = method
         
-        return PredictionResponse(
-            estimated_seconds=predicted_seconds,
-            estimated_minutes=predicted_minutes,
-            estimated_ready_time=ready_time_str,
-            confidence_score=confidence,
-            breakdown={
-                **breakdown,
-                'method': method,
-                'total_items': features['total_items'],
-                'queue_length': features['queue_length'],
-                'is_rush_hour': bool(features['is_rush_hour'])
-            }
-        )
+        return BatchPredictionResponse(predictions=[
+            build_prediction_response(f, seconds, method)
+            for f, seconds, method in zip(features, model_seconds, methods)
+        ])
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -370,111 +652,201 @@ async def record_order_timing(order_id: str, status: str, timestamp: str = None)
     """Record timing data when order status changes"""
     
     try:
-        conn = await get_db_connection()
-        
         ts = timestamp or datetime.now().isoformat()
+        completed = None
         
-        # Update timing data based on status
-        if status == 'accepted':
-            await conn.execute(
-                "UPDATE order_timing_data SET time_accepted = $1 WHERE order_id = $2",
-                ts, order_id
-            )
-        elif status == 'preparing':
-            await conn.execute(
-                "UPDATE order_timing_data SET time_preparing = $1 WHERE order_id = $2",
-                ts, order_id
-            )
-        elif status == 'ready':
-            await conn.execute(
-                """
-                UPDATE order_timing_data 
-                SET time_ready = $1,
-                    preparation_duration = EXTRACT(EPOCH FROM ($1::timestamptz - time_preparing))::INTEGER
-                WHERE order_id = $2
-                """,
-                ts, order_id
-            )
-        elif status == 'completed':
-            await conn.execute(
-                """
-                UPDATE order_timing_data 
-                SET time_completed = $1,
-                    total_duration = EXTRACT(EPOCH FROM ($1::timestamptz - time_placed))::INTEGER
-                WHERE order_id = $2
-                """,
-                ts, order_id
-            )
+        async with db_connection() as conn:
+            # Update timing data based on status
+            if status == 'accepted':
+                await conn.execute(
+                    "UPDATE order_timing_data SET time_accepted = $1 WHERE order_id = $2",
+                    ts, order_id
+                )
+            elif status == 'preparing':
+                await conn.execute(
+                    "UPDATE order_timing_data SET time_preparing = $1 WHERE order_id = $2",
+                    ts, order_id
+                )
+            elif status == 'ready':
+                await conn.execute(
+                    """
+                    UPDATE order_timing_data 
+                    SET time_ready = $1,
+                        preparation_duration = EXTRACT(EPOCH FROM ($1::timestamptz - time_preparing))::INTEGER
+                    WHERE order_id = $2
+                    """,
+                    ts, order_id
+                )
+            elif status == 'completed':
+                # Returns the row as shop_id + TRAINING_COLUMNS for the online update
+                completed = await conn.fetchrow(
+                    """
+                    UPDATE order_timing_data 
+                    SET time_completed = $1,
+                        total_duration = EXTRACT(EPOCH FROM ($1::timestamptz - time_placed))::INTEGER
+                    WHERE order_id = $2
+                    RETURNING
+                        shop_id::text,
+                        total_items::float8,
+                        COALESCE(total_complexity_score, 0)::float8,
+                        hour_of_day::float8,
+                        day_of_week::float8,
+                        COALESCE(is_rush_hour, false)::int::float8,
+                        COALESCE(queue_length, 0)::float8,
+                        COALESCE(NULLIF(staff_count, 0), 2)::float8,
+                        total_duration::float8
+                    """,
+                    ts, order_id
+                )
         
-        await conn.close()
+        if completed is not None and (completed['total_duration'] or 0) > 0:
+            try:
+                await record_online_update(completed)
+            except Exception as e:
+                # The timing is stored; a missed online update only delays adaptation
+                print(f"⚠️ Online update failed for order {order_id}: {e}")
         
         return {"status": "success", "order_id": order_id, "recorded_status": status}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def require_training() -> TrainingService:
+    """The running TrainingService, or 503 outside the app lifespan"""
+    if TRAINING is None:
+        raise HTTPException(status_code=503, detail="Training service is not running")
+    return TRAINING
+
+async def run_training_job(shop_id: str, wait: bool) -> dict:
+    job = require_training().enqueue(shop_id)
+    
+    if wait:
+        await job.done.wait()
+    
+    messages = {
+        "queued": "Training queued",
+        "running": "Training in progress",
+        "succeeded": "Model trained successfully",
+        "insufficient_data": f"Not enough historical data to train model. Need at least {MIN_TRAINING_ROWS} orders.",
+        "failed": "Training failed",
+    }
+    
+    return {
+        "status": "success" if job.status == "succeeded" else job.status,
+        "shop_id": shop_id,
+        "model_trained": job.status == "succeeded",
+        "message": messages[job.status],
+        "job": job.to_dict()
+    }
+
 @app.post("/api/train-model")
 async def train_model(request: TrainingRequest):
-    """Trigger model retraining for a shop"""
+    """Queue model (re)training for a shop; optionally wait for the job to finish"""
     
     try:
-        model = await load_or_train_model(request.shop_id, force_retrain=request.force_retrain)
-        
-        if model:
+        # Metadata file reads stay off the event loop
+        loop = asyncio.get_running_loop()
+        if not request.force_retrain and await loop.run_in_executor(None, REGISTRY.is_current, request.shop_id):
             return {
                 "status": "success",
                 "shop_id": request.shop_id,
                 "model_trained": True,
-                "message": "Model trained successfully"
+                "message": "Model already trained",
+                "model": await loop.run_in_executor(None, REGISTRY.read_metadata, request.shop_id)
             }
-        else:
+        
+        return await run_training_job(request.shop_id, request.wait)
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/train-model/global")
+async def train_global_model(request: GlobalTrainingRequest):
+    """Queue (re)training of the global multi-shop model"""
+    
+    try:
+        # Metadata file reads stay off the event loop
+        loop = asyncio.get_running_loop()
+        if not request.force_retrain and await loop.run_in_executor(None, REGISTRY.is_current, GLOBAL_MODEL_KEY):
             return {
-                "status": "insufficient_data",
-                "shop_id": request.shop_id,
-                "model_trained": False,
-                "message": "Not enough historical data to train model. Need at least 50 orders."
+                "status": "success",
+                "shop_id": GLOBAL_MODEL_KEY,
+                "model_trained": True,
+                "message": "Model already trained",
+                "model": await loop.run_in_executor(None, REGISTRY.read_metadata, GLOBAL_MODEL_KEY)
             }
-            
+        
+        return await run_training_job(GLOBAL_MODEL_KEY, request.wait)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/train-model/batch")
+async def train_models_batch(request: BatchTrainingRequest):
+    """Queue training for many shops (e.g. nightly retrain); the pool runs them in parallel"""
+    shop_ids = list(dict.fromkeys(request.shop_ids))
+    if request.include_global:
+        shop_ids.append(GLOBAL_MODEL_KEY)
+    training = require_training()
+    jobs = [training.enqueue(shop_id) for shop_id in shop_ids]
+    return {"queued": len(jobs), "jobs": [job.to_dict() for job in jobs]}
+
+@app.get("/api/training-jobs")
+async def list_training_jobs(shop_id: Optional[str] = None, limit: int = 100):
+    """Recent training jobs, newest first"""
+    training = require_training()
+    return {"jobs": training.list_jobs(shop_id=shop_id, limit=min(max(limit, 1), 1000)), **training.stats()}
+
+@app.get("/api/training-jobs/{job_id}")
+async def get_training_job(job_id: str):
+    job = require_training().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job.to_dict()
+
 @app.get("/api/model-stats/{shop_id}")
 async def get_model_stats(shop_id: str):
     """Get model performance statistics"""
     
     try:
-        conn = await get_db_connection()
-        
-        stats = await conn.fetchrow(
-            """
-            SELECT 
-                COUNT(*) as total_predictions,
-                AVG(error_percentage) as avg_error_percentage,
-                AVG(ABS(error_seconds)) as avg_error_seconds,
-                STDDEV(error_seconds) as stddev_error,
-                MIN(error_seconds) as min_error,
-                MAX(error_seconds) as max_error
-            FROM prep_time_predictions p
-            JOIN order_timing_data o ON p.order_id = o.order_id
-            WHERE o.shop_id = $1
-              AND p.actual_seconds IS NOT NULL
-              AND p.created_at > NOW() - INTERVAL '30 days'
-            """,
-            shop_id
-        )
-        
-        training_data_count = await conn.fetchval(
-            """
-            SELECT COUNT(*)
-            FROM order_timing_data
-            WHERE shop_id = $1
-              AND total_duration IS NOT NULL
-              AND time_placed > NOW() - INTERVAL '90 days'
-            """,
-            shop_id
-        )
+        async with db_connection() as conn:
+            stats = await conn.fetchrow(
+                """
+                SELECT 
+                    COUNT(*) as total_predictions,
+                    AVG(error_percentage) as avg_error_percentage,
+                    AVG(ABS(error_seconds)) as avg_error_seconds,
+                    STDDEV(error_seconds) as stddev_error,
+                    MIN(error_seconds) as min_error,
+                    MAX(error_seconds) as max_error
+                FROM prep_time_predictions p
+                JOIN order_timing_data o ON p.order_id = o.order_id
+                WHERE o.shop_id = $1
+                  AND p.actual_seconds IS NOT NULL
+                  AND p.created_at > NOW() - INTERVAL '30 days'
+                """,
+                shop_id
+            )
+            
+            training_data_count = await conn.fetchval(
+                """
+                SELECT COUNT(*)
+                FROM order_timing_data
+                WHERE shop_id = $1
+                  AND total_duration IS NOT NULL
+                  AND time_placed > NOW() - INTERVAL '90 days'
+                """,
+                shop_id
+            )
         
-        await conn.close()
+        loop = asyncio.get_running_loop()
+        model_exists = shop_id in MODEL_CACHE or await loop.run_in_executor(None, REGISTRY.is_current, shop_id)
+        model_metadata = await loop.run_in_executor(None, REGISTRY.read_metadata, shop_id)
+        global_metadata = await loop.run_in_executor(None, REGISTRY.read_metadata, GLOBAL_MODEL_KEY)
         
         return {
             "shop_id": shop_id,
@@ -482,12 +854,41 @@ async def get_model_stats(shop_id: str):
             "avg_error_minutes": round((stats['avg_error_seconds'] or 0) / 60, 1),
             "avg_error_percentage": round(stats['avg_error_percentage'] or 0, 1),
             "training_data_count": training_data_count,
-            "model_exists": shop_id in MODEL_CACHE or os.path.exists(f"models/shop_{shop_id}_model.joblib")
+            "model_exists": model_exists,
+            "model": model_metadata,
+            "global_model": global_metadata,
+            "online_correction": ONLINE.snapshot(shop_id),
+            "completions_since_fit": COMPLETIONS_SINCE_FIT.get(shop_id, 0)
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/model-cache")
+async def get_model_cache_stats():
+    """Loaded-model cache usage: size, hit/miss/eviction counters"""
+    return {**MODEL_CACHE.stats(), "mmap_mode": MODEL_MMAP_MODE}
+
+def require_complexity() -> ComplexityCache:
+    """The running ComplexityCache, or 503 outside the app lifespan"""
+    if COMPLEXITY is None:
+        raise HTTPException(status_code=503, detail="Complexity cache is not running")
+    return COMPLEXITY
+
+@app.get("/api/complexity-cache")
+async def get_complexity_cache_stats():
+    return require_complexity().stats()
+
+@app.post("/api/complexity-cache/refresh")
+async def refresh_complexity_cache():
+    """Reload item_complexity now (e.g. after a menu change) instead of waiting for the timer"""
+    complexity = require_complexity()
+    try:
+        rows = await complexity.refresh()
+        return {"status": "success", "rows": rows, **complexity.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "LoyalCup ML Service"}
@@ -496,8 +897,55 @@ async def health_check():
 
 @app.on_event("startup")
 async def startup_event():
+    global DB_POOL, TRAINING, COMPLEXITY
+    
     print("🤖 LoyalCup ML Service Started")
     print("📊 Ready to predict order prep times!")
     
     # Create models directory
-    os.makedirs("models", exist_ok=True)
\ No newline at end of file
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    
+    # One pool for the app lifetime instead of a connection per request
+    DB_POOL = await create_db_pool()
+    print(f"🔌 DB pool ready (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    
+    COMPLEXITY = ComplexityCache(db_connection, COMPLEXITY_REFRESH_SECONDS)
+    try:
+        rows = await COMPLEXITY.refresh()
+        print(f"🧮 Item complexity cache loaded ({rows} items)")
+    except Exception as e:
+        COMPLEXITY.last_error = str(e)
+        print(f"⚠️ Item complexity cache not loaded, using category defaults: {e}")
+    COMPLEXITY.start()
+    
+    TRAINING = TrainingService(
+        REGISTRY,
+        fetch_rows=fetch_training_rows,
+        build_training_set=build_training_set,
+        fetch_global_rows=fetch_global_training_data,
+        build_global_training_set=build_global_training_set,
+        on_trained=on_model_trained,
+        workers=TRAINING_WORKERS,
+        n_jobs=TRAINING_N_JOBS,
+        min_rows=MIN_TRAINING_ROWS,
+        insufficient_ttl_seconds=INSUFFICIENT_DATA_TTL_SECONDS,
+        failure_ttl_seconds=TRAINING_FAILURE_TTL_SECONDS,
+    )
+    TRAINING.start()
+    print(f"🏋️ Training pool ready (workers={TRAINING_WORKERS}, n_jobs={TRAINING_N_JOBS})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global DB_POOL, TRAINING, COMPLEXITY
+    
+    if COMPLEXITY is not None:
+        await COMPLEXITY.stop()
+        COMPLEXITY = None
+    
+    if TRAINING is not None:
+        await TRAINING.stop()
+        TRAINING = None
+    
+    if DB_POOL is not None:
+        await DB_POOL.close()
+        DB_POOL = None
\ No newline at end of file
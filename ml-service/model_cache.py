@@ -0,0 +1,99 @@
+# ml-service/model_cache.py
+"""
+Bounded in-memory cache of loaded shop models.
+
+Models are kept in LRU order and evicted once their total estimated size
+(the on-disk size of the model file, which tracks the forest's node arrays)
+exceeds max_bytes. Evicted models are reloaded lazily from the registry on
+the next prediction. Concurrent misses for the same shop share one load.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+class ModelCache:
+    """LRU of loaded models bounded by total estimated bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: str, model: Any, nbytes: int):
+        self.pop(key)
+        self._entries[key] = (model, nbytes)
+        self.total_bytes += nbytes
+
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_bytes
+            self.evictions += 1
+
+    def pop(self, key: str):
+        """Drop a cached model and forget any in-flight load of the old file"""
+        self._loading.pop(key, None)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    async def get_or_load(self, key: str, load: Callable[[], Tuple[Any, int]]) -> Any:
+        """
+        Return the cached model, or run load() (blocking, returns
+        (model, nbytes)) in the default executor and cache the result.
+        """
+        model = self.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+
+        self.misses += 1
+
+        future = self._loading.get(key)
+        if future is not None:
+            model, _ = await asyncio.shield(future)
+            return model
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, load)
+        self._loading[key] = future
+        try:
+            model, nbytes = await future
+        finally:
+            is_current = self._loading.get(key) is future
+            if is_current:
+                self._loading.pop(key, None)
+
+        # Skip caching if the model was invalidated (retrained) mid-load
+        if is_current:
+            self.put(key, model, nbytes)
+        return model
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "models": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
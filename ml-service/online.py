@@ -0,0 +1,71 @@
+# ml-service/online.py
+"""
+Streaming residual correction on top of the trained models.
+
+Every completed order's residual (actual - model prediction) is folded into
+a per-shop exponentially decayed mean. Predictions add that mean, so a rush
+that makes a shop run slower than its model expects shows up within a few
+orders instead of at the next retrain. Both the residual sum and its weight
+decay with a time half-life, and the mean is shrunk toward zero by a prior
+weight, so the correction fades back to the plain model once the shop
+stops producing fresh evidence.
+
+Corrections are reset when the shop's model is retrained (the new model
+has already learned from those orders).
+"""
+import math
+import time
+from typing import Dict, Optional
+
+class ShopResidualState:
+    def __init__(self):
+        self.weighted_sum = 0.0
+        self.weight = 0.0
+        self.updated_at: Optional[float] = None
+        self.updates = 0
+
+class ResidualCorrector:
+    """Per-shop time-decayed, shrunk mean of recent prediction residuals"""
+
+    def __init__(self, half_life_seconds: float, prior_weight: float, max_correction_seconds: float):
+        self.half_life_seconds = half_life_seconds
+        self.prior_weight = prior_weight
+        self.max_correction_seconds = max_correction_seconds
+        self.shops: Dict[str, ShopResidualState] = {}
+
+    def _decay(self, state: ShopResidualState, now: float) -> float:
+        if state.updated_at is None:
+            return 1.0
+        return math.pow(0.5, max(0.0, now - state.updated_at) / self.half_life_seconds)
+
+    def update(self, shop_id: str, residual_seconds: float, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        state = self.shops.setdefault(shop_id, ShopResidualState())
+        decay = self._decay(state, now)
+        state.weighted_sum = state.weighted_sum * decay + residual_seconds
+        state.weight = state.weight * decay + 1.0
+        state.updated_at = now
+        state.updates += 1
+
+    def correction(self, shop_id: str, now: Optional[float] = None) -> float:
+        state = self.shops.get(shop_id)
+        if state is None or state.weight == 0:
+            return 0.0
+        now = time.time() if now is None else now
+        decay = self._decay(state, now)
+        mean = (state.weighted_sum * decay) / (state.weight * decay + self.prior_weight)
+        return max(-self.max_correction_seconds, min(mean, self.max_correction_seconds))
+
+    def reset(self, shop_id: str):
+        self.shops.pop(shop_id, None)
+
+    def snapshot(self, shop_id: str) -> Optional[dict]:
+        state = self.shops.get(shop_id)
+        if state is None:
+            return None
+        return {
+            "correction_seconds": round(self.correction(shop_id), 1),
+            "effective_weight": round(state.weight * self._decay(state, time.time()), 2),
+            "updates": state.updates,
+            "updated_at": state.updated_at,
+        }
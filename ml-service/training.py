@@ -0,0 +1,454 @@
+# ml-service/training.py
+"""
+Background training subsystem.
+
+- TrainingService: per-shop job queue (deduplicated), fits in a ProcessPoolExecutor
+- ModelRegistry: atomic model + metadata files (version, rows, holdout MAE, feature schema hash)
+  plus the compact .npz export (compact_model.py) used at inference
+- GlobalModel: one gradient-boosted model over all shops (key GLOBAL_MODEL_KEY)
+  with shop-level aggregate features, used for cold-start shops
+
+Fitting never runs on the event loop. Async workers (one per process) pull
+jobs, fetch training rows through the shared DB pool, and hand the arrays to
+the process pool. Models are written to a temp file and os.replace()d into
+place, so readers never see a half-written model.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import joblib
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import train_test_split
+
+from compact_model import CompactForest, export_compact
+
+JOB_HISTORY_LIMIT = 1000
+HOLDOUT_FRACTION = 0.2
+GLOBAL_MODEL_KEY = "global"
+
+def feature_schema_hash(feature_order: Sequence[str]) -> str:
+    """Short stable hash of the feature layout a model was trained on"""
+    return hashlib.sha256(",".join(feature_order).encode()).hexdigest()[:16]
+
+def _atomic_write(path: str, write: Callable[[str], None]):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _write_json(path: str, data: dict):
+    def write(tmp_path: str):
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+    _atomic_write(path, write)
+
+# ==================== PROCESS-POOL ENTRY POINT ====================
+
+def fit_shop_model(
+    shop_id: str,
+    X: np.ndarray,
+    y: np.ndarray,
+    model_path: str,
+    metadata_path: str,
+    compact_path: str,
+    version: int,
+    schema_hash: str,
+    n_jobs: int,
+) -> dict:
+    """
+    Evaluate on a holdout split, refit on every row and atomically persist
+    a shop model. The holdout MAE comes from the fit on the training split;
+    the saved model is the refit on all rows. Runs inside a worker process;
+    returns only the (small) metadata dict so the forest itself is never
+    pickled back to the web process.
+    """
+    started = time.perf_counter()
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=HOLDOUT_FRACTION, random_state=42
+    )
+
+    model = RandomForestRegressor(
+        n_estimators=100,
+        max_depth=10,
+        min_samples_split=5,
+        random_state=42,
+        n_jobs=n_jobs,
+    )
+    model.fit(X_train, y_train)
+
+    holdout_mae = float(mean_absolute_error(y_test, model.predict(X_test)))
+
+    # Shop histories are small: the served model keeps the holdout rows too
+    model.fit(X, y)
+
+    _atomic_write(model_path, lambda tmp_path: joblib.dump(model, tmp_path))
+    compact = export_compact(model, compact_path, X_test, _atomic_write)
+
+    metadata = {
+        "shop_id": shop_id,
+        "version": version,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "training_rows": int(len(y)),
+        "holdout_rows": int(len(y_test)),
+        "holdout_mae_seconds": round(holdout_mae, 2),
+        "holdout_mae_fit_rows": int(len(y_train)),
+        "feature_schema_hash": schema_hash,
+        "fit_seconds": round(time.perf_counter() - started, 3),
+        **compact,
+    }
+    _write_json(metadata_path, metadata)
+
+    return metadata
+
+class GlobalModel:
+    """
+    Cross-shop gradient-boosted model. Each row is the per-shop feature
+    vector plus the shop's aggregate profile (historical mean duration,
+    order count, menu complexity) captured at training time; shops without
+    a profile use the population default.
+    """
+
+    def __init__(self, estimator, shop_profiles: Dict[str, List[float]], default_profile: List[float]):
+        self.estimator = estimator
+        self.shop_profiles = shop_profiles
+        self.default_profile = default_profile
+
+    def profile(self, shop_id: str) -> List[float]:
+        return self.shop_profiles.get(shop_id, self.default_profile)
+
+    def predict(self, X: np.ndarray, shop_ids: Sequence[str]) -> np.ndarray:
+        profiles = np.array([self.profile(shop_id) for shop_id in shop_ids], dtype=np.float64)
+        return self.estimator.predict(np.hstack([X, profiles]))
+
+def fit_global_model(
+    X: np.ndarray,
+    y: np.ndarray,
+    shop_profiles: Dict[str, List[float]],
+    default_profile: List[float],
+    model_path: str,
+    metadata_path: str,
+    version: int,
+    schema_hash: str,
+) -> dict:
+    """Fit, evaluate and atomically persist the global model (process-pool entry point)"""
+    started = time.perf_counter()
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=HOLDOUT_FRACTION, random_state=42
+    )
+
+    estimator = HistGradientBoostingRegressor(
+        max_iter=300,
+        learning_rate=0.1,
+        max_leaf_nodes=31,
+        l2_regularization=1.0,
+        random_state=42,
+    )
+    estimator.fit(X_train, y_train)
+
+    holdout_mae = float(mean_absolute_error(y_test, estimator.predict(X_test)))
+
+    model = GlobalModel(estimator, shop_profiles, default_profile)
+    _atomic_write(model_path, lambda tmp_path: joblib.dump(model, tmp_path))
+
+    metadata = {
+        "shop_id": GLOBAL_MODEL_KEY,
+        "version": version,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "training_rows": int(len(y)),
+        "holdout_rows": int(len(y_test)),
+        "holdout_mae_seconds": round(holdout_mae, 2),
+        "shops_profiled": len(shop_profiles),
+        "feature_schema_hash": schema_hash,
+        "fit_seconds": round(time.perf_counter() - started, 3),
+    }
+    _write_json(metadata_path, metadata)
+
+    return metadata
+
+# ==================== MODEL REGISTRY ====================
+
+class ModelRegistry:
+    """On-disk shop models and their version metadata"""
+
+    def __init__(self, model_dir: str, schema_hash: str, global_schema_hash: str):
+        self.model_dir = model_dir
+        self.schema_hash = schema_hash
+        self.global_schema_hash = global_schema_hash
+
+    def schema_hash_for(self, shop_id: str) -> str:
+        return self.global_schema_hash if shop_id == GLOBAL_MODEL_KEY else self.schema_hash
+
+    def _stem(self, shop_id: str) -> str:
+        stem = "global_model" if shop_id == GLOBAL_MODEL_KEY else f"shop_{shop_id}_model"
+        return os.path.join(self.model_dir, stem)
+
+    def model_path(self, shop_id: str) -> str:
+        return self._stem(shop_id) + ".joblib"
+
+    def metadata_path(self, shop_id: str) -> str:
+        return self._stem(shop_id) + ".json"
+
+    def compact_path(self, shop_id: str) -> str:
+        return self._stem(shop_id) + ".npz"
+
+    def read_metadata(self, shop_id: str) -> Optional[dict]:
+        try:
+            with open(self.metadata_path(shop_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self, shop_id: str) -> bool:
+        """A model exists and was trained on today's feature layout"""
+        metadata = self.read_metadata(shop_id)
+        return (
+            metadata is not None
+            and metadata.get("feature_schema_hash") == self.schema_hash_for(shop_id)
+            and os.path.exists(self.model_path(shop_id))
+        )
+
+    def next_version(self, shop_id: str) -> int:
+        metadata = self.read_metadata(shop_id) or {}
+        return int(metadata.get("version") or 0) + 1
+
+    def load(self, shop_id: str, mmap_mode: Optional[str] = None):
+        """
+        Load a model and its estimated in-memory size (the file size; the
+        model's node arrays dominate both). Prefers the compact .npz forest
+        when training verified it; otherwise loads the joblib model. For
+        either format mmap_mode='r' memory-maps the arrays so worker
+        processes can share the pages.
+        """
+        metadata = self.read_metadata(shop_id) or {}
+        compact_path = self.compact_path(shop_id)
+        if metadata.get("compact_format") and os.path.exists(compact_path):
+            return CompactForest.load(compact_path, mmap_mode=mmap_mode), os.path.getsize(compact_path)
+
+        path = self.model_path(shop_id)
+        nbytes = os.path.getsize(path)
+        return joblib.load(path, mmap_mode=mmap_mode), nbytes
+
+# ==================== JOB QUEUE ====================
+
+class TrainingJob:
+    def __init__(self, shop_id: str):
+        self.job_id = uuid.uuid4().hex
+        self.shop_id = shop_id
+        self.status = "queued"  # queued | running | succeeded | insufficient_data | failed
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.error: Optional[str] = None
+        self.model: Optional[dict] = None
+        self.done = asyncio.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "shop_id": self.shop_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "model": self.model,
+        }
+
+class TrainingService:
+    """
+    Deduplicated per-shop training queue backed by a process pool. The
+    global model is queued like a shop under GLOBAL_MODEL_KEY.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        fetch_rows: Callable[[str], Awaitable[list]],
+        build_training_set: Callable[[list], tuple],
+        fetch_global_rows: Callable[[], Awaitable[tuple]],
+        build_global_training_set: Callable[[list, list], tuple],
+        on_trained: Callable[[str], None],
+        workers: int,
+        n_jobs: int,
+        min_rows: int,
+        insufficient_ttl_seconds: int,
+        failure_ttl_seconds: int,
+    ):
+        self.registry = registry
+        self.fetch_rows = fetch_rows
+        self.build_training_set = build_training_set
+        self.fetch_global_rows = fetch_global_rows
+        self.build_global_training_set = build_global_training_set
+        self.on_trained = on_trained
+        self.workers = workers
+        self.n_jobs = n_jobs
+        self.min_rows = min_rows
+        self.insufficient_ttl_seconds = insufficient_ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+        self.active_by_shop: Dict[str, TrainingJob] = {}
+        self.insufficient_until: Dict[str, float] = {}
+        self.failed_until: Dict[str, float] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    # ---------- negative cache ----------
+
+    @staticmethod
+    def _blocked(until: Dict[str, float], shop_id: str) -> bool:
+        expires_at = until.get(shop_id)
+        if expires_at is None:
+            return False
+        if time.monotonic() >= expires_at:
+            until.pop(shop_id, None)
+            return False
+        return True
+
+    def is_insufficient_data(self, shop_id: str) -> bool:
+        return self._blocked(self.insufficient_until, shop_id)
+
+    def is_backing_off(self, shop_id: str) -> bool:
+        """True while automatic training should not be queued for this shop:
+        too little data, or the last fit failed within failure_ttl_seconds"""
+        return self.is_insufficient_data(shop_id) or self._blocked(self.failed_until, shop_id)
+
+    # ---------- queue ----------
+
+    def enqueue(self, shop_id: str) -> TrainingJob:
+        """Queue a fit for a shop, or return the job already queued/running for it"""
+        existing = self.active_by_shop.get(shop_id)
+        if existing is not None and existing.active:
+            return existing
+
+        job = TrainingJob(shop_id)
+        self.active_by_shop[shop_id] = job
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > JOB_HISTORY_LIMIT:
+            self.jobs.popitem(last=False)
+
+        self.queue.put_nowait(job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[TrainingJob]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self, shop_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        jobs = [j for j in reversed(self.jobs.values()) if shop_id is None or j.shop_id == shop_id]
+        return [j.to_dict() for j in jobs[:limit]]
+
+    def stats(self) -> dict:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "sklearn_n_jobs": self.n_jobs,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "jobs": counts,
+        }
+
+    async def _prepare_fit(self, shop_id: str) -> Optional[tuple]:
+        """Fetch training data and return the process-pool call, or None if there is too little"""
+        # Metadata file reads and the up-to-200k-row matrix build stay off the event loop
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(None, self.registry.next_version, shop_id)
+        schema_hash = self.registry.schema_hash_for(shop_id)
+
+        if shop_id == GLOBAL_MODEL_KEY:
+            rows, profile_rows = await self.fetch_global_rows()
+            if len(rows) < self.min_rows:
+                return None
+            X, y, shop_profiles, default_profile = await loop.run_in_executor(
+                None, self.build_global_training_set, rows, profile_rows
+            )
+            return (
+                fit_global_model, X, y, shop_profiles, default_profile,
+                self.registry.model_path(shop_id),
+                self.registry.metadata_path(shop_id),
+                version, schema_hash,
+            )
+
+        rows = await self.fetch_rows(shop_id)
+        if len(rows) < self.min_rows:
+            return None
+        X, y = await loop.run_in_executor(None, self.build_training_set, rows)
+        return (
+            fit_shop_model, shop_id, X, y,
+            self.registry.model_path(shop_id),
+            self.registry.metadata_path(shop_id),
+            self.registry.compact_path(shop_id),
+            version, schema_hash, self.n_jobs,
+        )
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            job.started_at = datetime.now(timezone.utc).isoformat()
+
+            try:
+                fit_call = await self._prepare_fit(job.shop_id)
+
+                if fit_call is None:
+                    self.insufficient_until[job.shop_id] = time.monotonic() + self.insufficient_ttl_seconds
+                    job.status = "insufficient_data"
+                else:
+                    job.model = await loop.run_in_executor(self.executor, *fit_call)
+                    self.insufficient_until.pop(job.shop_id, None)
+                    self.failed_until.pop(job.shop_id, None)
+                    self.on_trained(job.shop_id)
+                    job.status = "succeeded"
+
+            except Exception as e:
+                self.failed_until[job.shop_id] = time.monotonic() + self.failure_ttl_seconds
+                job.status = "failed"
+                job.error = str(e)
+                print(f"⚠️ Training failed for shop {job.shop_id}: {e}")
+
+            finally:
+                job.finished_at = datetime.now(timezone.utc).isoformat()
+                job.done.set()
+                self.queue.task_done()
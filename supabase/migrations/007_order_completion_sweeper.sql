@@ -0,0 +1,85 @@
+-- Order Completion Sweeper: bulk auto-completion of ready orders
+-- Migration: 007_order_completion_sweeper.sql
+
+-- =========================================
+-- 1. INDEXES
+-- =========================================
+
+-- Only open orders are ever swept, so keep the index small
+CREATE INDEX IF NOT EXISTS idx_orders_open_ready_at
+  ON orders(ready_at)
+  WHERE status IN ('confirmed', 'pending') AND ready_at IS NOT NULL;
+
+-- =========================================
+-- 2. BULK COMPLETION
+-- =========================================
+
+-- Claim and complete every due order in one statement.
+-- Rows locked by a concurrent sweep are skipped, so two callers never
+-- complete (or notify) the same order twice.
+CREATE OR REPLACE FUNCTION complete_ready_orders(
+  p_now timestamptz DEFAULT now(),
+  p_customer_id uuid DEFAULT NULL,
+  p_limit integer DEFAULT 100
+)
+RETURNS TABLE (id uuid, customer_id uuid, shop_id uuid) AS $$
+BEGIN
+  RETURN QUERY
+  WITH due AS (
+    SELECT o.id
+    FROM orders o
+    WHERE o.status IN ('confirmed', 'pending')
+      AND o.ready_at IS NOT NULL
+      AND o.ready_at <= p_now
+      AND (p_customer_id IS NULL OR o.customer_id = p_customer_id)
+    ORDER BY o.ready_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE orders o
+  SET
+    status = 'completed',
+    completed_at = p_now,
+    updated_at = p_now,
+    metadata = COALESCE(o.metadata, '{}'::jsonb) || jsonb_build_object(
+      'auto_completed', true,
+      'auto_completed_at', p_now
+    )
+  FROM due
+  WHERE o.id = due.id
+  RETURNING o.id, o.customer_id, o.shop_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Record ready-push delivery for a batch of orders in one write
+CREATE OR REPLACE FUNCTION mark_ready_push_sent(
+  p_order_ids uuid[],
+  p_sent_at timestamptz DEFAULT now()
+)
+RETURNS integer AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  UPDATE orders
+  SET metadata = COALESCE(metadata, '{}'::jsonb) || jsonb_build_object(
+    'ready_push_sent', true,
+    'ready_push_sent_at', p_sent_at
+  )
+  WHERE id = ANY(p_order_ids);
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE ALL ON FUNCTION complete_ready_orders(timestamptz, uuid, integer) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION mark_ready_push_sent(uuid[], timestamptz) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Order completion sweeper migration completed successfully';
+END $$;
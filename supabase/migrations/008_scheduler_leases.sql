@@ -0,0 +1,104 @@
+-- Background Scheduler: leader lease + sweep deadlines
+-- Migration: 008_scheduler_leases.sql
+
+-- =========================================
+-- 1. LEADER LEASES
+-- =========================================
+
+-- One row per scheduler. Only the holder of an unexpired lease runs sweeps,
+-- so multiple API workers never duplicate work.
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+  name text PRIMARY KEY,
+  holder text NOT NULL,
+  acquired_at timestamptz NOT NULL DEFAULT now(),
+  expires_at timestamptz NOT NULL
+);
+
+ALTER TABLE scheduler_leases ENABLE ROW LEVEL SECURITY;
+REVOKE ALL PRIVILEGES ON TABLE scheduler_leases FROM anon, authenticated;
+
+-- Acquire or renew a lease. PostgREST pools connections, so a session-level
+-- advisory lock cannot represent leadership; the transaction-level advisory
+-- lock only serializes contenders while the lease row is checked and written.
+CREATE OR REPLACE FUNCTION try_acquire_scheduler_lease(
+  p_name text,
+  p_holder text,
+  p_ttl_seconds integer DEFAULT 60
+)
+RETURNS boolean AS $$
+DECLARE
+  v_holder text;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('scheduler_lease:' || p_name)) THEN
+    RETURN false;
+  END IF;
+
+  INSERT INTO scheduler_leases (name, holder, acquired_at, expires_at)
+  VALUES (p_name, p_holder, now(), now() + make_interval(secs => p_ttl_seconds))
+  ON CONFLICT (name) DO UPDATE
+  SET
+    holder = EXCLUDED.holder,
+    acquired_at = CASE
+      WHEN scheduler_leases.holder = EXCLUDED.holder THEN scheduler_leases.acquired_at
+      ELSE now()
+    END,
+    expires_at = EXCLUDED.expires_at
+  WHERE scheduler_leases.holder = EXCLUDED.holder
+     OR scheduler_leases.expires_at <= now()
+  RETURNING holder INTO v_holder;
+
+  RETURN v_holder IS NOT DISTINCT FROM p_holder;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Step down voluntarily on shutdown so another worker takes over immediately
+CREATE OR REPLACE FUNCTION release_scheduler_lease(p_name text, p_holder text)
+RETURNS void AS $$
+BEGIN
+  DELETE FROM scheduler_leases WHERE name = p_name AND holder = p_holder;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =========================================
+-- 2. SWEEP DEADLINES
+-- =========================================
+
+CREATE INDEX IF NOT EXISTS idx_points_transactions_pending_available_at
+  ON points_transactions(available_at)
+  WHERE status = 'pending' AND type = 'earned';
+
+-- Earliest upcoming ready_at / available_at, so the scheduler can sleep
+-- until exactly the next due item instead of polling.
+CREATE OR REPLACE FUNCTION next_sweep_deadlines()
+RETURNS TABLE (next_ready_at timestamptz, next_available_at timestamptz) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    (
+      SELECT MIN(o.ready_at)
+      FROM orders o
+      WHERE o.status IN ('confirmed', 'pending')
+        AND o.ready_at IS NOT NULL
+    ),
+    (
+      SELECT MIN(t.available_at)
+      FROM points_transactions t
+      WHERE t.status = 'pending'
+        AND t.type = 'earned'
+        AND t.points_type = 'shop'
+    );
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+REVOKE ALL ON FUNCTION try_acquire_scheduler_lease(text, text, integer) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION release_scheduler_lease(text, text) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION next_sweep_deadlines() FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Scheduler leases migration completed successfully';
+END $$;
@@ -0,0 +1,48 @@
+-- Effective Points Balances: read-side view over pending releases
+-- Migration: 009_effective_points_balances.sql
+
+-- =========================================
+-- 1. RELEASE-HORIZON INDEX
+-- =========================================
+
+-- Pending earned points per customer/shop ordered by release time. Serves
+-- the due_points lookup below without touching released history.
+CREATE INDEX IF NOT EXISTS idx_points_transactions_pending_customer_shop
+  ON points_transactions(customer_id, shop_id, available_at)
+  WHERE status = 'pending' AND type = 'earned';
+
+-- =========================================
+-- 2. EFFECTIVE BALANCE VIEW
+-- =========================================
+
+-- customer_shop_points plus the pending points whose available_at has
+-- already passed but that the background sweeper has not released yet.
+-- Readers fold due_points into current_balance, so read endpoints never
+-- need to release points themselves.
+CREATE OR REPLACE VIEW customer_shop_points_effective
+WITH (security_invoker = true) AS
+SELECT
+  csp.*,
+  COALESCE(due.points, 0)::integer AS due_points
+FROM customer_shop_points csp
+LEFT JOIN LATERAL (
+  SELECT SUM(t.amount) AS points
+  FROM points_transactions t
+  WHERE t.customer_id = csp.customer_id
+    AND t.shop_id = csp.shop_id
+    AND t.status = 'pending'
+    AND t.type = 'earned'
+    AND t.points_type = 'shop'
+    AND t.available_at <= now()
+) due ON true;
+
+REVOKE ALL PRIVILEGES ON TABLE customer_shop_points_effective FROM anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Effective points balances migration completed successfully';
+END $$;
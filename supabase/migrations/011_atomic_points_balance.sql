@@ -0,0 +1,94 @@
+-- Atomic Points Balance Updates
+-- Migration: 011_atomic_points_balance.sql
+
+-- =========================================
+-- 1. CONSTRAINTS
+-- =========================================
+
+-- One balance row per customer per shop (required for ON CONFLICT upserts)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_customer_shop_points_customer_shop
+  ON customer_shop_points(customer_id, shop_id);
+
+ALTER TABLE customer_shop_points DROP CONSTRAINT IF EXISTS check_current_balance_non_negative;
+ALTER TABLE customer_shop_points ADD CONSTRAINT check_current_balance_non_negative CHECK (current_balance >= 0);
+
+ALTER TABLE customer_shop_points DROP CONSTRAINT IF EXISTS check_pending_balance_non_negative;
+ALTER TABLE customer_shop_points ADD CONSTRAINT check_pending_balance_non_negative CHECK (pending_balance >= 0);
+
+ALTER TABLE customer_shop_points DROP CONSTRAINT IF EXISTS check_total_spent_non_negative;
+ALTER TABLE customer_shop_points ADD CONSTRAINT check_total_spent_non_negative CHECK (total_spent >= 0);
+
+-- =========================================
+-- 2. ATOMIC INCREMENT
+-- =========================================
+
+-- balance = balance + delta in a single statement, creating the row if
+-- needed. pending_balance and total_spent clamp at zero (matching the old
+-- application logic); current_balance is left to the check constraint so a
+-- negative result fails instead of silently flooring.
+CREATE OR REPLACE FUNCTION increment_points_balance(
+  p_customer_id uuid,
+  p_shop_id uuid,
+  p_current_delta integer DEFAULT 0,
+  p_pending_delta integer DEFAULT 0,
+  p_earned_delta integer DEFAULT 0,
+  p_spent_delta integer DEFAULT 0
+)
+RETURNS SETOF customer_shop_points AS $$
+BEGIN
+  RETURN QUERY
+  INSERT INTO customer_shop_points AS csp (
+    customer_id, shop_id, current_balance, pending_balance, total_earned, total_spent
+  )
+  VALUES (
+    p_customer_id,
+    p_shop_id,
+    p_current_delta,
+    GREATEST(0, p_pending_delta),
+    GREATEST(0, p_earned_delta),
+    GREATEST(0, p_spent_delta)
+  )
+  ON CONFLICT (customer_id, shop_id) DO UPDATE
+  SET
+    current_balance = csp.current_balance + p_current_delta,
+    pending_balance = GREATEST(0, csp.pending_balance + p_pending_delta),
+    total_earned = csp.total_earned + p_earned_delta,
+    total_spent = GREATEST(0, csp.total_spent + p_spent_delta),
+    updated_at = now()
+  RETURNING csp.*;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deduct redeemable points only if enough are available. Returns no row
+-- when the balance is insufficient.
+CREATE OR REPLACE FUNCTION redeem_points_balance(
+  p_customer_id uuid,
+  p_shop_id uuid,
+  p_points integer
+)
+RETURNS SETOF customer_shop_points AS $$
+BEGIN
+  RETURN QUERY
+  UPDATE customer_shop_points AS csp
+  SET
+    current_balance = csp.current_balance - p_points,
+    total_spent = csp.total_spent + p_points,
+    updated_at = now()
+  WHERE csp.customer_id = p_customer_id
+    AND csp.shop_id = p_shop_id
+    AND csp.current_balance >= p_points
+  RETURNING csp.*;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE ALL ON FUNCTION increment_points_balance(uuid, uuid, integer, integer, integer, integer) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION redeem_points_balance(uuid, uuid, integer) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Atomic points balance migration completed successfully';
+END $$;
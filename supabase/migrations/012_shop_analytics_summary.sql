@@ -0,0 +1,71 @@
+-- Shop Analytics Summary: database-side dashboard aggregates
+-- Migration: 012_shop_analytics_summary.sql
+
+-- =========================================
+-- 1. COVERING INDEXES
+-- =========================================
+
+-- Completed-order totals per shop; INCLUDE (total) lets SUM/AVG run as an
+-- index-only scan instead of visiting (or shipping) every order row.
+CREATE INDEX IF NOT EXISTS idx_orders_shop_completed_total
+  ON orders(shop_id)
+  INCLUDE (total)
+  WHERE status = 'completed';
+
+-- Today's figures: range scan on (shop_id, created_at)
+CREATE INDEX IF NOT EXISTS idx_orders_shop_created_total
+  ON orders(shop_id, created_at)
+  INCLUDE (total);
+
+-- =========================================
+-- 2. SUMMARY FUNCTION
+-- =========================================
+
+-- Everything ShopService.get_shop_analytics needs in one row, aggregated
+-- in Postgres:
+--   total_orders / total_revenue / avg_order_value over completed orders
+--   orders_today / revenue_today over all orders since p_day_start
+CREATE OR REPLACE FUNCTION get_shop_analytics_summary(
+  p_shop_id uuid,
+  p_day_start timestamptz DEFAULT date_trunc('day', now())
+)
+RETURNS TABLE (
+  total_orders bigint,
+  total_revenue numeric,
+  avg_order_value numeric,
+  orders_today bigint,
+  revenue_today numeric
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    totals.orders,
+    totals.revenue,
+    CASE WHEN totals.orders > 0 THEN totals.revenue / totals.orders ELSE 0 END,
+    today.orders,
+    today.revenue
+  FROM (
+    SELECT COUNT(*) AS orders, COALESCE(SUM(o.total), 0) AS revenue
+    FROM orders o
+    WHERE o.shop_id = p_shop_id
+      AND o.status = 'completed'
+  ) totals
+  CROSS JOIN (
+    SELECT COUNT(*) AS orders, COALESCE(SUM(o.total), 0) AS revenue
+    FROM orders o
+    WHERE o.shop_id = p_shop_id
+      AND o.created_at >= p_day_start
+  ) today;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+REVOKE ALL ON FUNCTION get_shop_analytics_summary(uuid, timestamptz) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Shop analytics summary migration completed successfully';
+END $$;
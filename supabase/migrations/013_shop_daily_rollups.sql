@@ -0,0 +1,298 @@
+-- Shop Daily Rollups: incrementally maintained per-shop per-day analytics
+-- Migration: 013_shop_daily_rollups.sql
+
+-- =========================================
+-- 1. ROLLUP TABLES
+-- =========================================
+
+-- One row per shop per UTC day. Only placed orders count (pending,
+-- confirmed, completed); payment_pending / payment_failed / cancelled
+-- orders are excluded. Maintained by the triggers below, so dashboards
+-- read a handful of rows instead of scanning orders.
+CREATE TABLE IF NOT EXISTS shop_daily_rollups (
+  shop_id uuid NOT NULL,
+  day date NOT NULL,
+  orders integer NOT NULL DEFAULT 0,
+  revenue numeric(14,2) NOT NULL DEFAULT 0,
+  completed_orders integer NOT NULL DEFAULT 0,
+  completed_revenue numeric(14,2) NOT NULL DEFAULT 0,
+  customers integer NOT NULL DEFAULT 0,
+  items_sold integer NOT NULL DEFAULT 0,
+  prep_seconds_total numeric(14,2) NOT NULL DEFAULT 0,
+  prep_samples integer NOT NULL DEFAULT 0,
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (shop_id, day)
+);
+
+-- Orders per customer per shop-day, so customers stays a distinct count
+-- under incremental inserts, status changes and deletes.
+CREATE TABLE IF NOT EXISTS shop_daily_customers (
+  shop_id uuid NOT NULL,
+  day date NOT NULL,
+  customer_id uuid NOT NULL,
+  orders integer NOT NULL DEFAULT 0,
+  PRIMARY KEY (shop_id, day, customer_id)
+);
+
+ALTER TABLE shop_daily_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE shop_daily_customers ENABLE ROW LEVEL SECURITY;
+REVOKE ALL PRIVILEGES ON TABLE shop_daily_rollups FROM anon, authenticated;
+REVOKE ALL PRIVILEGES ON TABLE shop_daily_customers FROM anon, authenticated;
+
+-- =========================================
+-- 2. INCREMENTAL MAINTENANCE
+-- =========================================
+
+CREATE OR REPLACE FUNCTION order_counts_in_rollups(p_status text)
+RETURNS boolean AS $$
+  SELECT p_status IN ('pending', 'confirmed', 'completed');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Add (p_sign = 1) or remove (p_sign = -1) one order's contribution
+CREATE OR REPLACE FUNCTION apply_order_to_rollups(p_order orders, p_sign integer)
+RETURNS void AS $$
+DECLARE
+  v_day date;
+  v_items integer;
+  v_completed integer;
+  v_prep numeric;
+  v_customer_orders integer;
+  v_customer_delta integer := 0;
+BEGIN
+  IF p_order.shop_id IS NULL OR NOT order_counts_in_rollups(p_order.status) THEN
+    RETURN;
+  END IF;
+
+  v_day := (COALESCE(p_order.created_at, now()) AT TIME ZONE 'UTC')::date;
+  v_completed := CASE WHEN p_order.status = 'completed' THEN 1 ELSE 0 END;
+
+  SELECT COALESCE(SUM(oi.quantity), 0)::integer
+  INTO v_items
+  FROM order_items oi
+  WHERE oi.order_id = p_order.id;
+
+  IF v_completed = 1 AND COALESCE(p_order.ready_at, p_order.completed_at) IS NOT NULL THEN
+    v_prep := GREATEST(0, EXTRACT(EPOCH FROM COALESCE(p_order.ready_at, p_order.completed_at) - p_order.created_at));
+  END IF;
+
+  IF p_order.customer_id IS NOT NULL AND p_sign > 0 THEN
+    INSERT INTO shop_daily_customers AS c (shop_id, day, customer_id, orders)
+    VALUES (p_order.shop_id, v_day, p_order.customer_id, 1)
+    ON CONFLICT (shop_id, day, customer_id) DO UPDATE
+    SET orders = c.orders + 1
+    RETURNING c.orders INTO v_customer_orders;
+
+    IF v_customer_orders = 1 THEN
+      v_customer_delta := 1;
+    END IF;
+  ELSIF p_order.customer_id IS NOT NULL THEN
+    UPDATE shop_daily_customers c
+    SET orders = c.orders - 1
+    WHERE c.shop_id = p_order.shop_id AND c.day = v_day AND c.customer_id = p_order.customer_id
+    RETURNING c.orders INTO v_customer_orders;
+
+    IF FOUND AND v_customer_orders <= 0 THEN
+      v_customer_delta := -1;
+      DELETE FROM shop_daily_customers c
+      WHERE c.shop_id = p_order.shop_id AND c.day = v_day AND c.customer_id = p_order.customer_id;
+    END IF;
+  END IF;
+
+  INSERT INTO shop_daily_rollups AS r (
+    shop_id, day, orders, revenue, completed_orders, completed_revenue,
+    customers, items_sold, prep_seconds_total, prep_samples
+  )
+  VALUES (
+    p_order.shop_id,
+    v_day,
+    p_sign,
+    p_sign * COALESCE(p_order.total, 0),
+    p_sign * v_completed,
+    p_sign * v_completed * COALESCE(p_order.total, 0),
+    v_customer_delta,
+    p_sign * v_items,
+    p_sign * COALESCE(v_prep, 0),
+    p_sign * CASE WHEN v_prep IS NULL THEN 0 ELSE 1 END
+  )
+  ON CONFLICT (shop_id, day) DO UPDATE
+  SET
+    orders = r.orders + EXCLUDED.orders,
+    revenue = r.revenue + EXCLUDED.revenue,
+    completed_orders = r.completed_orders + EXCLUDED.completed_orders,
+    completed_revenue = r.completed_revenue + EXCLUDED.completed_revenue,
+    customers = r.customers + EXCLUDED.customers,
+    items_sold = r.items_sold + EXCLUDED.items_sold,
+    prep_seconds_total = r.prep_seconds_total + EXCLUDED.prep_seconds_total,
+    prep_samples = r.prep_samples + EXCLUDED.prep_samples,
+    updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION orders_rollup_trigger()
+RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM apply_order_to_rollups(OLD, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM apply_order_to_rollups(NEW, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Items are inserted after their order; keep items_sold in step with them
+CREATE OR REPLACE FUNCTION order_items_rollup_trigger()
+RETURNS trigger AS $$
+DECLARE
+  v_order orders;
+  v_delta integer;
+BEGIN
+  v_delta := CASE TG_OP
+    WHEN 'INSERT' THEN NEW.quantity
+    WHEN 'DELETE' THEN -OLD.quantity
+    ELSE NEW.quantity - OLD.quantity
+  END;
+
+  SELECT * INTO v_order FROM orders WHERE id = COALESCE(NEW.order_id, OLD.order_id);
+
+  IF v_delta = 0
+     OR v_order.id IS NULL
+     OR v_order.shop_id IS NULL
+     OR NOT order_counts_in_rollups(v_order.status) THEN
+    RETURN NULL;
+  END IF;
+
+  UPDATE shop_daily_rollups
+  SET items_sold = items_sold + v_delta, updated_at = now()
+  WHERE shop_id = v_order.shop_id
+    AND day = (COALESCE(v_order.created_at, now()) AT TIME ZONE 'UTC')::date;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS orders_rollup_insert_delete ON orders;
+CREATE TRIGGER orders_rollup_insert_delete
+  AFTER INSERT OR DELETE ON orders
+  FOR EACH ROW EXECUTE FUNCTION orders_rollup_trigger();
+
+DROP TRIGGER IF EXISTS orders_rollup_update ON orders;
+CREATE TRIGGER orders_rollup_update
+  AFTER UPDATE OF status, total, shop_id, customer_id, created_at, ready_at, completed_at ON orders
+  FOR EACH ROW
+  WHEN (
+    (OLD.status, OLD.total, OLD.shop_id, OLD.customer_id, OLD.created_at, OLD.ready_at, OLD.completed_at)
+    IS DISTINCT FROM
+    (NEW.status, NEW.total, NEW.shop_id, NEW.customer_id, NEW.created_at, NEW.ready_at, NEW.completed_at)
+  )
+  EXECUTE FUNCTION orders_rollup_trigger();
+
+DROP TRIGGER IF EXISTS order_items_rollup ON order_items;
+CREATE TRIGGER order_items_rollup
+  AFTER INSERT OR DELETE OR UPDATE OF quantity ON order_items
+  FOR EACH ROW EXECUTE FUNCTION order_items_rollup_trigger();
+
+-- =========================================
+-- 3. REBUILD / BACKFILL
+-- =========================================
+
+-- Recompute rollups from orders (one shop, or every shop when NULL).
+-- Used for the initial backfill and for reconciliation.
+CREATE OR REPLACE FUNCTION rebuild_shop_daily_rollups(p_shop_id uuid DEFAULT NULL)
+RETURNS integer AS $$
+DECLARE
+  v_rows integer;
+BEGIN
+  DELETE FROM shop_daily_rollups WHERE p_shop_id IS NULL OR shop_id = p_shop_id;
+  DELETE FROM shop_daily_customers WHERE p_shop_id IS NULL OR shop_id = p_shop_id;
+
+  INSERT INTO shop_daily_customers (shop_id, day, customer_id, orders)
+  SELECT o.shop_id, (o.created_at AT TIME ZONE 'UTC')::date, o.customer_id, COUNT(*)
+  FROM orders o
+  WHERE o.shop_id IS NOT NULL
+    AND o.customer_id IS NOT NULL
+    AND order_counts_in_rollups(o.status)
+    AND (p_shop_id IS NULL OR o.shop_id = p_shop_id)
+  GROUP BY 1, 2, 3;
+
+  INSERT INTO shop_daily_rollups (
+    shop_id, day, orders, revenue, completed_orders, completed_revenue,
+    customers, items_sold, prep_seconds_total, prep_samples
+  )
+  SELECT
+    o.shop_id,
+    (o.created_at AT TIME ZONE 'UTC')::date AS day,
+    COUNT(*),
+    COALESCE(SUM(o.total), 0),
+    COUNT(*) FILTER (WHERE o.status = 'completed'),
+    COALESCE(SUM(o.total) FILTER (WHERE o.status = 'completed'), 0),
+    COUNT(DISTINCT o.customer_id),
+    COALESCE(SUM(items.quantity), 0),
+    COALESCE(SUM(GREATEST(0, EXTRACT(EPOCH FROM COALESCE(o.ready_at, o.completed_at) - o.created_at)))
+      FILTER (WHERE o.status = 'completed' AND COALESCE(o.ready_at, o.completed_at) IS NOT NULL), 0),
+    COUNT(*) FILTER (WHERE o.status = 'completed' AND COALESCE(o.ready_at, o.completed_at) IS NOT NULL)
+  FROM orders o
+  LEFT JOIN LATERAL (
+    SELECT SUM(oi.quantity) AS quantity
+    FROM order_items oi
+    WHERE oi.order_id = o.id
+  ) items ON true
+  WHERE o.shop_id IS NOT NULL
+    AND order_counts_in_rollups(o.status)
+    AND (p_shop_id IS NULL OR o.shop_id = p_shop_id)
+  GROUP BY 1, 2;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_shop_daily_rollups();
+
+-- =========================================
+-- 4. READ FUNCTIONS
+-- =========================================
+
+-- Dashboard summary now reads rollups: totals over the shop's days,
+-- today's figures from the row for p_day_start's UTC date.
+CREATE OR REPLACE FUNCTION get_shop_analytics_summary(
+  p_shop_id uuid,
+  p_day_start timestamptz DEFAULT date_trunc('day', now())
+)
+RETURNS TABLE (
+  total_orders bigint,
+  total_revenue numeric,
+  avg_order_value numeric,
+  orders_today bigint,
+  revenue_today numeric
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    COALESCE(SUM(r.completed_orders), 0)::bigint,
+    COALESCE(SUM(r.completed_revenue), 0),
+    CASE
+      WHEN COALESCE(SUM(r.completed_orders), 0) > 0
+        THEN SUM(r.completed_revenue) / SUM(r.completed_orders)
+      ELSE 0
+    END,
+    COALESCE(SUM(r.orders) FILTER (WHERE r.day = (p_day_start AT TIME ZONE 'UTC')::date), 0)::bigint,
+    COALESCE(SUM(r.revenue) FILTER (WHERE r.day = (p_day_start AT TIME ZONE 'UTC')::date), 0)
+  FROM shop_daily_rollups r
+  WHERE r.shop_id = p_shop_id;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+REVOKE ALL ON FUNCTION apply_order_to_rollups(orders, integer) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION rebuild_shop_daily_rollups(uuid) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION get_shop_analytics_summary(uuid, timestamptz) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Shop daily rollups migration completed successfully';
+END $$;
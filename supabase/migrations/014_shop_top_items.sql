@@ -0,0 +1,335 @@
+-- Shop Top Items: incrementally maintained best-seller rankings
+-- Migration: 014_shop_top_items.sql
+
+-- =========================================
+-- 1. ITEM SALES TABLES
+-- =========================================
+
+-- Per menu item per UTC day, for the 7d / 30d windows
+CREATE TABLE IF NOT EXISTS shop_item_daily_sales (
+  shop_id uuid NOT NULL,
+  menu_item_id uuid NOT NULL,
+  day date NOT NULL,
+  order_count integer NOT NULL DEFAULT 0,
+  quantity integer NOT NULL DEFAULT 0,
+  revenue numeric(14,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (shop_id, day, menu_item_id)
+);
+
+-- All-time per menu item
+CREATE TABLE IF NOT EXISTS shop_item_sales (
+  shop_id uuid NOT NULL,
+  menu_item_id uuid NOT NULL,
+  order_count integer NOT NULL DEFAULT 0,
+  quantity integer NOT NULL DEFAULT 0,
+  revenue numeric(14,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (shop_id, menu_item_id)
+);
+
+-- Ranked top sellers per shop and window ('7d', '30d', 'all'),
+-- recomputed from the sales tables when older than the caller's max age
+CREATE TABLE IF NOT EXISTS shop_top_items (
+  shop_id uuid NOT NULL,
+  time_window text NOT NULL CHECK (time_window IN ('7d', '30d', 'all')),
+  rank integer NOT NULL,
+  menu_item_id uuid NOT NULL,
+  order_count integer NOT NULL,
+  quantity integer NOT NULL,
+  revenue numeric(14,2) NOT NULL,
+  PRIMARY KEY (shop_id, time_window, rank)
+);
+
+-- When each shop's rankings were last computed (also for shops with no sales)
+CREATE TABLE IF NOT EXISTS shop_top_items_refreshed (
+  shop_id uuid PRIMARY KEY,
+  computed_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE shop_item_daily_sales ENABLE ROW LEVEL SECURITY;
+ALTER TABLE shop_item_sales ENABLE ROW LEVEL SECURITY;
+ALTER TABLE shop_top_items ENABLE ROW LEVEL SECURITY;
+ALTER TABLE shop_top_items_refreshed ENABLE ROW LEVEL SECURITY;
+REVOKE ALL PRIVILEGES ON TABLE shop_item_daily_sales FROM anon, authenticated;
+REVOKE ALL PRIVILEGES ON TABLE shop_item_sales FROM anon, authenticated;
+REVOKE ALL PRIVILEGES ON TABLE shop_top_items FROM anon, authenticated;
+REVOKE ALL PRIVILEGES ON TABLE shop_top_items_refreshed FROM anon, authenticated;
+
+-- =========================================
+-- 2. INCREMENTAL MAINTENANCE
+-- =========================================
+
+-- Add (p_sign = 1) or remove (p_sign = -1) order lines for one order.
+-- p_item_id limits it to a single order_items row (item-level triggers).
+CREATE OR REPLACE FUNCTION apply_order_to_item_sales(
+  p_order orders,
+  p_sign integer,
+  p_item_id uuid DEFAULT NULL
+)
+RETURNS void AS $$
+DECLARE
+  v_day date;
+BEGIN
+  IF p_order.shop_id IS NULL OR NOT order_counts_in_rollups(p_order.status) THEN
+    RETURN;
+  END IF;
+
+  v_day := (COALESCE(p_order.created_at, now()) AT TIME ZONE 'UTC')::date;
+
+  INSERT INTO shop_item_daily_sales AS s (shop_id, menu_item_id, day, order_count, quantity, revenue)
+  SELECT
+    p_order.shop_id,
+    oi.menu_item_id,
+    v_day,
+    p_sign * COUNT(*),
+    p_sign * SUM(oi.quantity),
+    p_sign * COALESCE(SUM(oi.total_price), 0)
+  FROM order_items oi
+  WHERE oi.order_id = p_order.id
+    AND oi.menu_item_id IS NOT NULL
+    AND (p_item_id IS NULL OR oi.id = p_item_id)
+  GROUP BY oi.menu_item_id
+  ON CONFLICT (shop_id, day, menu_item_id) DO UPDATE
+  SET
+    order_count = s.order_count + EXCLUDED.order_count,
+    quantity = s.quantity + EXCLUDED.quantity,
+    revenue = s.revenue + EXCLUDED.revenue;
+
+  INSERT INTO shop_item_sales AS s (shop_id, menu_item_id, order_count, quantity, revenue)
+  SELECT
+    p_order.shop_id,
+    oi.menu_item_id,
+    p_sign * COUNT(*),
+    p_sign * SUM(oi.quantity),
+    p_sign * COALESCE(SUM(oi.total_price), 0)
+  FROM order_items oi
+  WHERE oi.order_id = p_order.id
+    AND oi.menu_item_id IS NOT NULL
+    AND (p_item_id IS NULL OR oi.id = p_item_id)
+  GROUP BY oi.menu_item_id
+  ON CONFLICT (shop_id, menu_item_id) DO UPDATE
+  SET
+    order_count = s.order_count + EXCLUDED.order_count,
+    quantity = s.quantity + EXCLUDED.quantity,
+    revenue = s.revenue + EXCLUDED.revenue;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Same triggers as migration 013, now also feeding item sales
+CREATE OR REPLACE FUNCTION orders_rollup_trigger()
+RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM apply_order_to_rollups(OLD, -1);
+    PERFORM apply_order_to_item_sales(OLD, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM apply_order_to_rollups(NEW, 1);
+    PERFORM apply_order_to_item_sales(NEW, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION order_items_rollup_trigger()
+RETURNS trigger AS $$
+DECLARE
+  v_order orders;
+  v_delta integer;
+BEGIN
+  v_delta := CASE TG_OP
+    WHEN 'INSERT' THEN NEW.quantity
+    WHEN 'DELETE' THEN -OLD.quantity
+    ELSE NEW.quantity - OLD.quantity
+  END;
+
+  SELECT * INTO v_order FROM orders WHERE id = COALESCE(NEW.order_id, OLD.order_id);
+
+  IF v_order.id IS NULL
+     OR v_order.shop_id IS NULL
+     OR NOT order_counts_in_rollups(v_order.status) THEN
+    RETURN NULL;
+  END IF;
+
+  IF v_delta <> 0 THEN
+    UPDATE shop_daily_rollups
+    SET items_sold = items_sold + v_delta, updated_at = now()
+    WHERE shop_id = v_order.shop_id
+      AND day = (COALESCE(v_order.created_at, now()) AT TIME ZONE 'UTC')::date;
+  END IF;
+
+  -- The row is visible in AFTER triggers for INSERT/UPDATE only, so
+  -- deletes and the old side of updates are applied from OLD directly.
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.menu_item_id IS NOT NULL THEN
+    UPDATE shop_item_daily_sales
+    SET
+      order_count = order_count - 1,
+      quantity = quantity - OLD.quantity,
+      revenue = revenue - COALESCE(OLD.total_price, 0)
+    WHERE shop_id = v_order.shop_id
+      AND day = (COALESCE(v_order.created_at, now()) AT TIME ZONE 'UTC')::date
+      AND menu_item_id = OLD.menu_item_id;
+
+    UPDATE shop_item_sales
+    SET
+      order_count = order_count - 1,
+      quantity = quantity - OLD.quantity,
+      revenue = revenue - COALESCE(OLD.total_price, 0)
+    WHERE shop_id = v_order.shop_id
+      AND menu_item_id = OLD.menu_item_id;
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM apply_order_to_item_sales(v_order, 1, NEW.id);
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS order_items_rollup ON order_items;
+CREATE TRIGGER order_items_rollup
+  AFTER INSERT OR DELETE OR UPDATE OF quantity, total_price, menu_item_id ON order_items
+  FOR EACH ROW EXECUTE FUNCTION order_items_rollup_trigger();
+
+-- =========================================
+-- 3. RANKINGS
+-- =========================================
+
+CREATE OR REPLACE FUNCTION refresh_shop_top_items(p_shop_id uuid, p_limit integer DEFAULT 20)
+RETURNS void AS $$
+DECLARE
+  v_today date := (now() AT TIME ZONE 'UTC')::date;
+BEGIN
+  -- Serialize concurrent refreshes of the same shop
+  PERFORM pg_advisory_xact_lock(hashtext('shop_top_items:' || p_shop_id::text));
+
+  DELETE FROM shop_top_items WHERE shop_id = p_shop_id;
+
+  INSERT INTO shop_top_items (shop_id, time_window, rank, menu_item_id, order_count, quantity, revenue)
+  SELECT p_shop_id, w.time_window, w.rank, w.menu_item_id, w.order_count, w.quantity, w.revenue
+  FROM (
+    SELECT
+      windowed.time_window,
+      windowed.menu_item_id,
+      windowed.order_count,
+      windowed.quantity,
+      windowed.revenue,
+      ROW_NUMBER() OVER (
+        PARTITION BY windowed.time_window
+        ORDER BY windowed.order_count DESC, windowed.quantity DESC, windowed.menu_item_id
+      )::integer AS rank
+    FROM (
+      SELECT d.time_window, s.menu_item_id,
+             SUM(s.order_count)::integer AS order_count,
+             SUM(s.quantity)::integer AS quantity,
+             SUM(s.revenue) AS revenue
+      FROM shop_item_daily_sales s
+      JOIN (VALUES ('7d', 7), ('30d', 30)) AS d(time_window, days)
+        ON s.day > v_today - d.days
+      WHERE s.shop_id = p_shop_id
+      GROUP BY d.time_window, s.menu_item_id
+
+      UNION ALL
+
+      SELECT 'all', s.menu_item_id, s.order_count, s.quantity, s.revenue
+      FROM shop_item_sales s
+      WHERE s.shop_id = p_shop_id
+    ) windowed
+    WHERE windowed.order_count > 0
+  ) w
+  WHERE w.rank <= p_limit;
+
+  INSERT INTO shop_top_items_refreshed (shop_id, computed_at)
+  VALUES (p_shop_id, now())
+  ON CONFLICT (shop_id) DO UPDATE SET computed_at = EXCLUDED.computed_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Top sellers for one window, refreshing the shop's rankings first if they
+-- are older than p_max_age_seconds (7d/30d windows age even without orders).
+CREATE OR REPLACE FUNCTION get_shop_top_items(
+  p_shop_id uuid,
+  p_window text DEFAULT 'all',
+  p_limit integer DEFAULT 5,
+  p_max_age_seconds integer DEFAULT 300
+)
+RETURNS TABLE (
+  id uuid,
+  shop_id uuid,
+  name text,
+  base_price numeric,
+  order_count integer,
+  total_quantity_sold integer,
+  total_revenue numeric,
+  rank integer,
+  computed_at timestamptz
+) AS $$
+DECLARE
+  v_computed_at timestamptz;
+BEGIN
+  SELECT r.computed_at INTO v_computed_at
+  FROM shop_top_items_refreshed r
+  WHERE r.shop_id = p_shop_id;
+
+  IF v_computed_at IS NULL OR v_computed_at < now() - make_interval(secs => p_max_age_seconds) THEN
+    PERFORM refresh_shop_top_items(p_shop_id, GREATEST(p_limit, 20));
+    v_computed_at := now();
+  END IF;
+
+  RETURN QUERY
+  SELECT mi.id, t.shop_id, mi.name, mi.base_price, t.order_count, t.quantity, t.revenue, t.rank, v_computed_at
+  FROM shop_top_items t
+  JOIN menu_items mi ON mi.id = t.menu_item_id
+  WHERE t.shop_id = p_shop_id
+    AND t.time_window = p_window
+    AND t.rank <= p_limit
+  ORDER BY t.rank;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =========================================
+-- 4. BACKFILL
+-- =========================================
+
+CREATE OR REPLACE FUNCTION rebuild_shop_item_sales(p_shop_id uuid DEFAULT NULL)
+RETURNS void AS $$
+BEGIN
+  DELETE FROM shop_item_daily_sales WHERE p_shop_id IS NULL OR shop_id = p_shop_id;
+  DELETE FROM shop_item_sales WHERE p_shop_id IS NULL OR shop_id = p_shop_id;
+  DELETE FROM shop_top_items WHERE p_shop_id IS NULL OR shop_id = p_shop_id;
+  DELETE FROM shop_top_items_refreshed WHERE p_shop_id IS NULL OR shop_id = p_shop_id;
+
+  INSERT INTO shop_item_daily_sales (shop_id, menu_item_id, day, order_count, quantity, revenue)
+  SELECT o.shop_id, oi.menu_item_id, (o.created_at AT TIME ZONE 'UTC')::date,
+         COUNT(*), SUM(oi.quantity), COALESCE(SUM(oi.total_price), 0)
+  FROM order_items oi
+  JOIN orders o ON o.id = oi.order_id
+  WHERE o.shop_id IS NOT NULL
+    AND oi.menu_item_id IS NOT NULL
+    AND order_counts_in_rollups(o.status)
+    AND (p_shop_id IS NULL OR o.shop_id = p_shop_id)
+  GROUP BY 1, 2, 3;
+
+  INSERT INTO shop_item_sales (shop_id, menu_item_id, order_count, quantity, revenue)
+  SELECT s.shop_id, s.menu_item_id, SUM(s.order_count), SUM(s.quantity), SUM(s.revenue)
+  FROM shop_item_daily_sales s
+  WHERE p_shop_id IS NULL OR s.shop_id = p_shop_id
+  GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_shop_item_sales();
+
+REVOKE ALL ON FUNCTION apply_order_to_item_sales(orders, integer, uuid) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION refresh_shop_top_items(uuid, integer) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION get_shop_top_items(uuid, text, integer, integer) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION rebuild_shop_item_sales(uuid) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Shop top items migration completed successfully';
+END $$;
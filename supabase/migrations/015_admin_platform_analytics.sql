@@ -0,0 +1,177 @@
+-- Admin Platform Analytics: dashboard aggregates over daily rollups
+-- Migration: 015_admin_platform_analytics.sql
+
+-- =========================================
+-- 1. INDEXES
+-- =========================================
+
+-- Platform-wide windows over shop_daily_rollups (primary key leads with shop_id)
+CREATE INDEX IF NOT EXISTS idx_shop_daily_rollups_day
+  ON shop_daily_rollups(day);
+
+CREATE INDEX IF NOT EXISTS idx_shops_created_at_status
+  ON shops(created_at, status);
+
+-- =========================================
+-- 2. ANALYTICS FUNCTION
+-- =========================================
+
+-- Everything the admin dashboard and analytics overview need, as one JSON
+-- document. Order and revenue figures come from shop_daily_rollups
+-- (migration 013), never from orders. Windows are UTC days:
+--   current  = the last p_days days including today
+--   previous = the p_days days before that (for % change)
+CREATE OR REPLACE FUNCTION get_admin_platform_analytics(
+  p_days integer DEFAULT 30,
+  p_top_limit integer DEFAULT 10
+)
+RETURNS jsonb AS $$
+DECLARE
+  v_today date := (now() AT TIME ZONE 'UTC')::date;
+  v_start date;
+  v_prev_start date;
+  v_result jsonb;
+BEGIN
+  p_days := GREATEST(1, LEAST(p_days, 3660));
+  v_start := v_today - (p_days - 1);
+  v_prev_start := v_start - p_days;
+
+  WITH
+  all_time AS (
+    SELECT
+      COALESCE(SUM(r.revenue), 0) AS revenue,
+      COALESCE(SUM(r.orders), 0) AS orders,
+      COALESCE(SUM(r.completed_orders), 0) AS completed_orders
+    FROM shop_daily_rollups r
+  ),
+  windows AS (
+    SELECT
+      COALESCE(SUM(r.revenue) FILTER (WHERE r.day >= v_start), 0) AS revenue,
+      COALESCE(SUM(r.orders) FILTER (WHERE r.day >= v_start), 0) AS orders,
+      COALESCE(SUM(r.revenue) FILTER (WHERE r.day < v_start), 0) AS prev_revenue,
+      COALESCE(SUM(r.orders) FILTER (WHERE r.day < v_start), 0) AS prev_orders
+    FROM shop_daily_rollups r
+    WHERE r.day >= v_prev_start
+  ),
+  shop_counts AS (
+    SELECT
+      COUNT(*) AS total,
+      COUNT(*) FILTER (WHERE s.status = 'active') AS active,
+      COUNT(*) FILTER (WHERE s.status = 'pending') AS pending
+    FROM shops s
+  ),
+  user_counts AS (
+    SELECT
+      COUNT(*) AS total,
+      COUNT(*) FILTER (WHERE p.created_at >= v_start) AS current,
+      COUNT(*) FILTER (WHERE p.created_at >= v_prev_start AND p.created_at < v_start) AS previous
+    FROM profiles p
+  ),
+  days AS (
+    SELECT d::date AS day
+    FROM generate_series(v_start, v_today, interval '1 day') d
+  ),
+  daily AS (
+    SELECT
+      r.day,
+      SUM(r.revenue) AS revenue,
+      SUM(r.orders) AS orders,
+      SUM(r.completed_orders) AS completed_orders,
+      SUM(r.customers) AS customers,
+      SUM(r.items_sold) AS items_sold
+    FROM shop_daily_rollups r
+    WHERE r.day >= v_start
+    GROUP BY r.day
+  ),
+  user_signups AS (
+    SELECT (p.created_at AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS count
+    FROM profiles p
+    WHERE p.created_at >= v_start
+    GROUP BY 1
+  ),
+  shop_signups AS (
+    SELECT (s.created_at AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS count
+    FROM shops s
+    WHERE s.created_at >= v_start
+    GROUP BY 1
+  ),
+  top_shops AS (
+    SELECT
+      r.shop_id,
+      s.name,
+      SUM(r.revenue) AS revenue,
+      SUM(r.orders) AS orders
+    FROM shop_daily_rollups r
+    LEFT JOIN shops s ON s.id = r.shop_id
+    WHERE r.day >= v_start
+    GROUP BY r.shop_id, s.name
+    ORDER BY SUM(r.revenue) DESC
+    LIMIT p_top_limit
+  )
+  SELECT jsonb_build_object(
+    'generated_at', now(),
+    'days', p_days,
+    'start_date', v_start,
+    'end_date', v_today,
+    'all_time', (
+      SELECT jsonb_build_object(
+        'revenue', a.revenue,
+        'orders', a.orders,
+        'completed_orders', a.completed_orders,
+        'avg_order_value', CASE WHEN a.orders > 0 THEN ROUND(a.revenue / a.orders, 2) ELSE 0 END
+      )
+      FROM all_time a
+    ),
+    'window', (
+      SELECT jsonb_build_object(
+        'revenue', w.revenue,
+        'orders', w.orders,
+        'previous_revenue', w.prev_revenue,
+        'previous_orders', w.prev_orders
+      )
+      FROM windows w
+    ),
+    'shops', (SELECT to_jsonb(sc) FROM shop_counts sc),
+    'users', (SELECT to_jsonb(uc) FROM user_counts uc),
+    'daily', (
+      SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'date', d.day,
+        'revenue', COALESCE(dl.revenue, 0),
+        'orders', COALESCE(dl.orders, 0),
+        'completed_orders', COALESCE(dl.completed_orders, 0),
+        'customers', COALESCE(dl.customers, 0),
+        'items_sold', COALESCE(dl.items_sold, 0),
+        'new_users', COALESCE(us.count, 0),
+        'new_shops', COALESCE(ss.count, 0)
+      ) ORDER BY d.day), '[]'::jsonb)
+      FROM days d
+      LEFT JOIN daily dl ON dl.day = d.day
+      LEFT JOIN user_signups us ON us.day = d.day
+      LEFT JOIN shop_signups ss ON ss.day = d.day
+    ),
+    'top_shops', (
+      SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'shop_id', t.shop_id,
+        'name', t.name,
+        'revenue', t.revenue,
+        'orders', t.orders
+      ) ORDER BY t.revenue DESC), '[]'::jsonb)
+      FROM top_shops t
+    )
+  )
+  INTO v_result;
+
+  RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+REVOKE ALL ON FUNCTION get_admin_platform_analytics(integer, integer) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Admin platform analytics migration completed successfully';
+END $$;
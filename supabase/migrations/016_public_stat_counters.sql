@@ -0,0 +1,150 @@
+-- Public Stat Counters: trigger-maintained homepage counters
+-- Migration: 016_public_stat_counters.sql
+
+-- =========================================
+-- 1. COUNTER TABLE
+-- =========================================
+
+-- Counters behind GET /api/v1/shops/stats/public:
+--   shops  = shops with status 'active'
+--   orders = orders whose status is not 'cancelled'
+--   users  = profiles with status 'active'
+-- Each counter is spread over 16 slot rows and triggers add their delta to
+-- a random slot, so concurrent order inserts do not all queue on one row
+-- lock. Reading a counter sums at most 16 rows.
+CREATE TABLE IF NOT EXISTS public_stat_counters (
+  name text NOT NULL,
+  slot smallint NOT NULL,
+  value bigint NOT NULL DEFAULT 0,
+  PRIMARY KEY (name, slot)
+);
+
+ALTER TABLE public_stat_counters ENABLE ROW LEVEL SECURITY;
+REVOKE ALL PRIVILEGES ON TABLE public_stat_counters FROM anon, authenticated;
+
+-- =========================================
+-- 2. INCREMENTAL MAINTENANCE
+-- =========================================
+
+CREATE OR REPLACE FUNCTION public_stat_counts(p_name text, p_status text)
+RETURNS boolean AS $$
+  SELECT COALESCE(CASE p_name
+    WHEN 'shops' THEN p_status = 'active'
+    WHEN 'orders' THEN p_status <> 'cancelled'
+    WHEN 'users' THEN p_status = 'active'
+  END, false);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- TG_ARGV[0] is the counter name; every counted table has a status column
+CREATE OR REPLACE FUNCTION public_stat_counter_trigger()
+RETURNS trigger AS $$
+DECLARE
+  v_name text := TG_ARGV[0];
+  v_delta integer := 0;
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') AND public_stat_counts(v_name, OLD.status) THEN
+    v_delta := v_delta - 1;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND public_stat_counts(v_name, NEW.status) THEN
+    v_delta := v_delta + 1;
+  END IF;
+
+  IF v_delta <> 0 THEN
+    INSERT INTO public_stat_counters (name, slot, value)
+    VALUES (v_name, floor(random() * 16)::smallint, v_delta)
+    ON CONFLICT (name, slot) DO UPDATE
+    SET value = public_stat_counters.value + EXCLUDED.value;
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS shops_public_stat_insert_delete ON shops;
+CREATE TRIGGER shops_public_stat_insert_delete
+  AFTER INSERT OR DELETE ON shops
+  FOR EACH ROW EXECUTE FUNCTION public_stat_counter_trigger('shops');
+
+DROP TRIGGER IF EXISTS shops_public_stat_update ON shops;
+CREATE TRIGGER shops_public_stat_update
+  AFTER UPDATE OF status ON shops
+  FOR EACH ROW
+  WHEN (OLD.status IS DISTINCT FROM NEW.status)
+  EXECUTE FUNCTION public_stat_counter_trigger('shops');
+
+DROP TRIGGER IF EXISTS orders_public_stat_insert_delete ON orders;
+CREATE TRIGGER orders_public_stat_insert_delete
+  AFTER INSERT OR DELETE ON orders
+  FOR EACH ROW EXECUTE FUNCTION public_stat_counter_trigger('orders');
+
+DROP TRIGGER IF EXISTS orders_public_stat_update ON orders;
+CREATE TRIGGER orders_public_stat_update
+  AFTER UPDATE OF status ON orders
+  FOR EACH ROW
+  WHEN (OLD.status IS DISTINCT FROM NEW.status)
+  EXECUTE FUNCTION public_stat_counter_trigger('orders');
+
+DROP TRIGGER IF EXISTS profiles_public_stat_insert_delete ON profiles;
+CREATE TRIGGER profiles_public_stat_insert_delete
+  AFTER INSERT OR DELETE ON profiles
+  FOR EACH ROW EXECUTE FUNCTION public_stat_counter_trigger('users');
+
+DROP TRIGGER IF EXISTS profiles_public_stat_update ON profiles;
+CREATE TRIGGER profiles_public_stat_update
+  AFTER UPDATE OF status ON profiles
+  FOR EACH ROW
+  WHEN (OLD.status IS DISTINCT FROM NEW.status)
+  EXECUTE FUNCTION public_stat_counter_trigger('users');
+
+-- =========================================
+-- 3. READ / RECONCILE
+-- =========================================
+
+CREATE OR REPLACE FUNCTION get_public_stat_counters()
+RETURNS jsonb AS $$
+  SELECT jsonb_build_object(
+    'shops', COALESCE(SUM(value) FILTER (WHERE name = 'shops'), 0),
+    'orders', COALESCE(SUM(value) FILTER (WHERE name = 'orders'), 0),
+    'users', COALESCE(SUM(value) FILTER (WHERE name = 'users'), 0)
+  )
+  FROM public_stat_counters;
+$$ LANGUAGE sql STABLE;
+
+-- Replace the counters with exact counts (backfill, or repair after manual
+-- edits with triggers disabled). The EXCLUSIVE lock waits for writers that
+-- already added a delta to commit and holds back new ones until the counts
+-- are taken, so no delta is lost or applied twice. Scans all three tables:
+-- run it rarely, never per request.
+CREATE OR REPLACE FUNCTION reconcile_public_stat_counters()
+RETURNS jsonb AS $$
+BEGIN
+  LOCK TABLE public_stat_counters IN EXCLUSIVE MODE;
+
+  DELETE FROM public_stat_counters;
+
+  INSERT INTO public_stat_counters (name, slot, value)
+  SELECT 'shops', 0, COUNT(*) FROM shops WHERE public_stat_counts('shops', status)
+  UNION ALL
+  SELECT 'orders', 0, COUNT(*) FROM orders WHERE public_stat_counts('orders', status)
+  UNION ALL
+  SELECT 'users', 0, COUNT(*) FROM profiles WHERE public_stat_counts('users', status);
+
+  RETURN get_public_stat_counters();
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE ALL ON FUNCTION public_stat_counter_trigger() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION get_public_stat_counters() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION reconcile_public_stat_counters() FROM PUBLIC, anon, authenticated;
+
+-- Backfill
+SELECT reconcile_public_stat_counters();
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Public stat counters migration completed successfully';
+END $$;
@@ -0,0 +1,63 @@
+-- Shop Reviews Page: reviews, authors and rating in one call
+-- Migration: 017_shop_reviews_page.sql
+
+-- =========================================
+-- 1. INDEXES
+-- =========================================
+
+-- Newest-first page per shop without a sort step
+CREATE INDEX IF NOT EXISTS idx_shop_reviews_shop_created
+  ON shop_reviews(shop_id, created_at DESC, id DESC);
+
+-- =========================================
+-- 2. PAGE FUNCTION
+-- =========================================
+
+-- One page of a shop's reviews with each author's profile, plus the
+-- trigger-maintained shops.average_rating / review_count (migration 005),
+-- as one JSON document for GET /api/v1/shops/{shop_id}/reviews.
+CREATE OR REPLACE FUNCTION get_shop_reviews_page(
+  p_shop_id uuid,
+  p_limit integer DEFAULT 20,
+  p_offset integer DEFAULT 0
+)
+RETURNS jsonb AS $$
+  SELECT jsonb_build_object(
+    'reviews', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'id', r.id,
+        'rating', r.rating,
+        'body', r.comment,
+        'created_at', r.created_at,
+        'user_id', r.user_id,
+        'reviewer', jsonb_build_object(
+          'full_name', p.full_name,
+          'avatar_url', p.avatar_url
+        )
+      ) ORDER BY r.created_at DESC, r.id DESC)
+      FROM (
+        SELECT *
+        FROM shop_reviews sr
+        WHERE sr.shop_id = p_shop_id
+        ORDER BY sr.created_at DESC, sr.id DESC
+        LIMIT p_limit OFFSET p_offset
+      ) r
+      LEFT JOIN profiles p ON p.id = r.user_id
+    ), '[]'::jsonb),
+    'review_count', COALESCE(s.review_count, 0),
+    'avg_rating', s.average_rating
+  )
+  FROM (SELECT p_shop_id AS id) target
+  LEFT JOIN shops s ON s.id = target.id;
+$$ LANGUAGE sql STABLE;
+
+REVOKE ALL ON FUNCTION get_shop_reviews_page(uuid, integer, integer) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Shop reviews page migration completed successfully';
+END $$;
@@ -0,0 +1,101 @@
+-- Point Release Upsert: race-free balance rows for release_due_points
+-- Migration: 018_release_due_points_upsert.sql
+
+-- =========================================
+-- 1. RELEASE FUNCTION
+-- =========================================
+
+-- Redefines release_due_points from 010. Missing customer_shop_points rows
+-- were created with INSERT ... WHERE NOT EXISTS, so two releases for a new
+-- (customer, shop) pair could both pass the check and one would abort its
+-- whole batch on the unique index added in 011. Balances are now applied
+-- with INSERT ... ON CONFLICT, like increment_points_balance.
+
+-- Release every pending earned transaction whose available_at has passed:
+--   1. claim due rows (SKIP LOCKED, so concurrent callers split the work)
+--   2. upsert per (customer, shop) deltas into customer_shop_points
+--   3. mark rows available with a running balance_after
+CREATE OR REPLACE FUNCTION release_due_points(
+  p_now timestamptz DEFAULT now(),
+  p_customer_id uuid DEFAULT NULL,
+  p_shop_id uuid DEFAULT NULL,
+  p_limit integer DEFAULT 1000
+)
+RETURNS TABLE (released_transactions integer, released_points integer) AS $$
+DECLARE
+  v_ids uuid[];
+  v_points integer;
+BEGIN
+  SELECT array_agg(c.id), COALESCE(SUM(c.amount), 0)::integer
+  INTO v_ids, v_points
+  FROM (
+    SELECT t.id, t.amount
+    FROM points_transactions t
+    WHERE t.status = 'pending'
+      AND t.type = 'earned'
+      AND t.points_type = 'shop'
+      AND t.amount > 0
+      AND t.available_at <= p_now
+      AND (p_customer_id IS NULL OR t.customer_id = p_customer_id)
+      AND (p_shop_id IS NULL OR t.shop_id = p_shop_id)
+    ORDER BY t.available_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ) c;
+
+  IF v_ids IS NULL THEN
+    RETURN QUERY SELECT 0, 0;
+    RETURN;
+  END IF;
+
+  -- One upsert per (customer, shop): concurrent releases for a new pair
+  -- both land on the unique index from 011 instead of one failing it
+  INSERT INTO customer_shop_points AS csp (
+    customer_id, shop_id, total_earned, total_spent, current_balance, pending_balance, updated_at
+  )
+  SELECT t.customer_id, t.shop_id, SUM(t.amount)::integer, 0, SUM(t.amount)::integer, 0, p_now
+  FROM points_transactions t
+  WHERE t.id = ANY(v_ids)
+  GROUP BY t.customer_id, t.shop_id
+  ON CONFLICT (customer_id, shop_id) DO UPDATE
+  SET
+    current_balance = csp.current_balance + EXCLUDED.current_balance,
+    pending_balance = GREATEST(0, csp.pending_balance - EXCLUDED.current_balance),
+    updated_at = EXCLUDED.updated_at;
+
+  UPDATE points_transactions t
+  SET
+    status = 'available',
+    balance_after = csp.current_balance - r.group_points + r.running_points,
+    metadata = COALESCE(t.metadata, '{}'::jsonb) || jsonb_build_object('released_at', p_now)
+  FROM (
+    SELECT
+      t2.id,
+      t2.customer_id,
+      t2.shop_id,
+      SUM(t2.amount) OVER (
+        PARTITION BY t2.customer_id, t2.shop_id
+        ORDER BY t2.available_at, t2.created_at, t2.id
+      ) AS running_points,
+      SUM(t2.amount) OVER (PARTITION BY t2.customer_id, t2.shop_id) AS group_points
+    FROM points_transactions t2
+    WHERE t2.id = ANY(v_ids)
+  ) r
+  JOIN customer_shop_points csp
+    ON csp.customer_id = r.customer_id AND csp.shop_id = r.shop_id
+  WHERE t.id = r.id;
+
+  RETURN QUERY SELECT array_length(v_ids, 1), v_points;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE ALL ON FUNCTION release_due_points(timestamptz, uuid, uuid, integer) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Point release upsert migration completed successfully';
+END $$;
@@ -0,0 +1,94 @@
+-- Rollup Fixes: order deletes and today's dashboard figures
+-- Migration: 019_rollup_order_deletes.sql
+
+-- =========================================
+-- 1. ORDER DELETES
+-- =========================================
+
+-- Deleting an order cascades to its order_items before the AFTER DELETE
+-- row trigger on orders runs, so apply_order_to_rollups(OLD, -1) found no
+-- items: items_sold and the item sales rollups (014) were never
+-- decremented. The item-level trigger cannot do it either, because the
+-- parent order is already gone when the cascade fires it.
+-- Remove the order's contribution BEFORE the delete, while its items are
+-- still there; the cascaded item deletes then find no parent and skip.
+CREATE OR REPLACE FUNCTION orders_rollup_delete_trigger()
+RETURNS trigger AS $$
+BEGIN
+  PERFORM apply_order_to_rollups(OLD, -1);
+  PERFORM apply_order_to_item_sales(OLD, -1);
+  RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS orders_rollup_insert_delete ON orders;
+
+DROP TRIGGER IF EXISTS orders_rollup_insert ON orders;
+CREATE TRIGGER orders_rollup_insert
+  AFTER INSERT ON orders
+  FOR EACH ROW EXECUTE FUNCTION orders_rollup_trigger();
+
+DROP TRIGGER IF EXISTS orders_rollup_delete ON orders;
+CREATE TRIGGER orders_rollup_delete
+  BEFORE DELETE ON orders
+  FOR EACH ROW EXECUTE FUNCTION orders_rollup_delete_trigger();
+
+-- Repair rollups that missed earlier order deletes
+SELECT rebuild_shop_daily_rollups();
+SELECT rebuild_shop_item_sales();
+
+-- =========================================
+-- 2. DASHBOARD SUMMARY
+-- =========================================
+
+-- Totals still come from the rollups. orders_today / revenue_today keep
+-- their original meaning from migration 012: every order created since
+-- p_day_start, whatever its status (the rollups only hold placed orders).
+-- That is a one-day range on idx_orders_shop_created_total, an index-only
+-- scan over a single shop-day.
+CREATE OR REPLACE FUNCTION get_shop_analytics_summary(
+  p_shop_id uuid,
+  p_day_start timestamptz DEFAULT date_trunc('day', now())
+)
+RETURNS TABLE (
+  total_orders bigint,
+  total_revenue numeric,
+  avg_order_value numeric,
+  orders_today bigint,
+  revenue_today numeric
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    totals.orders,
+    totals.revenue,
+    CASE WHEN totals.orders > 0 THEN totals.revenue / totals.orders ELSE 0 END,
+    today.orders,
+    today.revenue
+  FROM (
+    SELECT
+      COALESCE(SUM(r.completed_orders), 0)::bigint AS orders,
+      COALESCE(SUM(r.completed_revenue), 0) AS revenue
+    FROM shop_daily_rollups r
+    WHERE r.shop_id = p_shop_id
+  ) totals
+  CROSS JOIN (
+    SELECT COUNT(*) AS orders, COALESCE(SUM(o.total), 0) AS revenue
+    FROM orders o
+    WHERE o.shop_id = p_shop_id
+      AND o.created_at >= p_day_start
+  ) today;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+REVOKE ALL ON FUNCTION orders_rollup_delete_trigger() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION get_shop_analytics_summary(uuid, timestamptz) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Rollup order delete migration completed successfully';
+END $$;
@@ -0,0 +1,275 @@
+-- Admin Platform Analytics: counter-backed totals
+-- Migration: 020_admin_analytics_counters.sql
+
+-- =========================================
+-- 1. ADMIN COUNTERS
+-- =========================================
+
+-- get_admin_platform_analytics (015) counted every shop and profile on
+-- each call. The admin dashboard totals now come from the slotted
+-- public_stat_counters (016), alongside the public ones:
+--   shops_total   = every shop
+--   shops_pending = shops with status 'pending'
+--   users_total   = every profile
+-- (shops_active is the existing 'shops' counter.)
+CREATE OR REPLACE FUNCTION public_stat_counts(p_name text, p_status text)
+RETURNS boolean AS $$
+  SELECT COALESCE(CASE p_name
+    WHEN 'shops' THEN p_status = 'active'
+    WHEN 'orders' THEN p_status <> 'cancelled'
+    WHEN 'users' THEN p_status = 'active'
+    WHEN 'shops_total' THEN true
+    WHEN 'shops_pending' THEN p_status = 'pending'
+    WHEN 'users_total' THEN true
+  END, false);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Every TG_ARGV entry is a counter name, so one trigger maintains all the
+-- counters of its table
+CREATE OR REPLACE FUNCTION public_stat_counter_trigger()
+RETURNS trigger AS $$
+DECLARE
+  v_name text;
+  v_delta integer;
+BEGIN
+  FOREACH v_name IN ARRAY TG_ARGV LOOP
+    v_delta := 0;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND public_stat_counts(v_name, OLD.status) THEN
+      v_delta := v_delta - 1;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND public_stat_counts(v_name, NEW.status) THEN
+      v_delta := v_delta + 1;
+    END IF;
+
+    IF v_delta <> 0 THEN
+      INSERT INTO public_stat_counters (name, slot, value)
+      VALUES (v_name, floor(random() * 16)::smallint, v_delta)
+      ON CONFLICT (name, slot) DO UPDATE
+      SET value = public_stat_counters.value + EXCLUDED.value;
+    END IF;
+  END LOOP;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS shops_public_stat_insert_delete ON shops;
+CREATE TRIGGER shops_public_stat_insert_delete
+  AFTER INSERT OR DELETE ON shops
+  FOR EACH ROW EXECUTE FUNCTION public_stat_counter_trigger('shops', 'shops_total', 'shops_pending');
+
+DROP TRIGGER IF EXISTS shops_public_stat_update ON shops;
+CREATE TRIGGER shops_public_stat_update
+  AFTER UPDATE OF status ON shops
+  FOR EACH ROW
+  WHEN (OLD.status IS DISTINCT FROM NEW.status)
+  EXECUTE FUNCTION public_stat_counter_trigger('shops', 'shops_pending');
+
+DROP TRIGGER IF EXISTS profiles_public_stat_insert_delete ON profiles;
+CREATE TRIGGER profiles_public_stat_insert_delete
+  AFTER INSERT OR DELETE ON profiles
+  FOR EACH ROW EXECUTE FUNCTION public_stat_counter_trigger('users', 'users_total');
+
+CREATE OR REPLACE FUNCTION reconcile_public_stat_counters()
+RETURNS jsonb AS $$
+BEGIN
+  LOCK TABLE public_stat_counters IN EXCLUSIVE MODE;
+
+  DELETE FROM public_stat_counters;
+
+  INSERT INTO public_stat_counters (name, slot, value)
+  SELECT 'shops', 0, COUNT(*) FROM shops WHERE public_stat_counts('shops', status)
+  UNION ALL
+  SELECT 'orders', 0, COUNT(*) FROM orders WHERE public_stat_counts('orders', status)
+  UNION ALL
+  SELECT 'users', 0, COUNT(*) FROM profiles WHERE public_stat_counts('users', status)
+  UNION ALL
+  SELECT 'shops_total', 0, COUNT(*) FROM shops
+  UNION ALL
+  SELECT 'shops_pending', 0, COUNT(*) FROM shops WHERE public_stat_counts('shops_pending', status)
+  UNION ALL
+  SELECT 'users_total', 0, COUNT(*) FROM profiles;
+
+  RETURN get_public_stat_counters();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill the new counters
+SELECT reconcile_public_stat_counters();
+
+-- =========================================
+-- 2. ANALYTICS FUNCTION
+-- =========================================
+
+-- Same document as 015, except:
+--   - shop/user totals are read from public_stat_counters
+--   - new-user counts for the current and previous windows are ranges on
+--     idx_profiles_created_at rather than filters over every profile
+--   - every created_at bound is the UTC midnight of its window day,
+--     matching the (created_at AT TIME ZONE 'UTC')::date buckets
+CREATE OR REPLACE FUNCTION get_admin_platform_analytics(
+  p_days integer DEFAULT 30,
+  p_top_limit integer DEFAULT 10
+)
+RETURNS jsonb AS $$
+DECLARE
+  v_today date := (now() AT TIME ZONE 'UTC')::date;
+  v_start date;
+  v_prev_start date;
+  v_start_at timestamptz;
+  v_prev_start_at timestamptz;
+  v_result jsonb;
+BEGIN
+  p_days := GREATEST(1, LEAST(p_days, 3660));
+  v_start := v_today - (p_days - 1);
+  v_prev_start := v_start - p_days;
+  v_start_at := v_start::timestamp AT TIME ZONE 'UTC';
+  v_prev_start_at := v_prev_start::timestamp AT TIME ZONE 'UTC';
+
+  WITH
+  all_time AS (
+    SELECT
+      COALESCE(SUM(r.revenue), 0) AS revenue,
+      COALESCE(SUM(r.orders), 0) AS orders,
+      COALESCE(SUM(r.completed_orders), 0) AS completed_orders
+    FROM shop_daily_rollups r
+  ),
+  windows AS (
+    SELECT
+      COALESCE(SUM(r.revenue) FILTER (WHERE r.day >= v_start), 0) AS revenue,
+      COALESCE(SUM(r.orders) FILTER (WHERE r.day >= v_start), 0) AS orders,
+      COALESCE(SUM(r.revenue) FILTER (WHERE r.day < v_start), 0) AS prev_revenue,
+      COALESCE(SUM(r.orders) FILTER (WHERE r.day < v_start), 0) AS prev_orders
+    FROM shop_daily_rollups r
+    WHERE r.day >= v_prev_start
+  ),
+  counters AS (
+    SELECT name, SUM(value) AS value
+    FROM public_stat_counters
+    WHERE name IN ('shops', 'shops_total', 'shops_pending', 'users_total')
+    GROUP BY name
+  ),
+  shop_counts AS (
+    SELECT
+      COALESCE(SUM(c.value) FILTER (WHERE c.name = 'shops_total'), 0) AS total,
+      COALESCE(SUM(c.value) FILTER (WHERE c.name = 'shops'), 0) AS active,
+      COALESCE(SUM(c.value) FILTER (WHERE c.name = 'shops_pending'), 0) AS pending
+    FROM counters c
+  ),
+  user_counts AS (
+    SELECT
+      COALESCE((SELECT c.value FROM counters c WHERE c.name = 'users_total'), 0) AS total,
+      (SELECT COUNT(*) FROM profiles p WHERE p.created_at >= v_start_at) AS current,
+      (SELECT COUNT(*) FROM profiles p
+        WHERE p.created_at >= v_prev_start_at AND p.created_at < v_start_at) AS previous
+  ),
+  days AS (
+    SELECT d::date AS day
+    FROM generate_series(v_start, v_today, interval '1 day') d
+  ),
+  daily AS (
+    SELECT
+      r.day,
+      SUM(r.revenue) AS revenue,
+      SUM(r.orders) AS orders,
+      SUM(r.completed_orders) AS completed_orders,
+      SUM(r.customers) AS customers,
+      SUM(r.items_sold) AS items_sold
+    FROM shop_daily_rollups r
+    WHERE r.day >= v_start
+    GROUP BY r.day
+  ),
+  user_signups AS (
+    SELECT (p.created_at AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS count
+    FROM profiles p
+    WHERE p.created_at >= v_start_at
+    GROUP BY 1
+  ),
+  shop_signups AS (
+    SELECT (s.created_at AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS count
+    FROM shops s
+    WHERE s.created_at >= v_start_at
+    GROUP BY 1
+  ),
+  top_shops AS (
+    SELECT
+      r.shop_id,
+      s.name,
+      SUM(r.revenue) AS revenue,
+      SUM(r.orders) AS orders
+    FROM shop_daily_rollups r
+    LEFT JOIN shops s ON s.id = r.shop_id
+    WHERE r.day >= v_start
+    GROUP BY r.shop_id, s.name
+    ORDER BY SUM(r.revenue) DESC
+    LIMIT p_top_limit
+  )
+  SELECT jsonb_build_object(
+    'generated_at', now(),
+    'days', p_days,
+    'start_date', v_start,
+    'end_date', v_today,
+    'all_time', (
+      SELECT jsonb_build_object(
+        'revenue', a.revenue,
+        'orders', a.orders,
+        'completed_orders', a.completed_orders,
+        'avg_order_value', CASE WHEN a.orders > 0 THEN ROUND(a.revenue / a.orders, 2) ELSE 0 END
+      )
+      FROM all_time a
+    ),
+    'window', (
+      SELECT jsonb_build_object(
+        'revenue', w.revenue,
+        'orders', w.orders,
+        'previous_revenue', w.prev_revenue,
+        'previous_orders', w.prev_orders
+      )
+      FROM windows w
+    ),
+    'shops', (SELECT to_jsonb(sc) FROM shop_counts sc),
+    'users', (SELECT to_jsonb(uc) FROM user_counts uc),
+    'daily', (
+      SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'date', d.day,
+        'revenue', COALESCE(dl.revenue, 0),
+        'orders', COALESCE(dl.orders, 0),
+        'completed_orders', COALESCE(dl.completed_orders, 0),
+        'customers', COALESCE(dl.customers, 0),
+        'items_sold', COALESCE(dl.items_sold, 0),
+        'new_users', COALESCE(us.count, 0),
+        'new_shops', COALESCE(ss.count, 0)
+      ) ORDER BY d.day), '[]'::jsonb)
+      FROM days d
+      LEFT JOIN daily dl ON dl.day = d.day
+      LEFT JOIN user_signups us ON us.day = d.day
+      LEFT JOIN shop_signups ss ON ss.day = d.day
+    ),
+    'top_shops', (
+      SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'shop_id', t.shop_id,
+        'name', t.name,
+        'revenue', t.revenue,
+        'orders', t.orders
+      ) ORDER BY t.revenue DESC), '[]'::jsonb)
+      FROM top_shops t
+    )
+  )
+  INTO v_result;
+
+  RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+REVOKE ALL ON FUNCTION public_stat_counter_trigger() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION reconcile_public_stat_counters() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION get_admin_platform_analytics(integer, integer) FROM PUBLIC, anon, authenticated;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Admin analytics counters migration completed successfully';
+END $$;
@@ -0,0 +1,51 @@
+-- Legacy Reviews: copy reviews into shop_reviews
+-- Migration: 021_copy_legacy_reviews.sql
+
+-- =========================================
+-- 1. COPY
+-- =========================================
+
+-- The API used to write to a `reviews` table (text column `body`) when it
+-- existed, falling back to shop_reviews. Reviews are now read and written
+-- through shop_reviews only (and get_shop_reviews_page, migration 017), so
+-- copy any legacy rows across, keeping their ids so clients can still update
+-- or delete them. `reviews` is not created by these migrations, hence the
+-- to_regclass guard; it is left in place, no longer read.
+--   - rows whose shop or author no longer exists are skipped
+--   - order_id is kept only while the order still exists (the shop_reviews
+--     foreign key is ON DELETE SET NULL)
+--   - ON CONFLICT DO NOTHING skips orders already reviewed in shop_reviews
+--     (UNIQUE(user_id, order_id)) and ids already copied, so a re-run is a
+--     no-op
+DO $$
+DECLARE
+  v_copied integer;
+BEGIN
+  IF to_regclass('public.reviews') IS NULL THEN
+    RAISE NOTICE 'No legacy reviews table, nothing to copy';
+    RETURN;
+  END IF;
+
+  EXECUTE $copy$
+    INSERT INTO shop_reviews (id, shop_id, user_id, order_id, rating, comment, created_at)
+    SELECT r.id, r.shop_id, r.user_id, o.id, r.rating, r.body, COALESCE(r.created_at, now())
+    FROM public.reviews r
+    JOIN shops s ON s.id = r.shop_id
+    JOIN profiles p ON p.id = r.user_id
+    LEFT JOIN orders o ON o.id = r.order_id
+    WHERE r.rating BETWEEN 1 AND 5
+    ON CONFLICT DO NOTHING
+  $copy$;
+
+  GET DIAGNOSTICS v_copied = ROW_COUNT;
+  RAISE NOTICE 'Copied % legacy reviews into shop_reviews', v_copied;
+END $$;
+
+-- =========================================
+-- COMPLETION
+-- =========================================
+
+DO $$
+BEGIN
+  RAISE NOTICE 'Legacy reviews migration completed successfully';
+END $$;